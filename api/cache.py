@@ -0,0 +1,185 @@
+# api/cache.py
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from metrics import observe_serialization
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# "memory" (per process), "file" (shared by all API processes on the host) or "off"
+API_CACHE_BACKEND = os.getenv("API_CACHE_BACKEND", "memory")
+API_CACHE_TTL_SECONDS = float(os.getenv("API_CACHE_TTL_SECONDS", "300"))
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", "512"))
+API_CACHE_DIR = os.getenv("API_CACHE_DIR", os.path.join(tempfile.gettempdir(), "telegram_api_cache"))
+
+# Written by the dbt_models Dagster asset after every successful build; part of every cache key
+DATA_VERSION_FILE = os.getenv(
+    "DATA_VERSION_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "state", "data_version.json")
+)
+
+
+class MemoryCache:
+    """Thread-safe LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_entries=API_CACHE_MAX_ENTRIES, ttl=API_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class FileCache:
+    """
+    Cache stored as one JSON file per entry in a local directory, so several API worker
+    processes share hits. Entries are written atomically; least recently written files are
+    pruned beyond `max_entries`.
+    """
+
+    def __init__(self, directory=API_CACHE_DIR, max_entries=API_CACHE_MAX_ENTRIES, ttl=API_CACHE_TTL_SECONDS):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires_at"] < time.time():
+            return None
+        return entry["body"].encode("utf-8"), entry["etag"]
+
+    def set(self, key, value):
+        body, etag = value
+        entry = {"expires_at": time.time() + self.ttl, "etag": etag, "body": body.decode("utf-8")}
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+            self._prune()
+        except OSError as e:
+            logging.warning(f"Could not write API cache entry: {e}")
+
+    def _prune(self):
+        with os.scandir(self.directory) as it:
+            files = [entry for entry in it if entry.name.endswith(".json")]
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _create_cache():
+    if API_CACHE_BACKEND == "file":
+        return FileCache()
+    if API_CACHE_BACKEND == "memory":
+        return MemoryCache()
+    return None
+
+
+response_cache = _create_cache()
+
+_version_lock = threading.Lock()
+_version_state = {"mtime_ns": None, "version": "0", "last_modified": None}
+
+
+def current_data_version():
+    """
+    Returns (data version, time of the build that produced it) from DATA_VERSION_FILE.
+    The file is re-read only when its mtime changes. Without the file the version is "0".
+    """
+    try:
+        stat = os.stat(DATA_VERSION_FILE)
+    except OSError:
+        return "0", None
+    with _version_lock:
+        if stat.st_mtime_ns != _version_state["mtime_ns"]:
+            try:
+                with open(DATA_VERSION_FILE, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                version = str(data["version"])
+                last_modified = datetime.fromisoformat(data["updated_at"])
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Unreadable data version file {DATA_VERSION_FILE}: {e}")
+                version = str(stat.st_mtime_ns)
+                last_modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+            _version_state.update(mtime_ns=stat.st_mtime_ns, version=version, last_modified=last_modified)
+        return _version_state["version"], _version_state["last_modified"]
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def cached_response(request: Request, compute):
+    """
+    Serves a JSON response for `request` from the cache, calling `compute()` (which returns the
+    response model) only on a miss. Keys combine the data version, path and query parameters,
+    so a dbt build invalidates everything. Sends ETag/Last-Modified and answers a matching
+    If-None-Match with 304 Not Modified.
+    """
+    version, last_modified = current_data_version()
+    key_source = json.dumps([version, request.url.path, sorted(request.query_params.multi_items())])
+    key = hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+    cached = response_cache.get(key) if response_cache is not None else None
+    if cached is None:
+        result = compute()
+        started = time.perf_counter()
+        body = json.dumps(jsonable_encoder(result), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        observe_serialization(time.perf_counter() - started)
+        cached = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        if response_cache is not None:
+            response_cache.set(key, cached)
+    body, etag = cached
+
+    # no-cache: clients may keep the body but must revalidate, which costs them a 304 at most
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,44 +1,47 @@
 # my_project/crud.py
 
-from typing import List, Dict, Any
+import json
+import base64
+from datetime import date, datetime
+from typing import List, Dict, Iterator, Optional, Tuple
 import psycopg2
 from psycopg2 import sql
-from schemas import ProductMention, ChannelActivity, MessageSearchResult
+from schemas import (
+    ProductMention, ProductMentionSummary, ChannelActivity, MessageSearchResult, ImageDetection, DetectionClassCount
+)
+from metrics import timed_crud
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def get_top_products(db_conn: psycopg2.extensions.connection, limit: int = 10) -> List[ProductMention]:
+@timed_crud
+def get_top_products(db_conn: psycopg2.extensions.connection, limit: int = 10, start_date: Optional[date] = None,
+                     end_date: Optional[date] = None, channel_name: Optional[str] = None) -> List[ProductMention]:
     """
-    Retrieves the top N most frequently mentioned products from fct_messages.
-    This assumes you have a way to extract product names from message_text,
-    or a separate dim_products table linked to fct_messages.
-    For simplicity, we'll extract common words as "products" for now.
-    A more robust solution would involve NLP or a dedicated product dimension.
+    Retrieves the top N most frequently mentioned products (words, excluding stop words).
+    Reads the precomputed per-channel, per-day counts in agg_channel_daily_terms, optionally
+    limited to a posting-date range (inclusive) and one channel (exact name), so no message text
+    is tokenized here.
     """
     cursor = db_conn.cursor()
     try:
-        # This query is a placeholder. You'll need to define what constitutes a "product"
-        # and how to count mentions from your fct_messages table.
-        # For demonstration, let's count occurrences of words, excluding common ones.
         query = sql.SQL("""
             SELECT
-                word AS product_name,
-                COUNT(*) AS mention_count
-            FROM (
-                SELECT
-                    UNNEST(STRING_TO_ARRAY(LOWER(message_text), ' ')) AS word
-                FROM raw.fct_messages
-                WHERE message_text IS NOT NULL AND message_text != ''
-            ) AS words
-            WHERE word NOT IN ('the', 'a', 'an', 'and', 'or', 'in', 'on', 'at', 'for', 'to', 'is', 'it', 'with', 'from', 'this', 'that', 'we', 'you', 'i', 'of', 'be', 'are', 'was', 'were', 'has', 'have', 'had', 'do', 'does', 'did', 'not', 'but', 'so', 'if', 'then', 'else', 'when', 'where', 'how', 'what', 'why', 'who', 'which', 'can', 'will', 'would', 'should', 'could', 'get', 'go', 'come', 'take', 'make', 'give', 'see', 'find', 'know', 'say', 'tell', 'ask', 'show', 'try', 'call', 'mean', 'become', 'leave', 'put', 'begin', 'seem', 'help', 'talk', 'turn', 'start', 'run', 'move', 'like', 'want', 'need', 'feel', 'think', 'believe', 'hope', 'wish', 'expect', 'remember', 'understand', 'consider', 'allow', 'let', 'decide', 'happen', 'provide', 'bring', 'send', 'receive', 'return', 'change', 'follow', 'stop', 'open', 'close', 'read', 'write', 'play', 'watch', 'listen', 'look', 'hear', 'meet', 'join', 'build', 'create', 'develop', 'design', 'manage', 'control', 'improve', 'increase', 'decrease', 'reduce', 'add', 'remove', 'use', 'find', 'get', 'give', 'keep', 'let', 'make', 'put', 'seem', 'take', 'tell', 'think', 'try', 'turn', 'understand', 'want', 'work', 'would', 'write', 'go', 'come', 'say', 'see', 'know', 'look', 'find', 'give', 'tell', 'ask', 'show', 'try', 'call', 'mean', 'become', 'leave', 'put', 'begin', 'seem', 'help', 'talk', 'turn', 'start', 'run', 'move', 'like', 'want', 'need', 'feel', 'think', 'believe', 'hope', 'wish', 'expect', 'remember', 'understand', 'consider', 'allow', 'let', 'decide', 'happen', 'provide', 'bring', 'send', 'receive', 'return', 'change', 'follow', 'stop', 'open', 'close', 'read', 'write', 'play', 'watch', 'listen', 'look', 'hear', 'meet', 'join', 'build', 'create', 'develop', 'design', 'manage', 'control', 'improve', 'increase', 'decrease', 'reduce', 'add', 'remove', 'use', 'find', 'get', 'give', 'keep', 'let', 'make', 'put', 'seem', 'take', 'tell', 'think', 'try', 'turn', 'understand', 'want', 'work', 'would', 'write')
-                AND LENGTH(word) > 2 
+                t.term AS product_name,
+                SUM(t.mention_count)::BIGINT AS mention_count
+            FROM raw.agg_channel_daily_terms t
+            WHERE (%(start_date)s::date IS NULL OR t.message_date >= %(start_date)s::date)
+              AND (%(end_date)s::date IS NULL OR t.message_date <= %(end_date)s::date)
+              AND (%(channel_name)s::text IS NULL OR t.channel_id = (
+                  SELECT dc.channel_id FROM raw.dim_channels dc WHERE dc.channel_name = %(channel_name)s
+              ))
             GROUP BY 1
-            ORDER BY mention_count DESC
-            LIMIT %s;
+            ORDER BY mention_count DESC, product_name
+            LIMIT %(limit)s;
         """)
-        cursor.execute(query, (limit,))
+        cursor.execute(query, {"start_date": start_date, "end_date": end_date,
+                               "channel_name": channel_name, "limit": limit})
         results = cursor.fetchall()
 
         return [ProductMention(product_name=row[0], mention_count=row[1]) for row in results]
@@ -48,66 +51,446 @@ def get_top_products(db_conn: psycopg2.extensions.connection, limit: int = 10) -
     finally:
         cursor.close()
 
-def get_channel_activity(db_conn: psycopg2.extensions.connection, channel_name: str) -> List[ChannelActivity]:
+@timed_crud
+def get_product_mentions(db_conn: psycopg2.extensions.connection, limit: int = 10, start_date: Optional[date] = None,
+                         end_date: Optional[date] = None, channel_name: Optional[str] = None,
+                         category: Optional[str] = None) -> List[ProductMentionSummary]:
     """
-    Returns the posting activity for a specific channel, aggregated by day.
-    Queries fct_messages and dim_channels.
+    Returns the most mentioned dictionary products from fct_product_mentions, optionally limited
+    to a date range (inclusive), one channel (exact name) and one product category.
     """
     cursor = db_conn.cursor()
     try:
         query = sql.SQL("""
             SELECT
-                TO_CHAR(fm.message_timestamp, 'YYYY-MM-DD') AS activity_date,
-                COUNT(fm.message_id) AS message_count
-            FROM raw.fct_messages fm 
-            JOIN raw.dim_channels dc ON fm.channel_id = dc.channel_id
-            WHERE dc.channel_name ILIKE %s
-            GROUP BY 1
-            ORDER BY 1;
+                pm.product_id,
+                pm.product_name,
+                pm.category,
+                SUM(pm.mention_count)::BIGINT AS mention_count,
+                COUNT(*) AS message_count
+            FROM raw.fct_product_mentions pm
+            WHERE (%(start_date)s::date IS NULL OR pm.message_date >= %(start_date)s::date)
+              AND (%(end_date)s::date IS NULL OR pm.message_date <= %(end_date)s::date)
+              AND (%(category)s::text IS NULL OR pm.category = %(category)s)
+              AND (%(channel_name)s::text IS NULL OR pm.channel_id = (
+                  SELECT dc.channel_id FROM raw.dim_channels dc WHERE dc.channel_name = %(channel_name)s
+              ))
+            GROUP BY 1, 2, 3
+            ORDER BY mention_count DESC, pm.product_name
+            LIMIT %(limit)s;
         """)
-        cursor.execute(query, (channel_name,))
+        cursor.execute(query, {"start_date": start_date, "end_date": end_date, "channel_name": channel_name,
+                               "category": category, "limit": limit})
         results = cursor.fetchall()
 
-        return [ChannelActivity(activity_date=row[0], message_count=row[1]) for row in results]
+        return [
+            ProductMentionSummary(product_id=row[0], product_name=row[1], category=row[2],
+                                  mention_count=row[3], message_count=row[4])
+            for row in results
+        ]
     except psycopg2.Error as e:
-        logging.error(f"Error fetching channel activity for {channel_name}: {e}")
+        logging.error(f"Error fetching product mentions: {e}")
         raise
     finally:
         cursor.close()
 
-def search_messages(db_conn: psycopg2.extensions.connection, query_text: str) -> List[MessageSearchResult]:
+def _fetch_channels_activity(db_conn: psycopg2.extensions.connection, channel_names: List[str],
+                             start_date: Optional[date] = None,
+                             end_date: Optional[date] = None) -> Dict[str, List[ChannelActivity]]:
     """
-    Searches for messages containing a specific keyword in fct_messages.
+    Returns the daily posting activity of several channels in one query, as {channel_name: [days]}.
+    Reads the precomputed agg_channel_daily_activity mart; channel names are matched exactly
+    (indexed on dim_channels) and the date bounds are inclusive. Channels without activity are omitted.
+    Untimed, so each public wrapper below is recorded once under its own name.
     """
     cursor = db_conn.cursor()
     try:
-        # Using ILIKE for case-insensitive search
-        search_pattern = f"%{query_text.lower()}%"
         query = sql.SQL("""
             SELECT
-                fm.message_id,
                 dc.channel_name,
-                fm.message_timestamp,
-                fm.message_text
-            FROM raw.fct_messages fm 
-            JOIN raw.dim_channels dc ON fm.channel_id = dc.channel_id
-            WHERE LOWER(fm.message_text) ILIKE %s
-            ORDER BY fm.message_timestamp DESC
-            LIMIT 100; 
+                TO_CHAR(a.date_day, 'YYYY-MM-DD') AS activity_date,
+                a.message_count,
+                a.views_sum,
+                a.media_count,
+                a.detection_count
+            FROM raw.dim_channels dc
+            JOIN raw.agg_channel_daily_activity a ON a.channel_id = dc.channel_id
+            WHERE dc.channel_name = ANY(%(channel_names)s)
+              AND (%(start_date)s::date IS NULL OR a.date_day >= %(start_date)s::date)
+              AND (%(end_date)s::date IS NULL OR a.date_day <= %(end_date)s::date)
+            ORDER BY dc.channel_name, a.date_day;
         """)
-        cursor.execute(query, (search_pattern,))
+        cursor.execute(query, {"channel_names": list(channel_names), "start_date": start_date, "end_date": end_date})
         results = cursor.fetchall()
 
-        return [
+        activity = {}
+        for row in results:
+            activity.setdefault(row[0], []).append(
+                ChannelActivity(activity_date=row[1], message_count=row[2], views_sum=row[3],
+                                media_count=row[4], detection_count=row[5]))
+        return activity
+    except psycopg2.Error as e:
+        logging.error(f"Error fetching channel activity for {channel_names}: {e}")
+        raise
+    finally:
+        cursor.close()
+
+@timed_crud
+def get_channels_activity(db_conn: psycopg2.extensions.connection, channel_names: List[str],
+                          start_date: Optional[date] = None,
+                          end_date: Optional[date] = None) -> Dict[str, List[ChannelActivity]]:
+    """Returns the daily posting activity of several channels, as {channel_name: [days]}."""
+    return _fetch_channels_activity(db_conn, channel_names, start_date, end_date)
+
+
+@timed_crud
+def get_channel_activity(db_conn: psycopg2.extensions.connection, channel_name: str,
+                         start_date: Optional[date] = None, end_date: Optional[date] = None) -> List[ChannelActivity]:
+    """
+    Returns the posting activity for a specific channel, aggregated by day.
+    """
+    return _fetch_channels_activity(db_conn, [channel_name], start_date, end_date).get(channel_name, [])
+
+
+def encode_search_cursor(rank: float, timestamp, surrogate_key: str) -> str:
+    """Packs the sort key of the last returned row into an opaque, URL-safe cursor."""
+    payload = json.dumps([rank, timestamp.isoformat() if timestamp else None, surrogate_key])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_search_cursor(cursor: str):
+    """Inverse of encode_search_cursor. Raises ValueError for a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, timestamp, surrogate_key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return float(rank), datetime.fromisoformat(timestamp) if timestamp else None, str(surrogate_key)
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError(f"Invalid search cursor: {cursor}") from e
+
+
+# Shorter queries have no trigram to look up, so a substring match would scan every message
+SEARCH_SUBSTRING_MIN_LENGTH = 3
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@timed_crud
+def search_messages(db_conn: psycopg2.extensions.connection, query_text: str, limit: int = 100,
+                    cursor: Optional[str] = None) -> Tuple[List[MessageSearchResult], Optional[str]]:
+    """
+    Searches fct_messages for `query_text`, best matches first.
+    A message matches if its full-text vector (GIN index on message_tsv) matches the query
+    words, or its text contains the query as a substring (trigram index on message_text), so
+    Amharic and mixed-script fragments are found too. The substring match needs at least
+    SEARCH_SUBSTRING_MIN_LENGTH characters. Ranking combines ts_rank with trigram word similarity.
+
+    Pages are keyset-paginated on (rank, message_timestamp, message_surrogate_key): pass the
+    returned next cursor to get the following page. The cursor is applied in the scan itself,
+    so matches ranked above it are dropped before the sort. Returns (results, next cursor or None).
+    """
+    db_cursor = db_conn.cursor()
+    try:
+        after = decode_search_cursor(cursor) if cursor else None
+        search_pattern = (f"%{_escape_like(query_text)}%"
+                          if len(query_text.strip()) >= SEARCH_SUBSTRING_MIN_LENGTH else None)
+        # rank is cast to float8 so the value echoed back in the cursor compares exactly
+        query = sql.SQL("""
+            WITH search AS (
+                SELECT websearch_to_tsquery('simple', %(query)s) AS tsq
+            )
+            SELECT fm.message_id, dc.channel_name, fm.message_timestamp, fm.message_text, ranked.rank,
+                   fm.message_surrogate_key
+            FROM raw.fct_messages fm
+            CROSS JOIN search
+            CROSS JOIN LATERAL (
+                SELECT
+                    (ts_rank(fm.message_tsv, search.tsq, 32) + word_similarity(%(query)s, fm.message_text))::float8 AS rank,
+                    COALESCE(fm.message_timestamp, '-infinity'::timestamp) AS sort_timestamp
+            ) ranked
+            JOIN raw.dim_channels dc ON fm.channel_id = dc.channel_id
+            WHERE (fm.message_tsv @@ search.tsq
+                   OR (%(pattern)s::text IS NOT NULL AND fm.message_text ILIKE %(pattern)s))
+              AND (%(after_rank)s::float8 IS NULL
+                   OR (ranked.rank, ranked.sort_timestamp, fm.message_surrogate_key)
+                      < (%(after_rank)s, COALESCE(%(after_timestamp)s::timestamp, '-infinity'::timestamp), %(after_key)s))
+            ORDER BY ranked.rank DESC, ranked.sort_timestamp DESC, fm.message_surrogate_key DESC
+            LIMIT %(limit)s;
+        """)
+        db_cursor.execute(query, {
+            "query": query_text,
+            "pattern": search_pattern,
+            "after_rank": after[0] if after else None,
+            "after_timestamp": after[1] if after else None,
+            "after_key": after[2] if after else None,
+            "limit": limit + 1,  # one extra row tells us whether another page exists
+        })
+        rows = db_cursor.fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_search_cursor(last[4], last[2], last[5])
+
+        results = [
             MessageSearchResult(
                 message_id=row[0],
                 channel_name=row[1],
                 message_timestamp=row[2],
-                message_text=row[3]
-            ) for row in results
+                message_text=row[3],
+                rank=row[4]
+            ) for row in rows
         ]
+        return results, next_cursor
     except psycopg2.Error as e:
         logging.error(f"Error searching messages for '{query_text}': {e}")
         raise
     finally:
-        cursor.close()
\ No newline at end of file
+        db_cursor.close()
+
+
+def encode_detection_cursor(detection_id: int) -> str:
+    """Packs the id of the last returned detection into an opaque, URL-safe cursor."""
+    payload = json.dumps([detection_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_detection_cursor(cursor: str) -> int:
+    """Inverse of encode_detection_cursor. Raises ValueError for a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        (detection_id,) = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return int(detection_id)
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError(f"Invalid detection cursor: {cursor}") from e
+
+
+# Filters shared by the detection list and the per-class counts. Each one matches a
+# post-hook index on fct_image_detections; images without detections are never returned.
+_DETECTION_FILTERS = """
+    d.detected_class <> 'NO_DETECTIONS'
+    AND (%(detected_class)s::text IS NULL OR d.detected_class = %(detected_class)s)
+    AND (%(min_confidence)s::real IS NULL OR d.confidence_score >= %(min_confidence)s::real)
+    AND (%(channel_name)s::text IS NULL OR d.channel_id = (
+        SELECT dc.channel_id FROM raw.dim_channels dc WHERE dc.channel_name = %(channel_name)s
+    ))
+    AND (%(start_date)s::date IS NULL OR d.message_timestamp >= %(start_date)s::date)
+    AND (%(end_date)s::date IS NULL OR d.message_timestamp < %(end_date)s::date + 1)
+"""
+
+
+@timed_crud
+def get_image_detections(db_conn: psycopg2.extensions.connection, limit: int = 100,
+                         detected_class: Optional[str] = None, min_confidence: Optional[float] = None,
+                         channel_name: Optional[str] = None, start_date: Optional[date] = None,
+                         end_date: Optional[date] = None,
+                         cursor: Optional[str] = None) -> Tuple[List[ImageDetection], Optional[str]]:
+    """
+    Returns YOLO detections from fct_image_detections, newest first, filtered by class, minimum
+    confidence, channel (exact name) and message date range (inclusive).
+
+    Pages are keyset-paginated on raw_detection_id: pass the returned next cursor to get the
+    following page. Returns (detections, next cursor or None).
+    """
+    db_cursor = db_conn.cursor()
+    try:
+        after_id = decode_detection_cursor(cursor) if cursor else None
+        query = sql.SQL("""
+            SELECT
+                d.raw_detection_id,
+                d.image_path,
+                d.detected_class,
+                d.confidence_score,
+                d.detection_bbox,
+                dc.channel_name,
+                d.telegram_message_id,
+                d.message_timestamp,
+                d.processed_at
+            FROM raw.fct_image_detections d
+            LEFT JOIN raw.dim_channels dc ON dc.channel_id = d.channel_id
+            WHERE {filters}
+              AND (%(after_id)s::bigint IS NULL OR d.raw_detection_id < %(after_id)s::bigint)
+            ORDER BY d.raw_detection_id DESC
+            LIMIT %(limit)s;
+        """).format(filters=sql.SQL(_DETECTION_FILTERS))
+        db_cursor.execute(query, {
+            "detected_class": detected_class,
+            "min_confidence": min_confidence,
+            "channel_name": channel_name,
+            "start_date": start_date,
+            "end_date": end_date,
+            "after_id": after_id,
+            "limit": limit + 1,  # one extra row tells us whether another page exists
+        })
+        rows = db_cursor.fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_detection_cursor(rows[-1][0])
+
+        detections = [
+            ImageDetection(
+                detection_id=row[0],
+                image_filepath=row[1],
+                detected_class=row[2],
+                confidence_score=row[3],
+                detection_bbox=row[4],
+                channel_name=row[5],
+                message_id=row[6],
+                message_timestamp=row[7],
+                processed_at=row[8]
+            ) for row in rows
+        ]
+        return detections, next_cursor
+    except psycopg2.Error as e:
+        logging.error(f"Error fetching image detections: {e}")
+        raise
+    finally:
+        db_cursor.close()
+
+
+@timed_crud
+def get_detection_class_counts(db_conn: psycopg2.extensions.connection, detected_class: Optional[str] = None,
+                               min_confidence: Optional[float] = None, channel_name: Optional[str] = None,
+                               start_date: Optional[date] = None,
+                               end_date: Optional[date] = None) -> List[DetectionClassCount]:
+    """
+    Returns detection counts per class, most detected first, under the same filters as
+    get_image_detections.
+    """
+    cursor = db_conn.cursor()
+    try:
+        query = sql.SQL("""
+            SELECT
+                d.detected_class,
+                COUNT(*) AS detection_count,
+                COUNT(DISTINCT d.image_path) AS image_count,
+                AVG(d.confidence_score)::float8 AS avg_confidence
+            FROM raw.fct_image_detections d
+            WHERE {filters}
+            GROUP BY d.detected_class
+            ORDER BY detection_count DESC, d.detected_class;
+        """).format(filters=sql.SQL(_DETECTION_FILTERS))
+        cursor.execute(query, {"detected_class": detected_class, "min_confidence": min_confidence,
+                               "channel_name": channel_name, "start_date": start_date, "end_date": end_date})
+        results = cursor.fetchall()
+
+        return [
+            DetectionClassCount(detected_class=row[0], detection_count=row[1], image_count=row[2],
+                                avg_confidence=row[3])
+            for row in results
+        ]
+    except psycopg2.Error as e:
+        logging.error(f"Error fetching detection class counts: {e}")
+        raise
+    finally:
+        cursor.close()
+
+
+# Column names and value types of the bulk exports, in SELECT order
+MESSAGE_EXPORT_COLUMNS = [
+    ("message_surrogate_key", "text"),
+    ("message_id", "int"),
+    ("channel_name", "text"),
+    ("message_timestamp", "timestamp"),
+    ("message_text", "text"),
+    ("views_count", "int"),
+    ("has_media", "bool"),
+    ("mentions_product_or_drug", "bool"),
+]
+
+DETECTION_EXPORT_COLUMNS = [
+    ("detection_id", "int"),
+    ("image_path", "text"),
+    ("detected_class", "text"),
+    ("confidence_score", "float"),
+    ("detection_bbox", "json"),
+    ("channel_name", "text"),
+    ("message_id", "int"),
+    ("message_timestamp", "timestamp"),
+    ("processed_at", "timestamptz"),
+]
+
+
+def _iter_batches(db_conn: psycopg2.extensions.connection, cursor_name: str, query, params: dict,
+                  batch_size: int) -> Iterator[List[tuple]]:
+    """
+    Runs `query` on a server-side (named) cursor and yields its rows in lists of `batch_size`,
+    so only one batch is ever held in memory however many rows match.
+    """
+    cursor = db_conn.cursor(name=cursor_name)
+    cursor.itersize = batch_size
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    except psycopg2.Error as e:
+        logging.error(f"Error streaming {cursor_name}: {e}")
+        raise
+    finally:
+        cursor.close()
+
+
+@timed_crud
+def iter_messages_export(db_conn: psycopg2.extensions.connection, channel_name: Optional[str] = None,
+                         start_date: Optional[date] = None, end_date: Optional[date] = None,
+                         batch_size: int = 5000) -> Iterator[List[tuple]]:
+    """
+    Yields fct_messages rows (MESSAGE_EXPORT_COLUMNS) in batches, optionally for one channel
+    (exact name) and a posting date range (inclusive). Rows come in storage order.
+    """
+    query = sql.SQL("""
+        SELECT
+            fm.message_surrogate_key,
+            fm.message_id,
+            dc.channel_name,
+            fm.message_timestamp,
+            fm.message_text,
+            fm.views_count,
+            fm.has_media,
+            fm.mentions_product_or_drug
+        FROM raw.fct_messages fm
+        LEFT JOIN raw.dim_channels dc ON dc.channel_id = fm.channel_id
+        WHERE (%(channel_name)s::text IS NULL OR fm.channel_id = (
+                SELECT c.channel_id FROM raw.dim_channels c WHERE c.channel_name = %(channel_name)s
+            ))
+          AND (%(start_date)s::date IS NULL OR fm.message_timestamp >= %(start_date)s::date)
+          AND (%(end_date)s::date IS NULL OR fm.message_timestamp < %(end_date)s::date + 1);
+    """)
+    params = {"channel_name": channel_name, "start_date": start_date, "end_date": end_date}
+    return _iter_batches(db_conn, "export_messages", query, params, batch_size)
+
+
+@timed_crud
+def iter_detections_export(db_conn: psycopg2.extensions.connection, detected_class: Optional[str] = None,
+                           min_confidence: Optional[float] = None, channel_name: Optional[str] = None,
+                           start_date: Optional[date] = None, end_date: Optional[date] = None,
+                           batch_size: int = 5000) -> Iterator[List[tuple]]:
+    """
+    Yields fct_image_detections rows (DETECTION_EXPORT_COLUMNS) in batches, under the same
+    filters as get_image_detections. Rows come in storage order.
+    """
+    query = sql.SQL("""
+        SELECT
+            d.raw_detection_id,
+            d.image_path,
+            d.detected_class,
+            d.confidence_score,
+            d.detection_bbox,
+            dc.channel_name,
+            d.telegram_message_id,
+            d.message_timestamp,
+            d.processed_at
+        FROM raw.fct_image_detections d
+        LEFT JOIN raw.dim_channels dc ON dc.channel_id = d.channel_id
+        WHERE {filters};
+    """).format(filters=sql.SQL(_DETECTION_FILTERS))
+    params = {"detected_class": detected_class, "min_confidence": min_confidence, "channel_name": channel_name,
+              "start_date": start_date, "end_date": end_date}
+    return _iter_batches(db_conn, "export_detections", query, params, batch_size)
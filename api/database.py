@@ -1,9 +1,14 @@
 # my_project/database.py
 
 import os
+import time
+import threading
+from contextlib import contextmanager
 import psycopg2
 from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
+from metrics import TimingCursor, observe_pool_wait
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,6 +23,24 @@ DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 DB_HOST = os.getenv("POSTGRES_HOST", "localhost") # Default to localhost for local dev
 DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 
+# Connection pool sizing; DB_POOL_MAX bounds concurrent queries, extra requests wait for a connection
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Seconds a request waits for a free connection before failing with PoolTimeout (HTTP 503)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections idle longer than this are pinged with SELECT 1 before being handed out
+DB_POOL_HEALTHCHECK_SECONDS = float(os.getenv("DB_POOL_HEALTHCHECK_SECONDS", "30"))
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within DB_POOL_TIMEOUT."""
+
+
+_pool = None
+_pool_slots = None
+_last_used = {}
+
+
 def get_db_connection():
     """
     Establishes and returns a new PostgreSQL database connection.
@@ -38,16 +61,109 @@ def get_db_connection():
         logging.error(f"Failed to connect to database: {e}")
         raise
 
+
+def init_pool(minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX):
+    """Opens the shared connection pool (called once at application startup)."""
+    global _pool, _pool_slots
+    if _pool is not None:
+        return _pool
+    _pool = ThreadedConnectionPool(
+        minconn, maxconn,
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+        cursor_factory=TimingCursor  # feeds query timings (and the slow-query log) in metrics.py
+    )
+    # ThreadedConnectionPool raises as soon as it is exhausted; the semaphore makes callers wait instead
+    _pool_slots = threading.BoundedSemaphore(maxconn)
+    logging.info(f"Database connection pool opened ({minconn}-{maxconn} connections).")
+    return _pool
+
+
+def close_pool():
+    """Closes every pooled connection (called at application shutdown)."""
+    global _pool, _pool_slots
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+        _pool_slots = None
+        _last_used.clear()
+        logging.info("Database connection pool closed.")
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0.0) < DB_POOL_HEALTHCHECK_SECONDS:
+        return True
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1;")
+        finally:
+            cursor.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout():
+    if _pool is None:
+        init_pool()
+    slots = _pool_slots
+    started = time.perf_counter()
+    if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+        observe_pool_wait(time.perf_counter() - started)
+        raise PoolTimeout(f"No database connection available within {DB_POOL_TIMEOUT:.0f}s.")
+    try:
+        for _ in range(DB_POOL_MAX + 1):
+            conn = _pool.getconn()
+            if _is_healthy(conn):
+                observe_pool_wait(time.perf_counter() - started)
+                return conn, slots
+            logging.warning("Discarding broken pooled database connection.")
+            _last_used.pop(id(conn), None)
+            _pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("Could not obtain a healthy database connection.")
+    except Exception:
+        slots.release()
+        raise
+
+
+def _checkin(conn, slots):
+    try:
+        if not conn.closed:
+            # Reads leave a transaction open; end it so the connection is not idle in transaction
+            conn.rollback()
+        _last_used[id(conn)] = time.monotonic()
+        if _pool is not None:
+            _pool.putconn(conn, close=conn.closed)
+    except psycopg2.Error:
+        _last_used.pop(id(conn), None)
+        if _pool is not None:
+            _pool.putconn(conn, close=True)
+    finally:
+        slots.release()
+
+
+@contextmanager
+def pooled_connection():
+    """Checks a connection out of the pool for the duration of the `with` block."""
+    conn, slots = _checkout()
+    try:
+        yield conn
+    finally:
+        _checkin(conn, slots)
+
+
 # Dependency for FastAPI to manage database sessions
 def get_db():
     """
-    FastAPI dependency that provides a database connection and ensures it's closed.
+    FastAPI dependency that lends a pooled database connection for the request and returns it afterwards.
+    As a sync generator it runs in FastAPI's thread pool, so waiting for a connection never blocks the event loop.
     """
-    conn = None
-    try:
-        conn = get_db_connection()
+    with pooled_connection() as conn:
         yield conn
-    finally:
-        if conn:
-            conn.close()
-            logging.info("Database connection closed.")
\ No newline at end of file
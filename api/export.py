@@ -0,0 +1,157 @@
+# api/export.py
+
+import os
+import io
+import csv
+import json
+import itertools
+from datetime import date, datetime
+from decimal import Decimal
+from database import pooled_connection
+import logging
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional
+    pyarrow = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Rows fetched from the server-side cursor (and encoded) per chunk; bounds export memory
+API_EXPORT_BATCH_SIZE = int(os.getenv("API_EXPORT_BATCH_SIZE", "5000"))
+
+EXPORT_FORMATS = ("ndjson", "csv", "parquet")
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def parquet_available() -> bool:
+    return pyarrow is not None
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def ndjson_chunks(columns, batches):
+    """Encodes each batch of rows as newline-delimited JSON objects."""
+    names = [name for name, _ in columns]
+    for rows in batches:
+        lines = [json.dumps(dict(zip(names, row)), ensure_ascii=False, default=_json_default) for row in rows]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def csv_chunks(columns, batches):
+    """Encodes a header line, then each batch of rows as CSV. JSON columns are written as JSON text."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    json_columns = [i for i, (_, kind) in enumerate(columns) if kind == "json"]
+    for rows in batches:
+        for row in rows:
+            if json_columns:
+                row = list(row)
+                for i in json_columns:
+                    if row[i] is not None:
+                        row[i] = json.dumps(row[i], ensure_ascii=False)
+            writer.writerow(row)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # header only: no rows matched
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain(), while tell()
+    keeps counting from the start so Parquet footer offsets stay right."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _parquet_schema(columns):
+    types = {
+        "int": pyarrow.int64(),
+        "float": pyarrow.float64(),
+        "bool": pyarrow.bool_(),
+        "text": pyarrow.string(),
+        "json": pyarrow.string(),
+        "timestamp": pyarrow.timestamp("us"),
+        "timestamptz": pyarrow.timestamp("us", tz="UTC"),
+    }
+    return pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+
+def parquet_chunks(columns, batches):
+    """Encodes each batch as one Parquet row group, yielding the file bytes as they are written."""
+    if pyarrow is None:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package.")
+    schema = _parquet_schema(columns)
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    try:
+        for rows in batches:
+            values = list(zip(*rows))
+            arrays = []
+            for i, (_, kind) in enumerate(columns):
+                column = values[i]
+                if kind == "json":
+                    column = [json.dumps(value, ensure_ascii=False) if value is not None else None for value in column]
+                arrays.append(pyarrow.array(column, type=schema.field(i).type))
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+_ENCODERS = {"ndjson": ndjson_chunks, "csv": csv_chunks, "parquet": parquet_chunks}
+
+
+def export_chunks(export_format: str, columns, fetch_batches):
+    """
+    Streams an export as encoded byte chunks. `fetch_batches(db_conn)` returns an iterator of
+    row batches; the pooled connection it reads from is held only while the stream runs and is
+    returned as soon as the stream ends or is closed (e.g. the client disconnects).
+
+    The first chunk is only produced after the query has run, so call next() on the result
+    before sending headers to surface PoolTimeout and query errors as a normal error response.
+    """
+    encode = _ENCODERS[export_format]
+    with pooled_connection() as db_conn:
+        batches = fetch_batches(db_conn)
+        first_batch = next(batches, None)
+        yield b""  # the query has run
+        rows = itertools.chain([first_batch], batches) if first_batch is not None else iter(())
+        try:
+            yield from encode(columns, rows)
+        except Exception as e:
+            # Headers are already sent, so the client only sees a truncated stream
+            logging.error(f"API Error: {export_format} export failed mid-stream: {e}", exc_info=True)
+            raise
@@ -1,72 +1,223 @@
 # api/main.py
-from fastapi import FastAPI, Depends, HTTPException, Query
-from typing import List
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from typing import List, Optional
+from datetime import date
+import time
 import psycopg2
-from database import get_db, get_db_connection
+from database import get_db, init_pool, close_pool, pooled_connection, PoolTimeout
+from cache import cached_response
+from metrics import begin_request, end_request, observe_request, render_metrics
+from export import (
+    API_EXPORT_BATCH_SIZE, EXPORT_FORMATS, EXPORT_MEDIA_TYPES, export_chunks, parquet_available
+)
 from schemas import (
     TopProductsReport,
-    ProductMention,
+    ProductMentionsReport,
     ChannelActivity,
+    ChannelActivitySeries,
     MessageSearchResponse,
-    MessageSearchResult
+    ImageDetectionsResponse,
+    DetectionClassReport
 )
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Import CRUD operations
-from crud import get_top_products, get_channel_activity, search_messages
+from crud import (
+    get_top_products, get_product_mentions, get_channel_activity, get_channels_activity, search_messages,
+    get_image_detections, get_detection_class_counts, iter_messages_export, iter_detections_export,
+    MESSAGE_EXPORT_COLUMNS, DETECTION_EXPORT_COLUMNS
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connections are opened once here, not per request
+    init_pool()
+    try:
+        yield
+    finally:
+        close_pool()
+
 
 app = FastAPI(
     title="Telegram Data Product API",
     description="API for analytical insights from Telegram data, powered by dbt and YOLO.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # Streaming exports count until their headers are sent; their row fetching shows up in the crud timings
+    token = begin_request(request.scope)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        observe_request(request.method, request.scope, status_code, time.perf_counter() - started)
+        end_request(token)
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    logging.warning(f"API Error: {exc} ({request.url.path})")
+    return JSONResponse(status_code=503, content={"detail": "Database is busy, please retry."})
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Telegram Data Product API! Visit /docs for API documentation."}
 
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    """Request, query and pool timings of this process in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/health", summary="Health Check", description="Checks that a pooled database connection is usable.")
+def health(db_conn: psycopg2.extensions.connection = Depends(get_db)):
+    cursor = db_conn.cursor()
+    try:
+        cursor.execute("SELECT 1;")
+        cursor.fetchone()
+        return {"status": "ok"}
+    except psycopg2.Error as e:
+        logging.error(f"API Error: Health check failed: {e}")
+        raise HTTPException(status_code=503, detail="Database unavailable.")
+    finally:
+        cursor.close()
+
 @app.get(
     "/api/reports/top-products",
     response_model=TopProductsReport,
     summary="Get Top Mentioned Products",
-    description="Returns a list of the most frequently mentioned 'products' (words) across all messages."
+    description="Returns the most frequently mentioned 'products' (words), optionally for a date range and channel."
 )
-async def read_top_products(
+def read_top_products(
+    request: Request,
     limit: int = Query(10, ge=1, le=100, description="Number of top products to return"),
-    db_conn: psycopg2.extensions.connection = Depends(get_db)
+    start_date: Optional[date] = Query(None, description="First message day to count (inclusive)"),
+    end_date: Optional[date] = Query(None, description="Last message day to count (inclusive)"),
+    channel: Optional[str] = Query(None, description="Only count messages from this channel (exact name)")
 ):
     """
     Returns the top N most frequently mentioned products.
     """
-    try:
-        products = get_top_products(db_conn, limit)
+    def compute():
+        with pooled_connection() as db_conn:
+            products = get_top_products(db_conn, limit, start_date=start_date, end_date=end_date,
+                                        channel_name=channel)
         return TopProductsReport(products=products)
+
+    try:
+        return cached_response(request, compute)
+    except PoolTimeout:
+        raise
     except Exception as e:
         logging.error(f"API Error: Failed to retrieve top products: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error while fetching top products.")
 
 
+@app.get(
+    "/api/reports/product-mentions",
+    response_model=ProductMentionsReport,
+    summary="Get Product Mention Counts",
+    description="Returns the most mentioned products from the product dictionary, optionally for a date range, channel and category."
+)
+def read_product_mentions(
+    request: Request,
+    limit: int = Query(10, ge=1, le=100, description="Number of products to return"),
+    start_date: Optional[date] = Query(None, description="First message day to count (inclusive)"),
+    end_date: Optional[date] = Query(None, description="Last message day to count (inclusive)"),
+    channel: Optional[str] = Query(None, description="Only count messages from this channel (exact name)"),
+    category: Optional[str] = Query(None, description="Only count products of this category, e.g. 'drug'")
+):
+    """
+    Returns dictionary products ranked by number of mentions.
+    """
+    def compute():
+        with pooled_connection() as db_conn:
+            products = get_product_mentions(db_conn, limit, start_date=start_date, end_date=end_date,
+                                            channel_name=channel, category=category)
+        return ProductMentionsReport(products=products)
+
+    try:
+        return cached_response(request, compute)
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logging.error(f"API Error: Failed to retrieve product mentions: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error while fetching product mentions.")
+
+
+@app.get(
+    "/api/channels/activity",
+    response_model=List[ChannelActivitySeries],
+    summary="Get Posting Activity for Several Channels",
+    description="Returns daily activity for a comma-separated list of channels in one call, optionally within date bounds."
+)
+def read_channels_activity(
+    request: Request,
+    channels: str = Query(..., min_length=1, description="Comma-separated channel names, e.g. CheMeds,tenamereja"),
+    start_date: Optional[date] = Query(None, description="First day to return (inclusive)"),
+    end_date: Optional[date] = Query(None, description="Last day to return (inclusive)")
+):
+    """
+    Returns the posting activity for each requested channel that has any.
+    """
+    channel_names = list(dict.fromkeys(name.strip() for name in channels.split(",") if name.strip()))
+    if not channel_names or len(channel_names) > 100:
+        raise HTTPException(status_code=400, detail="Pass between 1 and 100 channel names.")
+
+    def compute():
+        with pooled_connection() as db_conn:
+            activity = get_channels_activity(db_conn, channel_names, start_date, end_date)
+        return [ChannelActivitySeries(channel_name=name, activity=activity[name])
+                for name in channel_names if name in activity]
+
+    try:
+        return cached_response(request, compute)
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logging.error(f"API Error: Failed to retrieve activity for channels {channel_names}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error while fetching channel activity.")
+
+
 @app.get(
     "/api/channels/{channel_name}/activity",
     response_model=List[ChannelActivity],
     summary="Get Channel Posting Activity",
-    description="Returns the daily message count for a specific Telegram channel."
+    description="Returns the daily message count for a specific Telegram channel, optionally within date bounds."
 )
-async def read_channel_activity(
+def read_channel_activity(
+    request: Request,
     channel_name: str,
-    db_conn: psycopg2.extensions.connection = Depends(get_db)
+    start_date: Optional[date] = Query(None, description="First day to return (inclusive)"),
+    end_date: Optional[date] = Query(None, description="Last day to return (inclusive)")
 ):
     """
     Returns the posting activity for a specific channel.
     """
-    try:
-        activity = get_channel_activity(db_conn, channel_name)
+    def compute():
+        with pooled_connection() as db_conn:
+            activity = get_channel_activity(db_conn, channel_name, start_date, end_date)
         if not activity:
             raise HTTPException(status_code=404, detail=f"No activity found for channel: {channel_name}")
         return activity
-    except HTTPException: # Re-raise HTTPExceptions (e.g., 404)
+
+    try:
+        return cached_response(request, compute)
+    except (HTTPException, PoolTimeout): # Re-raise HTTPExceptions (e.g., 404)
         raise
     except Exception as e:
         logging.error(f"API Error: Failed to retrieve activity for channel {channel_name}: {e}", exc_info=True)
@@ -77,18 +228,168 @@ async def read_channel_activity(
     "/api/search/messages",
     response_model=MessageSearchResponse,
     summary="Search Messages by Keyword",
-    description="Searches for Telegram messages containing a specified keyword."
+    description="Full-text and substring search over Telegram messages, best matches first, with cursor pagination."
 )
-async def search_telegram_messages(
-    query: str = Query(..., min_length=2, description="Keyword to search for in message text"),
-    db_conn: psycopg2.extensions.connection = Depends(get_db)
+def search_telegram_messages(
+    request: Request,
+    query: str = Query(..., min_length=2,
+                       description="Keyword to search for in message text; substring matching needs 3+ characters"),
+    limit: int = Query(100, ge=1, le=500, description="Number of results per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
 ):
     """
     Searches for messages containing a specific keyword.
     """
+    def compute():
+        with pooled_connection() as db_conn:
+            results, next_cursor = search_messages(db_conn, query, limit=limit, cursor=cursor)
+        return MessageSearchResponse(query=query, results=results, next_cursor=next_cursor)
+
     try:
-        results = search_messages(db_conn, query)
-        return MessageSearchResponse(query=query, results=results)
+        return cached_response(request, compute)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PoolTimeout:
+        raise
     except Exception as e:
         logging.error(f"API Error: Failed to search messages for '{query}': {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Internal server error while searching messages.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error while searching messages.")
+
+
+@app.get(
+    "/api/detections",
+    response_model=ImageDetectionsResponse,
+    summary="List Image Detections",
+    description="Returns YOLO detections, newest first, filtered by class, confidence, channel and message date, with cursor pagination."
+)
+def read_image_detections(
+    request: Request,
+    detected_class: Optional[str] = Query(None, description="Only return this class, e.g. 'bottle'"),
+    min_confidence: Optional[float] = Query(None, ge=0.0, le=1.0, description="Minimum confidence score"),
+    channel: Optional[str] = Query(None, description="Only return detections from this channel"),
+    start_date: Optional[date] = Query(None, description="First message day to return (inclusive)"),
+    end_date: Optional[date] = Query(None, description="Last message day to return (inclusive)"),
+    limit: int = Query(100, ge=1, le=500, description="Number of detections per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
+    """
+    Returns a page of image detections matching the filters.
+    """
+    def compute():
+        with pooled_connection() as db_conn:
+            detections, next_cursor = get_image_detections(
+                db_conn, limit, detected_class=detected_class, min_confidence=min_confidence,
+                channel_name=channel, start_date=start_date, end_date=end_date, cursor=cursor)
+        return ImageDetectionsResponse(detections=detections, next_cursor=next_cursor)
+
+    try:
+        return cached_response(request, compute)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logging.error(f"API Error: Failed to retrieve image detections: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error while fetching image detections.")
+
+
+@app.get(
+    "/api/detections/classes",
+    response_model=DetectionClassReport,
+    summary="Get Detection Counts per Class",
+    description="Returns the number of detections and images per YOLO class under the same filters as /api/detections."
+)
+def read_detection_classes(
+    request: Request,
+    detected_class: Optional[str] = Query(None, description="Only count this class"),
+    min_confidence: Optional[float] = Query(None, ge=0.0, le=1.0, description="Minimum confidence score"),
+    channel: Optional[str] = Query(None, description="Only count detections from this channel"),
+    start_date: Optional[date] = Query(None, description="First message day to count (inclusive)"),
+    end_date: Optional[date] = Query(None, description="Last message day to count (inclusive)")
+):
+    """
+    Returns detection counts per class, most detected first.
+    """
+    def compute():
+        with pooled_connection() as db_conn:
+            classes = get_detection_class_counts(
+                db_conn, detected_class=detected_class, min_confidence=min_confidence,
+                channel_name=channel, start_date=start_date, end_date=end_date)
+        return DetectionClassReport(classes=classes)
+
+    try:
+        return cached_response(request, compute)
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logging.error(f"API Error: Failed to retrieve detection class counts: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error while fetching detection class counts.")
+
+
+def _streaming_export(name: str, export_format: str, columns, fetch_batches) -> StreamingResponse:
+    """
+    Starts an export and wraps it in a chunked response. The query runs before any header is
+    sent, so a busy pool or a failing query still gets a proper 503/500.
+    """
+    if export_format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires the 'pyarrow' package on the server.")
+    chunks = export_chunks(export_format, columns, fetch_batches)
+    try:
+        next(chunks)
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logging.error(f"API Error: Failed to start {name} export: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error while exporting {name}.")
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{export_format}"'}
+    )
+
+
+@app.get(
+    "/api/export/messages",
+    summary="Export Messages",
+    description="Streams every matching message as NDJSON, CSV or Parquet, read through a server-side cursor."
+)
+def export_messages(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv|parquet)$",
+                               description=f"One of {', '.join(EXPORT_FORMATS)}"),
+    channel: Optional[str] = Query(None, description="Only export messages from this channel"),
+    start_date: Optional[date] = Query(None, description="First message day to export (inclusive)"),
+    end_date: Optional[date] = Query(None, description="Last message day to export (inclusive)")
+):
+    """
+    Streams messages in constant memory, one batch of rows at a time.
+    """
+    return _streaming_export(
+        "messages", export_format, MESSAGE_EXPORT_COLUMNS,
+        lambda db_conn: iter_messages_export(db_conn, channel_name=channel, start_date=start_date,
+                                             end_date=end_date, batch_size=API_EXPORT_BATCH_SIZE)
+    )
+
+
+@app.get(
+    "/api/export/detections",
+    summary="Export Image Detections",
+    description="Streams every matching YOLO detection as NDJSON, CSV or Parquet, under the same filters as /api/detections."
+)
+def export_detections(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv|parquet)$",
+                               description=f"One of {', '.join(EXPORT_FORMATS)}"),
+    detected_class: Optional[str] = Query(None, description="Only export this class, e.g. 'bottle'"),
+    min_confidence: Optional[float] = Query(None, ge=0.0, le=1.0, description="Minimum confidence score"),
+    channel: Optional[str] = Query(None, description="Only export detections from this channel"),
+    start_date: Optional[date] = Query(None, description="First message day to export (inclusive)"),
+    end_date: Optional[date] = Query(None, description="Last message day to export (inclusive)")
+):
+    """
+    Streams image detections in constant memory, one batch of rows at a time.
+    """
+    return _streaming_export(
+        "detections", export_format, DETECTION_EXPORT_COLUMNS,
+        lambda db_conn: iter_detections_export(db_conn, detected_class=detected_class, min_confidence=min_confidence,
+                                               channel_name=channel, start_date=start_date, end_date=end_date,
+                                               batch_size=API_EXPORT_BATCH_SIZE)
+    )
@@ -0,0 +1,262 @@
+# api/metrics.py
+
+import os
+import re
+import time
+import threading
+import functools
+import contextvars
+import psycopg2
+import psycopg2.extensions
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Log statements slower than this many milliseconds together with their EXPLAIN plan; 0 disables the log
+API_SLOW_QUERY_MS = float(os.getenv("API_SLOW_QUERY_MS", "0"))
+
+# Prometheus' default latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+# ASGI scope of the request being served, so timings taken deep in crud/database code can be
+# attributed to the endpoint (route template) that caused them
+_request_scope = contextvars.ContextVar("request_scope", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative histogram per label set, rendered in the Prometheus text exposition format."""
+
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labelvalues, counts, total, count in sorted(snapshot):
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, labelvalues, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter per label set, rendered in the Prometheus text exposition format."""
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *labelvalues):
+        with self._lock:
+            self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._series.items())
+        for labelvalues, value in snapshot:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "api_request_duration_seconds", "Time until the response headers were ready, per endpoint.",
+    ["method", "endpoint", "status"])
+POOL_WAIT = Histogram(
+    "api_db_pool_wait_seconds", "Time spent waiting for (and health-checking) a pooled connection.",
+    ["endpoint"])
+QUERY_DURATION = Histogram(
+    "api_db_query_duration_seconds", "Time spent executing SQL statements.",
+    ["endpoint"])
+CRUD_DURATION = Histogram(
+    "api_crud_duration_seconds", "Time spent in crud functions (SQL, fetching and building response models).",
+    ["endpoint", "function"])
+CRUD_ROWS = Histogram(
+    "api_crud_rows", "Rows returned per crud call.",
+    ["endpoint", "function"], buckets=ROW_BUCKETS)
+SERIALIZATION_DURATION = Histogram(
+    "api_response_serialization_seconds", "Time spent encoding response models to JSON.",
+    ["endpoint"])
+SLOW_QUERIES = Counter(
+    "api_db_slow_queries_total", "Statements slower than API_SLOW_QUERY_MS.",
+    ["endpoint"])
+
+REGISTRY = (REQUEST_DURATION, POOL_WAIT, QUERY_DURATION, CRUD_DURATION, CRUD_ROWS, SERIALIZATION_DURATION,
+            SLOW_QUERIES)
+
+
+def render_metrics() -> str:
+    """All metrics of this process in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def begin_request(scope):
+    return _request_scope.set(scope)
+
+
+def end_request(token):
+    _request_scope.reset(token)
+
+
+def endpoint_label(scope=None) -> str:
+    """Route template of the current request (e.g. /api/channels/{channel_name}/activity)."""
+    scope = scope if scope is not None else _request_scope.get()
+    if scope is None:
+        return "none"
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+def observe_request(method, scope, status, seconds):
+    REQUEST_DURATION.observe(seconds, method, endpoint_label(scope), str(status))
+
+
+def observe_pool_wait(seconds):
+    POOL_WAIT.observe(seconds, endpoint_label())
+
+
+def observe_serialization(seconds):
+    SERIALIZATION_DURATION.observe(seconds, endpoint_label())
+
+
+def _row_count(result):
+    if isinstance(result, tuple) and result:  # (rows, next_cursor)
+        result = result[0]
+    if isinstance(result, dict):
+        return sum(len(value) if isinstance(value, list) else 1 for value in result.values())
+    if isinstance(result, list):
+        return len(result)
+    return None
+
+
+def timed_crud(func):
+    """
+    Records the duration and returned row count of a crud function. Generator results (the
+    bulk exports) are timed batch by batch as they are consumed.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        if hasattr(result, "__next__"):
+            return _timed_batches(name, result, time.perf_counter() - started)
+        rows = _row_count(result)
+        endpoint = endpoint_label()
+        CRUD_DURATION.observe(time.perf_counter() - started, endpoint, name)
+        if rows is not None:
+            CRUD_ROWS.observe(rows, endpoint, name)
+        return result
+
+    return wrapper
+
+
+def _timed_batches(name, batches, elapsed):
+    rows = 0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                break
+            elapsed += time.perf_counter() - started
+            rows += len(batch)
+            yield batch
+    finally:
+        batches.close()
+        endpoint = endpoint_label()
+        CRUD_DURATION.observe(elapsed, endpoint, name)
+        CRUD_ROWS.observe(rows, endpoint, name)
+
+
+_EXPLAINABLE = re.compile(rb"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+class TimingCursor(psycopg2.extensions.cursor):
+    """
+    Cursor that records how long each execute() takes. With API_SLOW_QUERY_MS set, statements
+    over the threshold are logged with their EXPLAIN plan (the plan is not re-executed).
+    """
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            super().execute(query, vars)
+        finally:
+            seconds = time.perf_counter() - started
+            QUERY_DURATION.observe(seconds, endpoint_label())
+        # Named (server-side) cursors only DECLARE here; their cost shows up in the crud timings
+        if API_SLOW_QUERY_MS and seconds * 1000 >= API_SLOW_QUERY_MS and self.name is None:
+            SLOW_QUERIES.inc(1, endpoint_label())
+            self._log_slow_query(seconds)
+
+    def _log_slow_query(self, seconds):
+        statement = self.query  # the statement as sent, parameters already bound
+        if not statement or not _EXPLAINABLE.match(statement):
+            logging.warning(f"Slow query ({seconds * 1000:.0f} ms, {endpoint_label()}): {statement!r}")
+            return
+        plan = "(EXPLAIN failed)"
+        explain_cursor = self.connection.cursor(cursor_factory=psycopg2.extensions.cursor)
+        try:
+            # A savepoint keeps a failing EXPLAIN from aborting the request's transaction
+            explain_cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                explain_cursor.execute(b"EXPLAIN " + statement)
+                plan = "\n".join(row[0] for row in explain_cursor.fetchall())
+                explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            except psycopg2.Error as e:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                plan = f"(EXPLAIN failed: {e})"
+        except psycopg2.Error as e:
+            plan = f"(EXPLAIN failed: {e})"
+        finally:
+            explain_cursor.close()
+        logging.warning(
+            f"Slow query ({seconds * 1000:.0f} ms, {endpoint_label()}): {statement.decode('utf-8', 'replace')}\n{plan}")
@@ -13,10 +13,30 @@ class ProductMention(BaseModel):
 class TopProductsReport(BaseModel):
     products: List[ProductMention]
 
+# Schema for a dictionary product in the product mentions report
+class ProductMentionSummary(BaseModel):
+    product_id: int
+    product_name: str
+    category: Optional[str] = None
+    mention_count: int  # Total mentions
+    message_count: int  # Messages mentioning the product
+
+# Schema for the product mentions report response
+class ProductMentionsReport(BaseModel):
+    products: List[ProductMentionSummary]
+
 # Schema for channel activity
 class ChannelActivity(BaseModel):
     activity_date: str # Or datetime if you prefer
     message_count: int
+    views_sum: Optional[int] = None
+    media_count: Optional[int] = None
+    detection_count: Optional[int] = None
+
+# Schema for one channel in the batch activity response
+class ChannelActivitySeries(BaseModel):
+    channel_name: str
+    activity: List[ChannelActivity]
 
 # Schema for a single message search result
 class MessageSearchResult(BaseModel):
@@ -24,6 +44,7 @@ class MessageSearchResult(BaseModel):
     channel_name: str
     message_timestamp: datetime
     message_text: str
+    rank: Optional[float] = None  # Search relevance; higher is better
     # Optional: If you want to include image detection info in message search
     # detected_objects: Optional[List[str]] = None
 
@@ -31,6 +52,7 @@ class MessageSearchResult(BaseModel):
 class MessageSearchResponse(BaseModel):
     query: str
     results: List[MessageSearchResult]
+    next_cursor: Optional[str] = None  # Pass as `cursor` to fetch the next page; None on the last page
 
 # Optional: Schema for image detection details if you decide to expose them
 class ImageDetection(BaseModel):
@@ -38,4 +60,24 @@ class ImageDetection(BaseModel):
     image_filepath: str
     detected_class: str
     confidence_score: float
-    # detection_bbox: List[float] # If you want to expose bounding box
\ No newline at end of file
+    detection_bbox: Optional[List[float]] = None  # [x1, y1, x2, y2] in original image pixels
+    channel_name: Optional[str] = None
+    message_id: Optional[int] = None
+    message_timestamp: Optional[datetime] = None
+    processed_at: Optional[datetime] = None
+
+# Schema for a page of image detections
+class ImageDetectionsResponse(BaseModel):
+    detections: List[ImageDetection]
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to fetch the next page
+
+# Schema for the number of detections of one class
+class DetectionClassCount(BaseModel):
+    detected_class: str
+    detection_count: int
+    image_count: int  # Distinct images with this class
+    avg_confidence: float
+
+# Schema for the per-class detection counts response
+class DetectionClassReport(BaseModel):
+    classes: List[DetectionClassCount]
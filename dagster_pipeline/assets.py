@@ -1,8 +1,11 @@
 # dagster_pipeline/assets.py
 
 import os
+import json
+import uuid
 import subprocess
-from dagster import asset, OpExecutionContext
+from datetime import datetime, timezone
+from dagster import asset, Config, OpExecutionContext
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,6 +14,24 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Assuming your scripts are in the 'scripts/' directory relative to the project root
 # And your dbt project is in 'telegram_data_dbt/' relative to the project root
 
+
+def bump_data_version():
+    """
+    Records a new data version after a successful dbt build. The API includes it in its
+    response cache keys (api/cache.py), so cached reports are invalidated by the build.
+    """
+    version_file = os.getenv(
+        "DATA_VERSION_FILE",
+        os.path.join(os.getenv("PROJECT_ROOT_PATH", "."), "data", "state", "data_version.json")
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(version_file)), exist_ok=True)
+    payload = {"version": uuid.uuid4().hex, "updated_at": datetime.now(timezone.utc).isoformat()}
+    tmp_path = f"{version_file}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, version_file)
+    return payload["version"]
+
 @asset(compute_kind="python")
 def raw_telegram_messages(context: OpExecutionContext):
     """
@@ -46,20 +67,40 @@ def raw_telegram_messages(context: OpExecutionContext):
         raise
 
 
+class ImageDetectionConfig(Config):
+    # Number of detector worker processes (DETECTOR_SHARDS); 1 runs detection in a single process
+    shards: int = int(os.getenv("DETECTOR_SHARDS", "1"))
+
+
 @asset(compute_kind="python", deps=[raw_telegram_messages])  # Depends on raw_telegram_messages
-def raw_image_detections(context: OpExecutionContext):
+def raw_image_detections(context: OpExecutionContext, config: ImageDetectionConfig):
     """
     Runs the YOLO object detection script to process images and load results.
     This asset represents the raw.image_detections table in PostgreSQL.
+    The shard count can be set per run in the launchpad config (defaults to DETECTOR_SHARDS).
+
+    With DETECTION_MODE=worker, a long-running scripts/detection_worker.py does the
+    inference; this asset queues the images it has not processed yet and then waits (up to
+    DETECTION_WAIT_SECONDS) for the worker to drain the queue, so dbt_models sees their
+    detections. Jobs still queued after the wait (e.g. backing off after a failure) are
+    picked up by the next run.
     """
     context.log.info("Starting raw_image_detections processing...")
     try:
         # Assuming yolo_detector.py is in the 'scripts' directory
         project_root = os.getenv("PROJECT_ROOT_PATH", ".")
-        command = ["python", os.path.join(project_root, "scripts", "yolo_detector.py")]
-
-        context.log.info(f"Executing command: {' '.join(command)}")
-        result = subprocess.run(command, capture_output=True, text=True, check=True, cwd=project_root)
+        if os.getenv("DETECTION_MODE", "batch") == "worker":
+            command = ["python", os.path.join(project_root, "scripts", "detection_worker.py"), "--enqueue-pending",
+                       "--wait", os.getenv("DETECTION_WAIT_SECONDS", "1800")]
+        else:
+            command = ["python", os.path.join(project_root, "scripts", "yolo_detector.py")]
+
+        detector_env = os.environ.copy()
+        detector_env["DETECTOR_SHARDS"] = str(config.shards)
+
+        context.log.info(f"Executing command: {' '.join(command)} with {config.shards} detector shard(s)")
+        result = subprocess.run(command, capture_output=True, text=True, check=True, cwd=project_root,
+                                env=detector_env)
         context.log.info(f"yolo_detector.py stdout:\n{result.stdout}")
         if result.stderr:
             context.log.error(f"yolo_detector.py stderr:\n{result.stderr}")
@@ -103,6 +144,7 @@ def dbt_models(context: OpExecutionContext, deps=[raw_telegram_messages, raw_ima
         if result.stderr:
             context.log.error(f"dbt build stderr:\n{result.stderr}")
         context.log.info("dbt build completed successfully.")
+        context.log.info(f"API data version bumped to {bump_data_version()}.")
     except subprocess.CalledProcessError as e:
         context.log.error(f"Error running dbt build: {e}")
         context.log.error(f"Stdout: {e.stdout}")
@@ -0,0 +1,59 @@
+# scripts/benchmark_api_latency.py
+#
+# Fires concurrent GET requests at a running API and reports throughput and latency percentiles,
+# e.g. to compare p99 before and after a change to the database layer.
+#
+# Usage: python scripts/benchmark_api_latency.py [--url URL] [--requests N] [--concurrency C]
+
+import time
+import argparse
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+
+def timed_get(url, timeout):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, TimeoutError):
+        status = None
+    return status, time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent latency benchmark for the API.")
+    parser.add_argument("--url", default="http://localhost:8000/api/search/messages?query=paracetamol")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda _: timed_get(args.url, args.timeout), range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}: {args.requests / elapsed:.1f} req/s")
+    print(f"status codes: {statuses}")
+    for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        print(f"{label}: {1000 * percentile(latencies, fraction):.1f} ms")
+    print(f"max: {1000 * latencies[-1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
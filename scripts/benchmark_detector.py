@@ -0,0 +1,135 @@
+# scripts/benchmark_detector.py
+#
+# Compares detector backends (PyTorch, ONNX, OpenVINO, optionally int8) on a fixed local image set:
+# inference throughput, and how closely each backend's detections agree with the PyTorch baseline.
+# A detection agrees when the baseline has one of the same class with IoU >= --iou on the same image.
+# No database is needed.
+#
+# Usage: python scripts/benchmark_detector.py [--images DIR] [--limit N] [--backends torch onnx openvino] [--int8]
+
+import os
+import glob
+import time
+import argparse
+from yolo_detector import (
+    RAW_IMAGES_PATH, DETECTOR_BATCH_SIZE, load_model, iter_prefetched_batches, run_batch_inference,
+    detections_from_result
+)
+
+
+def fixed_image_set(directory, limit):
+    """The first `limit` images under `directory` in sorted order, so every run sees the same set."""
+    paths = []
+    for ext in ('*.jpg', '*.jpeg', '*.png'):
+        paths.extend(glob.glob(os.path.join(directory, '**', ext), recursive=True))
+    return sorted(paths)[:limit]
+
+
+def run_backend(backend, int8, image_paths, batch_size):
+    """Returns ({image_path: detections}, inference seconds) for one backend."""
+    model = load_model(backend, int8)
+    if model is None:
+        raise RuntimeError(f"Could not load the {backend} model.")
+
+    detections = {}
+    inference_seconds = 0.0
+    warmed_up = False
+    for batch in iter_prefetched_batches(image_paths, batch_size=batch_size):
+        batch = [item for item in batch if "error" not in item]
+        if not batch:
+            continue
+        if not warmed_up:
+            # First call pays for graph compilation / allocation; keep it out of the timing
+            run_batch_inference(model, batch)
+            warmed_up = True
+        started = time.perf_counter()
+        results = run_batch_inference(model, batch)
+        inference_seconds += time.perf_counter() - started
+        for item, result in zip(batch, results):
+            if result is not None:
+                detections[item["image_path"]] = detections_from_result(result, model, item, None, None)
+    return detections, inference_seconds
+
+
+def iou(a, b):
+    inter_w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    inter_h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = inter_w * inter_h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def agreement(baseline, candidate, iou_threshold):
+    """
+    Greedily matches candidate detections to baseline detections of the same class, highest
+    confidence first. Returns (matched, baseline count, candidate count, mean |confidence delta|).
+    """
+    matched = baseline_count = candidate_count = 0
+    confidence_deltas = []
+    for image_path, expected in baseline.items():
+        found = sorted(candidate.get(image_path, []), key=lambda d: -d["confidence_score"])
+        unmatched = list(expected)
+        baseline_count += len(expected)
+        candidate_count += len(found)
+        for det in found:
+            best, best_iou = None, iou_threshold
+            for ref in unmatched:
+                if ref["detected_class"] != det["detected_class"]:
+                    continue
+                overlap = iou(ref["detection_bbox"], det["detection_bbox"])
+                if overlap >= best_iou:
+                    best, best_iou = ref, overlap
+            if best is not None:
+                unmatched.remove(best)
+                matched += 1
+                confidence_deltas.append(abs(best["confidence_score"] - det["confidence_score"]))
+    mean_delta = sum(confidence_deltas) / len(confidence_deltas) if confidence_deltas else 0.0
+    return matched, baseline_count, candidate_count, mean_delta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark YOLO inference backends against PyTorch.")
+    parser.add_argument("--images", default=RAW_IMAGES_PATH, help="Directory of images to benchmark on.")
+    parser.add_argument("--limit", type=int, default=200, help="Number of images in the fixed set.")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "openvino"])
+    parser.add_argument("--int8", action="store_true", help="Also benchmark int8 exports of non-torch backends.")
+    parser.add_argument("--batch-size", type=int, default=DETECTOR_BATCH_SIZE)
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU needed for two detections to agree.")
+    args = parser.parse_args()
+
+    image_paths = fixed_image_set(args.images, args.limit)
+    if not image_paths:
+        raise SystemExit(f"No images found under {args.images}.")
+
+    variants = [("torch", False)]
+    for backend in args.backends:
+        if backend != "torch":
+            variants.append((backend, False))
+            if args.int8:
+                variants.append((backend, True))
+
+    baseline = None
+    rows = []
+    for backend, int8 in variants:
+        label = f"{backend}{' int8' if int8 else ''}"
+        try:
+            detections, seconds = run_backend(backend, int8, image_paths, args.batch_size)
+        except Exception as e:
+            if baseline is None:
+                raise SystemExit(f"PyTorch baseline failed: {e}")
+            print(f"{label}: skipped ({e})")
+            continue
+        if baseline is None:
+            baseline = detections
+        matched, expected, found, delta = agreement(baseline, detections, args.iou)
+        rows.append((label, len(detections) / max(seconds, 1e-6), matched / max(expected, 1),
+                     matched / max(found, 1), delta))
+
+    print(f"\n{len(image_paths)} images from {args.images}, batch size {args.batch_size}, IoU >= {args.iou}")
+    print(f"{'backend':<14} {'images/sec':>10} {'recall':>8} {'precision':>10} {'mean |dconf|':>13}")
+    for label, images_per_sec, recall, precision, delta in rows:
+        print(f"{label:<14} {images_per_sec:>10.2f} {recall:>8.3f} {precision:>10.3f} {delta:>13.4f}")
+
+
+if __name__ == "__main__":
+    main()
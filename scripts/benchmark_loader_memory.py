@@ -0,0 +1,89 @@
+# scripts/benchmark_loader_memory.py
+#
+# Shows that the streaming loader path keeps peak memory flat as raw files grow.
+# Each measurement runs in a fresh subprocess so peak RSS is not shared between runs.
+# No database is needed: only parsing and COPY batch encoding are exercised.
+#
+# Usage: python scripts/benchmark_loader_memory.py [message counts...]
+
+import os
+import sys
+import json
+import resource
+import subprocess
+import tempfile
+
+DEFAULT_SIZES = [10_000, 100_000, 500_000]
+
+
+def write_synthetic_files(directory, message_count):
+    """Writes the same synthetic channel-day as a legacy JSON array and as NDJSON."""
+    day_dir = os.path.join(directory, str(message_count), "2024-01-01")
+    os.makedirs(day_dir, exist_ok=True)
+    json_path = os.path.join(day_dir, "bench_channel.json")
+    ndjson_path = os.path.join(day_dir, "bench_channel.ndjson")
+
+    with open(json_path, "w", encoding="utf-8") as json_file, \
+            open(ndjson_path, "w", encoding="utf-8") as ndjson_file:
+        json_file.write("[")
+        for i in range(message_count):
+            message = {
+                "id": i,
+                "date": "2024-01-01T00:00:00+00:00",
+                "message": "ፓራሲታሞል 500mg tablets available, call for price. " * 4,
+                "sender_id": None,
+                "has_media": i % 3 == 0,
+                "media_type": "MessageMediaPhoto" if i % 3 == 0 else None,
+                "file": None,
+            }
+            line = json.dumps(message, ensure_ascii=False)
+            json_file.write(("," if i else "") + line)
+            ndjson_file.write(line + "\n")
+        json_file.write("]")
+    return json_path, ndjson_path
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, path):
+    """Runs one measurement and prints the peak RSS in MiB."""
+    if mode == "streaming":
+        from datetime import date
+        from load_json import LOAD_BATCH_SIZE, _csv_batches, valid_messages
+        from raw_io import iter_raw_messages
+        for _ in _csv_batches("bench_channel", date(2024, 1, 1), valid_messages(iter_raw_messages(path), {}),
+                              LOAD_BATCH_SIZE):
+            pass
+    else:
+        # What the loader used to do: json.load the whole file
+        with open(path, "r", encoding="utf-8") as f:
+            json.load(f)
+    print(f"{peak_rss_mb():.1f}")
+
+
+def measure(mode, path):
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [scripts_dir, os.getenv("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, path],
+                            capture_output=True, text=True, check=True, env=env)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main(sizes):
+    print(f"{'messages':>10} {'file MB':>9} {'json.load MB':>13} {'stream .json MB':>16} {'stream .ndjson MB':>18}")
+    with tempfile.TemporaryDirectory() as directory:
+        for message_count in sizes:
+            json_path, ndjson_path = write_synthetic_files(directory, message_count)
+            file_mb = os.path.getsize(json_path) / 1024 / 1024
+            print(f"{message_count:>10} {file_mb:>9.1f} {measure('json.load', json_path):>13.1f} "
+                  f"{measure('streaming', json_path):>16.1f} {measure('streaming', ndjson_path):>18.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,227 @@
+# scripts/detection_queue.py
+
+import os
+import time
+import select
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+load_dotenv()
+
+# Database connection details
+DB_NAME = os.getenv("POSTGRES_DB")
+DB_USER = os.getenv("POSTGRES_USER")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
+DB_PORT = os.getenv("POSTGRES_PORT", "5432")
+
+# NOTIFY channel used to wake the detection worker when images are enqueued
+QUEUE_CHANNEL = "detection_queue"
+# Jobs claimed longer ago than this are assumed orphaned by a dead worker
+STALE_CLAIM_MINUTES = int(os.getenv("DETECTION_QUEUE_STALE_MINUTES", "30"))
+MAX_ATTEMPTS = int(os.getenv("DETECTION_QUEUE_MAX_ATTEMPTS", "3"))
+# A failed job waits this long before it can be claimed again, doubling with each attempt
+RETRY_BACKOFF_SECONDS = float(os.getenv("DETECTION_QUEUE_RETRY_BACKOFF_SECONDS", "60"))
+
+
+def connect_db():
+    """Establishes a connection to the PostgreSQL database."""
+    try:
+        conn = psycopg2.connect(
+            dbname=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            host=DB_HOST,
+            port=DB_PORT
+        )
+        logging.info("Successfully connected to the database for the detection queue.")
+        return conn
+    except psycopg2.Error as e:
+        logging.error(f"Error connecting to database for the detection queue: {e}")
+        raise
+
+
+def create_detection_queue_table(conn):
+    """
+    Creates raw.detection_queue, a Postgres table used as a work queue of images to run
+    object detection on. Workers claim jobs with FOR UPDATE SKIP LOCKED; a pending job is
+    only claimed once its available_at has passed.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS raw;")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw.detection_queue (
+                id BIGSERIAL PRIMARY KEY,
+                image_path VARCHAR(512) NOT NULL UNIQUE,
+                status VARCHAR(16) NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                enqueued_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                claimed_at TIMESTAMP WITH TIME ZONE,
+                finished_at TIMESTAMP WITH TIME ZONE
+            );
+        """)
+        cur.execute("""
+            ALTER TABLE raw.detection_queue
+            ADD COLUMN IF NOT EXISTS available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP;
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_detection_queue_pending
+            ON raw.detection_queue (id) WHERE status = 'pending';
+        """)
+        conn.commit()
+    except psycopg2.Error as e:
+        logging.error(f"Error creating raw.detection_queue table: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def enqueue_images(conn, image_paths):
+    """
+    Adds images to the queue and wakes listening workers. Paths already queued are ignored,
+    except done ones, which are queued again: a replaced file has to be processed again, and
+    the worker skips images whose file is unchanged. Returns the number of queued images.
+    """
+    image_paths = [str(path) for path in image_paths]
+    if not image_paths:
+        return 0
+    cur = conn.cursor()
+    try:
+        execute_values(cur, """
+            INSERT INTO raw.detection_queue (image_path) VALUES %s
+            ON CONFLICT (image_path) DO UPDATE
+            SET status = 'pending', attempts = 0, last_error = NULL,
+                enqueued_at = CURRENT_TIMESTAMP, available_at = CURRENT_TIMESTAMP,
+                claimed_at = NULL, finished_at = NULL
+            WHERE raw.detection_queue.status = 'done'
+        """, [(path,) for path in image_paths], page_size=1000)
+        queued = cur.rowcount
+        cur.execute(f"NOTIFY {QUEUE_CHANNEL};")
+        conn.commit()
+        return queued
+    except psycopg2.Error as e:
+        logging.error(f"Error enqueueing images for detection: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def claim_jobs(conn, limit):
+    """Atomically claims up to `limit` pending jobs. Returns [(job_id, image_path)]."""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            UPDATE raw.detection_queue
+            SET status = 'running', claimed_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM raw.detection_queue
+                WHERE status = 'pending' AND available_at <= CURRENT_TIMESTAMP
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, image_path;
+        """, (limit,))
+        jobs = cur.fetchall()
+        conn.commit()
+        return jobs
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def finish_jobs(conn, done_ids, failed_ids=(), error=None):
+    """
+    Marks jobs done, and failed jobs either failed (after MAX_ATTEMPTS) or back to pending,
+    claimable again after RETRY_BACKOFF_SECONDS * 2^(attempts - 1).
+    """
+    cur = conn.cursor()
+    try:
+        if done_ids:
+            cur.execute("""
+                UPDATE raw.detection_queue
+                SET status = 'done', finished_at = CURRENT_TIMESTAMP, last_error = NULL
+                WHERE id = ANY(%s);
+            """, (list(done_ids),))
+        if failed_ids:
+            cur.execute("""
+                UPDATE raw.detection_queue
+                SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                    available_at = CURRENT_TIMESTAMP + make_interval(secs => %s * power(2, attempts - 1)),
+                    finished_at = CURRENT_TIMESTAMP,
+                    last_error = %s
+                WHERE id = ANY(%s);
+            """, (MAX_ATTEMPTS, RETRY_BACKOFF_SECONDS, error, list(failed_ids)))
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def release_stale_jobs(conn):
+    """Puts jobs claimed by a worker that died mid-batch back in the queue."""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            UPDATE raw.detection_queue
+            SET status = 'pending'
+            WHERE status = 'running' AND claimed_at < CURRENT_TIMESTAMP - make_interval(mins => %s);
+        """, (STALE_CLAIM_MINUTES,))
+        released = cur.rowcount
+        conn.commit()
+        if released:
+            logging.warning(f"Released {released} stale detection jobs back to the queue.")
+        return released
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def listen(conn):
+    """Subscribes a dedicated autocommit connection to queue notifications."""
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    cur = conn.cursor()
+    cur.execute(f"LISTEN {QUEUE_CHANNEL};")
+    cur.close()
+
+
+def wait_for_jobs(conn, timeout):
+    """Blocks until a NOTIFY arrives on a listening connection or `timeout` seconds pass."""
+    if select.select([conn], [], [], timeout) != ([], [], []):
+        conn.poll()
+        conn.notifies.clear()
+        return True
+    return False
+
+
+def wait_until_drained(conn, timeout, poll_seconds=5.0):
+    """
+    Blocks until no job is pending or running, or `timeout` seconds pass.
+    Returns the number of jobs still outstanding (0 once the queue is drained).
+    """
+    deadline = time.monotonic() + timeout
+    cur = conn.cursor()
+    try:
+        while True:
+            cur.execute("SELECT COUNT(*) FROM raw.detection_queue WHERE status IN ('pending', 'running');")
+            outstanding = cur.fetchone()[0]
+            conn.commit()
+            if not outstanding or time.monotonic() >= deadline:
+                return outstanding
+            time.sleep(min(poll_seconds, max(deadline - time.monotonic(), 0)))
+    finally:
+        cur.close()
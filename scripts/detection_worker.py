@@ -0,0 +1,127 @@
+# scripts/detection_worker.py
+#
+# Long-running object detection worker. Loads the YOLO model once and processes images
+# from the raw.detection_queue table as they are enqueued (by the scraper or by
+# `--enqueue-pending`), instead of starting a fresh detector process per pipeline run.
+#
+# Usage:
+#   python scripts/detection_worker.py                  # run forever, woken by NOTIFY
+#   python scripts/detection_worker.py --once           # drain the queue, then exit
+#   python scripts/detection_worker.py --enqueue-pending  # queue undetected images and exit
+#   python scripts/detection_worker.py --enqueue-pending --wait 1800  # ...then wait for the worker
+
+import os
+import signal
+import argparse
+import logging
+from detection_queue import (
+    connect_db, create_detection_queue_table, enqueue_images, claim_jobs, finish_jobs,
+    release_stale_jobs, listen, wait_for_jobs, wait_until_drained
+)
+from yolo_detector import (
+    DETECTOR_BATCH_SIZE, create_detector_tables, load_model, process_images, find_new_images,
+    filter_unprocessed, advance_watermark
+)
+
+# Seconds to wait for a NOTIFY before polling the queue again
+POLL_SECONDS = float(os.getenv("DETECTION_WORKER_POLL_SECONDS", "30"))
+# Jobs claimed per round trip; several inference batches so the prefetcher stays busy
+CLAIM_SIZE = int(os.getenv("DETECTION_WORKER_CLAIM_SIZE", str(DETECTOR_BATCH_SIZE * 4)))
+
+_stopping = False
+
+
+def _request_stop(signum, frame):
+    global _stopping
+    logging.info(f"Received signal {signum}; stopping after the current batch.")
+    _stopping = True
+
+
+def enqueue_pending(conn):
+    """
+    Queues every image the detector has not processed yet, then moves the discovery watermark
+    up to the newest partition scanned: everything below it is now either processed or queued,
+    and the queue retries its own failures, so the next scan can start from there.
+    """
+    new_image_files, watermark, next_watermark = find_new_images(conn)
+    queued = enqueue_images(conn, new_image_files)
+    logging.info(f"Queued {queued} of {len(new_image_files)} unprocessed images for detection.")
+    advance_watermark(conn, watermark, next_watermark)
+
+
+def process_jobs(conn, model, jobs):
+    """Runs detection for one claimed set of jobs and records the outcome on the queue."""
+    paths = list(dict.fromkeys(path for _, path in jobs))
+    todo = filter_unprocessed(conn, paths)
+    finished = set(paths) - set(todo)
+    if todo:
+        finished |= process_images(conn, model, todo)
+
+    done_ids = [job_id for job_id, path in jobs if path in finished]
+    failed_ids = [job_id for job_id, path in jobs if path not in finished]
+    finish_jobs(conn, done_ids, failed_ids, error="detection failed; see worker log")
+    if failed_ids:
+        logging.warning(f"{len(failed_ids)} of {len(jobs)} detection jobs failed.")
+
+
+def run_worker(once=False):
+    """Claims and processes jobs until stopped (or, with `once`, until the queue is empty)."""
+    conn = connect_db()
+    listen_conn = None
+    try:
+        create_detector_tables(conn)
+        create_detection_queue_table(conn)
+        model = load_model()
+        if model is None:
+            return
+
+        if not once:
+            listen_conn = connect_db()
+            listen(listen_conn)
+        release_stale_jobs(conn)
+        logging.info("Detection worker ready.")
+
+        while not _stopping:
+            jobs = claim_jobs(conn, CLAIM_SIZE)
+            if jobs:
+                process_jobs(conn, model, jobs)
+                continue
+            if once:
+                break
+            if not wait_for_jobs(listen_conn, POLL_SECONDS):
+                release_stale_jobs(conn)
+    finally:
+        for connection in (conn, listen_conn):
+            if connection:
+                connection.close()
+        logging.info("Detection worker stopped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Persistent YOLO detection worker.")
+    parser.add_argument("--once", action="store_true", help="Drain the queue and exit.")
+    parser.add_argument("--enqueue-pending", action="store_true",
+                        help="Queue all images not yet processed and exit.")
+    parser.add_argument("--wait", type=float, default=0, metavar="SECONDS",
+                        help="With --enqueue-pending, wait up to SECONDS for the worker to drain the queue.")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    if args.enqueue_pending:
+        enqueue_conn = connect_db()
+        try:
+            create_detector_tables(enqueue_conn)
+            create_detection_queue_table(enqueue_conn)
+            enqueue_pending(enqueue_conn)
+            if args.wait > 0:
+                outstanding = wait_until_drained(enqueue_conn, args.wait)
+                if outstanding:
+                    logging.warning(f"{outstanding} detection jobs still queued after {args.wait:.0f}s.")
+                else:
+                    logging.info("Detection queue drained.")
+        finally:
+            enqueue_conn.close()
+    else:
+        run_worker(once=args.once)
@@ -1,12 +1,19 @@
 # src/load_json.py
 
 import os
+import io
+import csv
 import json
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 from datetime import datetime
 import glob
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from raw_io import RAW_FILE_PATTERNS, iter_raw_messages, raw_file_channel, json_dumps
+from product_matcher import load_product_matcher
 
 # Load environment variables from .env file
 load_dotenv()
@@ -20,6 +27,26 @@ DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 
 RAW_DATA_PATH = "data/raw/telegram_messages"  # This path is relative to /app in Docker container
 
+# "rows" loads one row per message (raw.telegram_message_rows) through COPY, streaming each file;
+# "blob" (legacy) loads each file as one JSONB array (raw.telegram_messages) and holds it in memory.
+# Keep dbt's raw_message_layout var in step with this.
+LOAD_MODE = os.getenv("LOAD_MODE", "rows")
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", "5000"))
+# Set LOAD_FORCE=1 to reload every file regardless of the load manifest
+LOAD_FORCE = os.getenv("LOAD_FORCE", "0") == "1"
+# Number of processes parsing files in parallel (1 = parse and load serially)
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "1"))
+# Extract product/drug mentions into raw.product_mentions as messages are loaded (0 disables)
+PRODUCT_EXTRACTION = os.getenv("PRODUCT_EXTRACTION", "1") == "1"
+
+BLOB_UPSERT_QUERY = sql.SQL("""
+    INSERT INTO raw.telegram_messages (channel_name, message_date, message_json)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (channel_name, message_date) DO UPDATE
+    SET message_json = EXCLUDED.message_json,
+        loaded_at = EXCLUDED.loaded_at;
+""")
+
 
 def connect_db():
     """Establishes a connection to the PostgreSQL database."""
@@ -65,21 +92,49 @@ def create_raw_table(conn):
         cur.close()
 
 
+def message_id(message):
+    """The integer id of a raw message, or None if it is not an object with an integer id."""
+    try:
+        return int(message["id"])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def valid_messages(messages, rejected: dict):
+    """
+    Yields (message_id, message) for the messages with an integer id and counts the others
+    in rejected["invalid"], so every load path drops (rather than fails on) the same messages.
+    """
+    rejected.setdefault("invalid", 0)
+    for message in messages:
+        msg_id = message_id(message)
+        if msg_id is None:
+            rejected["invalid"] += 1
+            continue
+        yield msg_id, message
+
+
 def load_json_to_postgres(conn, file_path):
     """
-    Loads a single JSON file into the raw.telegram_messages table.
+    Loads a single raw message file into the raw.telegram_messages table (LOAD_MODE=blob).
     Assumes file path structure: data/raw/telegram_messages/YYYY-MM-DD/channel_name.json
+    (or channel_name.ndjson[.gz|.zst] for streamed scraper output).
+    The file becomes one JSONB value, so it is held in memory; LOAD_MODE=rows streams instead.
     """
     cur = conn.cursor()
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            messages = json.load(f)
+        # Streamed files may repeat a message after a partial run; keep the latest copy per id
+        rejected = {}
+        messages_by_id = dict(valid_messages(iter_raw_messages(file_path), rejected))
+        messages = list(messages_by_id.values())
+        if rejected["invalid"]:
+            print(f"Skipped {rejected['invalid']} invalid messages in {file_path}.")
 
         # Extract channel_name and date from the file path
         # Example path: data/raw/telegram_messages/2024-07-14/chemed_channel.json
         parts = file_path.split(os.sep)
         date_str = parts[-2]  # YYYY-MM-DD
-        channel_name_raw = parts[-1].replace('.json', '')  # channel_name
+        channel_name_raw = raw_file_channel(parts[-1])  # channel_name
 
         message_date = datetime.strptime(date_str, '%Y-%m-%d').date()
 
@@ -92,19 +147,256 @@ def load_json_to_postgres(conn, file_path):
         # Let's adjust this to load the *entire file content* as a single JSONB blob per channel/date file.
         # This keeps the raw structure truly raw. dbt will then extract individual messages.
 
-        # Prepare the insert statement
-        insert_query = sql.SQL("""
-            INSERT INTO raw.telegram_messages (channel_name, message_date, message_json)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (channel_name, message_date) DO UPDATE
-            SET message_json = EXCLUDED.message_json,
-                loaded_at = EXCLUDED.loaded_at;
-        """)
-
         # Execute the insert
-        cur.execute(insert_query, (channel_name_raw, message_date, json.dumps(messages)))
+        cur.execute(BLOB_UPSERT_QUERY, (channel_name_raw, message_date, json.dumps(messages)))
+        if PRODUCT_EXTRACTION:
+            # A blob is rewritten as a whole, so all of its messages are rescanned
+            write_product_mentions(cur, *extract_product_mentions(
+                (channel_name_raw, msg_id, message_text(m)) for msg_id, m in messages_by_id.items()))
         print(f"Loaded/Updated {file_path} into raw.telegram_messages.")
         conn.commit()
+        return True
+
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON from {file_path}: {e}")
+        conn.rollback()
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        conn.rollback()
+    finally:
+        cur.close()
+    return False
+
+
+def create_product_mentions_table(conn):
+    """
+    Creates raw.product_mentions: one row per (message, product) found by the dictionary
+    matcher, with the number of times the product is mentioned in the message, and
+    raw.product_mention_scans: one row per message scanned, with when it was last scanned
+    (including messages with no mentions, so fct_product_mentions can drop their old ones).
+    On first creation the scans are seeded from the messages already in raw.product_mentions.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS raw;")
+        cur.execute("SELECT to_regclass('raw.product_mention_scans') IS NULL;")
+        first_creation = cur.fetchone()[0]
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw.product_mentions (
+                channel_name VARCHAR(255) NOT NULL,
+                message_id BIGINT NOT NULL,
+                product_id INTEGER NOT NULL,
+                mention_count INTEGER NOT NULL,
+                extracted_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (channel_name, message_id, product_id)
+            );
+        """)
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_product_mentions_extracted_at ON raw.product_mentions (extracted_at);")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw.product_mention_scans (
+                channel_name VARCHAR(255) NOT NULL,
+                message_id BIGINT NOT NULL,
+                scanned_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (channel_name, message_id)
+            );
+        """)
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_product_mention_scans_scanned_at ON raw.product_mention_scans (scanned_at);")
+        if first_creation:
+            cur.execute("""
+                INSERT INTO raw.product_mention_scans (channel_name, message_id, scanned_at)
+                SELECT channel_name, message_id, MAX(extracted_at)
+                FROM raw.product_mentions
+                GROUP BY channel_name, message_id
+                ON CONFLICT (channel_name, message_id) DO NOTHING;
+            """)
+        conn.commit()
+        print("Ensured raw.product_mentions and raw.product_mention_scans tables exist.")
+    except psycopg2.Error as e:
+        print(f"Error creating table: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+_product_matcher = None
+
+
+def get_product_matcher():
+    """Builds the product matcher once per process; None if extraction is off or the dictionary is missing."""
+    global _product_matcher
+    if _product_matcher is None:
+        _product_matcher = False
+        if PRODUCT_EXTRACTION:
+            try:
+                _product_matcher = load_product_matcher()
+            except OSError as e:
+                print(f"Product dictionary not available, skipping mention extraction: {e}")
+    return _product_matcher or None
+
+
+def message_text(message):
+    """The text of a raw message (the scraper stores it under 'message')."""
+    return message.get("message") or message.get("text") or ""
+
+
+def extract_product_mentions(messages):
+    """
+    Runs the product matcher once over each (channel_name, message_id, text).
+    Returns (the message keys scanned, raw.product_mentions rows); needs no database.
+    """
+    matcher = get_product_matcher()
+    if matcher is None:
+        return [], []
+    keys = []
+    mention_rows = []
+    for channel_name, message_id, text in messages:
+        keys.append((channel_name, message_id))
+        for product_id, count in matcher.count_mentions(text).items():
+            mention_rows.append((channel_name, message_id, product_id, count))
+    return keys, mention_rows
+
+
+def write_product_mentions(cur, keys, mention_rows):
+    """
+    Replaces the stored mentions of the scanned messages, so edited messages lose stale mentions,
+    and records the scans in raw.product_mention_scans (messages left with no mentions included).
+    """
+    if not keys:
+        return
+    execute_values(cur, """
+        INSERT INTO raw.product_mention_scans (channel_name, message_id) VALUES %s
+        ON CONFLICT (channel_name, message_id) DO UPDATE SET scanned_at = EXCLUDED.scanned_at
+    """, list(dict.fromkeys(keys)), page_size=1000)
+    cur.execute("""
+        DELETE FROM raw.product_mentions pm
+        USING UNNEST(%s::varchar[], %s::bigint[]) AS scanned (channel_name, message_id)
+        WHERE pm.channel_name = scanned.channel_name AND pm.message_id = scanned.message_id;
+    """, ([channel_name for channel_name, _ in keys], [message_id for _, message_id in keys]))
+    if mention_rows:
+        execute_values(cur, """
+            INSERT INTO raw.product_mentions (channel_name, message_id, product_id, mention_count) VALUES %s
+        """, mention_rows, page_size=1000)
+
+
+def create_message_rows_table(conn):
+    """
+    Creates raw.telegram_message_rows (one row per Telegram message) if it doesn't exist.
+    A message scraped on several days is stored once, keyed by (channel_name, message_id).
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS raw;")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw.telegram_message_rows (
+                id BIGSERIAL PRIMARY KEY,
+                channel_name VARCHAR(255) NOT NULL,
+                message_id BIGINT NOT NULL,
+                message_date DATE NOT NULL,
+                message_json JSONB NOT NULL,
+                loaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                CONSTRAINT unique_channel_message UNIQUE (channel_name, message_id)
+            );
+        """)
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_telegram_message_rows_loaded_at ON raw.telegram_message_rows (loaded_at);")
+        conn.commit()
+        print("Ensured raw.telegram_message_rows table exists.")
+    except psycopg2.Error as e:
+        print(f"Error creating table: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def _csv_batches(channel_name, message_date, messages, batch_size):
+    """
+    Encodes (message_id, message) pairs from valid_messages() as CSV payloads of `batch_size`
+    rows, ready for COPY into the staging table.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows = 0
+    for msg_id, message in messages:
+        writer.writerow((channel_name, msg_id, message_date.isoformat(), json_dumps(message)))
+        rows += 1
+        if rows >= batch_size:
+            yield buffer.getvalue()
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            rows = 0
+    if rows:
+        yield buffer.getvalue()
+
+
+def _copy_and_merge_batch(cur, csv_payload):
+    """
+    COPYs one CSV batch of (channel_name, message_id, message_date, message_json) rows into the
+    session's staging table and merges it into raw.telegram_message_rows with a single statement.
+    Unchanged messages are left alone so their loaded_at does not move, and only the inserted
+    or updated messages are scanned for product mentions.
+    Returns the number of inserted or updated rows.
+    """
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS stage_telegram_message_rows (
+            channel_name VARCHAR(255),
+            message_id BIGINT,
+            message_date DATE,
+            message_json JSONB
+        );
+    """)
+    cur.execute("TRUNCATE stage_telegram_message_rows;")
+    cur.copy_expert(
+        "COPY stage_telegram_message_rows (channel_name, message_id, message_date, message_json) "
+        "FROM STDIN WITH (FORMAT csv)",
+        io.StringIO(csv_payload)
+    )
+
+    cur.execute("""
+        INSERT INTO raw.telegram_message_rows (channel_name, message_id, message_date, message_json)
+        SELECT DISTINCT ON (channel_name, message_id)
+            channel_name, message_id, message_date, message_json
+        FROM stage_telegram_message_rows
+        ORDER BY channel_name, message_id, message_date DESC
+        ON CONFLICT (channel_name, message_id) DO UPDATE
+        SET message_json = EXCLUDED.message_json,
+            loaded_at = CURRENT_TIMESTAMP
+        WHERE raw.telegram_message_rows.message_json IS DISTINCT FROM EXCLUDED.message_json
+        RETURNING channel_name, message_id, COALESCE(message_json ->> 'message', message_json ->> 'text', '');
+    """)
+    merged_rows = cur.fetchall()
+    if PRODUCT_EXTRACTION:
+        write_product_mentions(cur, *extract_product_mentions(merged_rows))
+    return len(merged_rows)
+
+
+def load_json_rows_to_postgres(conn, file_path):
+    """
+    Loads a single raw message file into raw.telegram_message_rows, one row per message,
+    in batches of LOAD_BATCH_SIZE (COPY into staging + one merge per batch).
+    Messages are streamed from the file, so peak memory depends on the batch size,
+    not on the file size. The file is committed as a whole.
+    """
+    cur = conn.cursor()
+    try:
+        parts = file_path.split(os.sep)
+        message_date = datetime.strptime(parts[-2], '%Y-%m-%d').date()
+        channel_name_raw = raw_file_channel(parts[-1])
+
+        merged = 0
+        rejected = {}
+        for csv_payload in _csv_batches(channel_name_raw, message_date,
+                                        valid_messages(iter_raw_messages(file_path), rejected), LOAD_BATCH_SIZE):
+            merged += _copy_and_merge_batch(cur, csv_payload)
+
+        conn.commit()
+        if rejected["invalid"]:
+            print(f"Skipped {rejected['invalid']} invalid messages in {file_path}.")
+        print(f"Loaded {file_path} into raw.telegram_message_rows ({merged} new or changed messages).")
+        return True
 
     except json.JSONDecodeError as e:
         print(f"Error decoding JSON from {file_path}: {e}")
@@ -114,26 +406,233 @@ def load_json_to_postgres(conn, file_path):
         conn.rollback()
     finally:
         cur.close()
+    return False
+
+
+def parse_raw_file(file_path, load_mode):
+    """
+    Reads, decodes and validates one raw file without touching the database, so it can run
+    in a worker process. Messages that are not objects with an integer id are dropped.
+    Returns a dict the single writer turns into SQL: the JSON array text for blob mode,
+    or ready-to-COPY CSV batches for rows mode. Errors are returned, not raised.
+    The whole file is held by the worker; very large channel dumps are better loaded
+    by the serial, streaming rows path (LOAD_WORKERS=1).
+    """
+    try:
+        parts = file_path.split(os.sep)
+        channel_name = raw_file_channel(parts[-1])
+        message_date = datetime.strptime(parts[-2], '%Y-%m-%d').date()
+
+        rejected = {}
+        messages = dict(valid_messages(iter_raw_messages(file_path), rejected))
+
+        parsed = {"file_path": file_path, "channel_name": channel_name, "message_date": message_date,
+                  "message_count": len(messages), "invalid_count": rejected["invalid"]}
+        if load_mode == "rows":
+            parsed["csv_batches"] = list(_csv_batches(channel_name, message_date, messages.items(),
+                                                      LOAD_BATCH_SIZE))
+        else:
+            parsed["message_json"] = json_dumps(list(messages.values()))
+            if PRODUCT_EXTRACTION:
+                # Matching runs here in the worker; rows mode matches the merged rows in the writer instead
+                parsed["product_mentions"] = extract_product_mentions(
+                    (channel_name, message_id, message_text(message)) for message_id, message in messages.items())
+        return parsed
+    except Exception as e:
+        return {"file_path": file_path, "error": f"{type(e).__name__}: {e}"}
+
+
+def write_parsed_file(conn, parsed):
+    """Writes the output of parse_raw_file() over the single writer connection and commits it."""
+    file_path = parsed["file_path"]
+    if "error" in parsed:
+        print(f"Error processing {file_path}: {parsed['error']}")
+        return False
+    if parsed["invalid_count"]:
+        print(f"Skipped {parsed['invalid_count']} invalid messages in {file_path}.")
+
+    cur = conn.cursor()
+    try:
+        if "csv_batches" in parsed:
+            merged = sum(_copy_and_merge_batch(cur, payload) for payload in parsed["csv_batches"])
+            print(f"Loaded {file_path} into raw.telegram_message_rows ({merged} new or changed messages).")
+        else:
+            cur.execute(BLOB_UPSERT_QUERY, (parsed["channel_name"], parsed["message_date"], parsed["message_json"]))
+            if "product_mentions" in parsed:
+                write_product_mentions(cur, *parsed["product_mentions"])
+            print(f"Loaded/Updated {file_path} into raw.telegram_messages.")
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cur.close()
+
+
+def iter_parsed_files(file_paths, load_mode, workers):
+    """
+    Parses files in a process pool and yields the results as they complete.
+    At most 2 * workers files are in flight, so memory stays bounded during backfills.
+    """
+    file_paths = iter(file_paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        while True:
+            for file_path in file_paths:
+                pending.add(executor.submit(parse_raw_file, file_path, load_mode))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def create_load_manifest_table(conn):
+    """
+    Creates raw.load_manifest, which records every raw file already loaded (per load mode)
+    with the size, mtime and content hash it had at the time.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS raw;")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw.load_manifest (
+                file_path VARCHAR(1024) NOT NULL,
+                load_mode VARCHAR(16) NOT NULL,
+                size_bytes BIGINT NOT NULL,
+                mtime DOUBLE PRECISION NOT NULL,
+                content_hash CHAR(64) NOT NULL,
+                loaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (file_path, load_mode)
+            );
+        """)
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"Error creating load manifest table: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def get_load_manifest(conn, load_mode):
+    """Returns {file_path: (size_bytes, mtime, content_hash)} for files already loaded in `load_mode`."""
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT file_path, size_bytes, mtime, content_hash FROM raw.load_manifest WHERE load_mode = %s;",
+            (load_mode,)
+        )
+        return {row[0]: (row[1], row[2], row[3]) for row in cur.fetchall()}
+    finally:
+        cur.close()
+
+
+def record_loaded_file(conn, file_path, load_mode, size_bytes, mtime, content_hash):
+    """Upserts the manifest entry for a successfully loaded (or verified unchanged) file."""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO raw.load_manifest (file_path, load_mode, size_bytes, mtime, content_hash)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (file_path, load_mode) DO UPDATE
+            SET size_bytes = EXCLUDED.size_bytes,
+                mtime = EXCLUDED.mtime,
+                content_hash = EXCLUDED.content_hash,
+                loaded_at = CURRENT_TIMESTAMP;
+        """, (file_path, load_mode, size_bytes, mtime, content_hash))
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"Error recording {file_path} in load manifest: {e}")
+        conn.rollback()
+    finally:
+        cur.close()
+
+
+def file_content_hash(file_path, chunk_size=1024 * 1024):
+    """SHA-256 of the file contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_needs_load(conn, manifest, file_path, load_mode):
+    """
+    Checks a file against the load manifest. Size + mtime unchanged means the file is skipped
+    without reading it; otherwise the content hash decides (a touched but identical file only
+    gets its manifest entry refreshed). Returns (needs_load, size, mtime, content_hash).
+    """
+    stat = os.stat(file_path)
+    known = manifest.get(file_path)
+    if known and known[0] == stat.st_size and known[1] == stat.st_mtime:
+        return False, stat.st_size, stat.st_mtime, known[2]
+
+    content_hash = file_content_hash(file_path)
+    if known and known[2] == content_hash:
+        record_loaded_file(conn, file_path, load_mode, stat.st_size, stat.st_mtime, content_hash)
+        return False, stat.st_size, stat.st_mtime, content_hash
+    return True, stat.st_size, stat.st_mtime, content_hash
 
 
 def process_raw_data_lake():
     """
     Scans the raw data lake directory and loads new/updated JSON files into PostgreSQL.
+    Files recorded in raw.load_manifest with the same size/mtime or content hash are skipped.
     """
     conn = None
     try:
         conn = connect_db()
-        create_raw_table(conn)
+        if LOAD_MODE == "rows":
+            create_message_rows_table(conn)
+            load_file = load_json_rows_to_postgres
+        else:
+            create_raw_table(conn)
+            load_file = load_json_to_postgres
+        # Created even with extraction off: fct_messages reads it
+        create_product_mentions_table(conn)
+        create_load_manifest_table(conn)
+        manifest = {} if LOAD_FORCE else get_load_manifest(conn, LOAD_MODE)
 
-        # Find all JSON files in the raw data lake
-        json_files = glob.glob(os.path.join(RAW_DATA_PATH, '**', '*.json'), recursive=True)
+        # Find all raw message files (JSON arrays and NDJSON, compressed or not) in the raw data lake
+        json_files = []
+        for pattern in RAW_FILE_PATTERNS:
+            json_files.extend(glob.glob(os.path.join(RAW_DATA_PATH, '**', pattern), recursive=True))
 
         if not json_files:
-            print(f"No JSON files found in {RAW_DATA_PATH}. Ensure Task 1 is complete.")
+            print(f"No raw message files found in {RAW_DATA_PATH}. Ensure Task 1 is complete.")
             return
 
+        loaded = skipped = 0
+        to_load = {}
         for file_path in json_files:
-            load_json_to_postgres(conn, file_path)
+            needs_load, size_bytes, mtime, content_hash = file_needs_load(conn, manifest, file_path, LOAD_MODE)
+            if not needs_load:
+                skipped += 1
+                continue
+            to_load[file_path] = (size_bytes, mtime, content_hash)
+
+        if LOAD_WORKERS > 1 and len(to_load) > 1:
+            # Parse in worker processes, write everything over this one connection
+            print(f"Parsing {len(to_load)} files with {LOAD_WORKERS} worker processes.")
+            results = (
+                (parsed["file_path"], write_parsed_file(conn, parsed))
+                for parsed in iter_parsed_files(list(to_load), LOAD_MODE, LOAD_WORKERS)
+            )
+        else:
+            results = ((file_path, load_file(conn, file_path)) for file_path in to_load)
+
+        for file_path, succeeded in results:
+            if succeeded:
+                record_loaded_file(conn, file_path, LOAD_MODE, *to_load[file_path])
+                loaded += 1
+
+        print(f"Loaded {loaded} new or changed files, skipped {skipped} unchanged files.")
 
     except Exception as e:
         print(f"An error occurred during raw data processing: {e}")
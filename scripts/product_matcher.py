@@ -0,0 +1,112 @@
+# scripts/product_matcher.py
+
+import os
+import csv
+from collections import deque
+
+# The dbt seed is the single source of truth for the dictionary
+PRODUCT_DICTIONARY_PATH = os.getenv(
+    "PRODUCT_DICTIONARY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "telegram_data_dbt", "seeds",
+                 "product_dictionary.csv")
+)
+
+
+def _normalize(text: str) -> str:
+    return text.lower()
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    """True if `index` is outside `text` or not a letter/digit (Ethiopic letters count as letters)."""
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+class ProductMatcher:
+    """
+    Aho-Corasick automaton over product aliases: finds every alias in a text in one pass,
+    in time linear in the text length (plus matches), however many aliases there are.
+
+    Matching is case-insensitive and on whole words only. Where aliases overlap, the
+    leftmost-longest match wins ("vitamin c" rather than "vitamin").
+    """
+
+    def __init__(self, aliases):
+        """`aliases` is an iterable of (alias, product_id)."""
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]  # per state: (alias length, product_id) for every alias ending here
+        self.alias_count = 0
+        for alias, product_id in aliases:
+            key = _normalize(alias.strip())
+            if not key:
+                continue
+            state = 0
+            for ch in key:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][ch] = next_state
+                state = next_state
+            self._out[state].append((len(key), product_id))
+            self.alias_count += 1
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())  # depth-1 states fail to the root
+        while queue:
+            state = queue.popleft()
+            for ch, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text: str):
+        """Returns non-overlapping (start, end, product_id) matches in the lower-cased `text`."""
+        if not text:
+            return []
+        text = _normalize(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        candidates = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, product_id in out[state]:
+                start = i - length + 1
+                if _is_boundary(text, start - 1) and _is_boundary(text, i + 1):
+                    candidates.append((start, i + 1, product_id))
+
+        matches = []
+        last_end = 0
+        for start, end, product_id in sorted(candidates, key=lambda m: (m[0], m[0] - m[1])):
+            if start >= last_end:
+                matches.append((start, end, product_id))
+                last_end = end
+        return matches
+
+    def count_mentions(self, text: str) -> dict:
+        """Returns {product_id: number of mentions} for `text`."""
+        counts = {}
+        for _, _, product_id in self.find(text):
+            counts[product_id] = counts.get(product_id, 0) + 1
+        return counts
+
+
+def load_product_matcher(path=PRODUCT_DICTIONARY_PATH) -> ProductMatcher:
+    """Builds a matcher from the product dictionary seed (product_id, product_name, alias, category)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        aliases = []
+        for row in csv.DictReader(f):
+            product_id = int(row["product_id"])
+            aliases.append((row["alias"], product_id))
+            # The canonical name always matches, even if it is not listed as an alias
+            aliases.append((row["product_name"], product_id))
+    return ProductMatcher(dict.fromkeys(aliases))
@@ -0,0 +1,352 @@
+# scripts/raw_io.py
+
+import os
+import json
+import gzip
+import zlib
+from pathlib import Path
+import logging
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+_ZSTD_ERRORS = (zstandard.ZstdError,) if zstandard is not None else ()
+
+try:
+    import orjson
+except ImportError:  # faster JSON codec is optional
+    orjson = None
+
+
+def json_loads(data):
+    """Decodes JSON with orjson when it is installed, falling back to the standard library."""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def json_dumps(obj) -> str:
+    """Encodes to compact, non-ASCII-escaped JSON (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False)
+
+
+# File name suffixes for every raw message file layout we read or write
+COMPRESSION_SUFFIXES = {
+    "none": ".ndjson",
+    "gzip": ".ndjson.gz",
+    "zstd": ".ndjson.zst",
+}
+RAW_FILE_SUFFIXES = (".json",) + tuple(COMPRESSION_SUFFIXES.values())
+RAW_FILE_PATTERNS = tuple(f"*{suffix}" for suffix in RAW_FILE_SUFFIXES)
+
+
+def raw_file_suffix(path) -> str:
+    """Returns the raw-data-lake suffix of `path` (e.g. '.ndjson.gz'), or '' if it is not a raw file."""
+    name = os.path.basename(str(path))
+    # Longest first so '.ndjson.gz' wins over a bare '.gz'
+    for suffix in sorted(RAW_FILE_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix):
+            return suffix
+    return ""
+
+
+def raw_file_channel(path) -> str:
+    """Extracts the channel name from a raw file name such as 'CheMeds.ndjson.gz'."""
+    name = os.path.basename(str(path))
+    suffix = raw_file_suffix(name)
+    return name[:-len(suffix)] if suffix else name
+
+
+# Complete lines are flushed and fsynced to disk at least every this many messages
+NDJSON_SYNC_EVERY = int(os.getenv("NDJSON_SYNC_EVERY", "100"))
+
+
+def _ends_cleanly(path, compression: str) -> bool:
+    """True if the file holds only complete lines in complete gzip members / zstd frames."""
+    status = {}
+    last = b""
+    for chunk in _iter_decoded_chunks(path, COMPRESSION_SUFFIXES[compression], status):
+        last = chunk
+    return status["clean"] and (not last or last.endswith(b"\n"))
+
+
+class NdjsonMessageWriter:
+    """
+    Appends one JSON message per line to `path`, optionally gzip/zstd compressed. Every
+    `sync_every` messages the compressor is sync-flushed and the file fsynced, so the file
+    is usable by the loader at any time: a killed scraper leaves every synced message
+    readable, followed at most by a truncated tail that iter_raw_messages skips.
+
+    Each run appends a new gzip member / zstd frame to the file of an earlier run the same
+    day; concatenated members are still valid streams. If that earlier run was killed
+    mid-write, the file is first rewritten from its complete messages, so new data never
+    follows a truncated stream. A `<path>.part` left by older versions of this writer is
+    recovered the same way.
+    """
+
+    def __init__(self, path, compression: str = "none", sync_every: int = NDJSON_SYNC_EVERY):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unsupported compression '{compression}'. Use one of {list(COMPRESSION_SUFFIXES)}.")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package.")
+
+        self.path = Path(path)
+        self.compression = compression
+        self.sync_every = max(sync_every, 1)
+        self.count = 0
+
+        legacy_part = self.path.with_name(self.path.name + ".part")
+        if legacy_part.exists():
+            # The part file started with a copy of `path`, so it supersedes it
+            self._rewrite(legacy_part)
+            legacy_part.unlink()
+        elif self.path.exists() and not _ends_cleanly(self.path, compression):
+            self._rewrite(self.path)
+
+        self._raw = open(self.path, "ab")
+        self._stream = self._open_stream(self._raw)
+
+    def _open_stream(self, raw):
+        if self.compression == "gzip":
+            return gzip.GzipFile(fileobj=raw, mode="wb")
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        return raw
+
+    def _rewrite(self, source: Path):
+        """Replaces `path` with the complete messages of `source`, re-encoded as one clean stream."""
+        tmp_path = self.path.with_name(self.path.name + ".repair")
+        kept = 0
+        with open(tmp_path, "wb") as raw:
+            stream = self._open_stream(raw)
+            for message in iter_raw_messages(source, suffix=COMPRESSION_SUFFIXES[self.compression]):
+                stream.write(json_dumps(message).encode("utf-8") + b"\n")
+                kept += 1
+            if stream is not raw:
+                stream.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, self.path)
+        logging.warning(f"Recovered {kept} complete messages from interrupted raw file {source}.")
+
+    def write(self, message: dict):
+        self._stream.write(json_dumps(message).encode("utf-8") + b"\n")
+        self.count += 1
+        if self.count % self.sync_every == 0:
+            self.sync()
+
+    def sync(self):
+        """Makes every message written so far durable and readable."""
+        if self.compression == "gzip":
+            self._stream.flush()  # Z_SYNC_FLUSH: the compressed data decodes up to this point
+        elif self.compression == "zstd":
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+
+    def close(self):
+        """Finishes the compressed stream and syncs the file."""
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Close even on failure: every complete line is a usable message
+        self.close()
+        return False
+
+
+def _new_decompressor(suffix: str):
+    if suffix == ".ndjson.gz":
+        return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def _salvage(decompressor, data: bytes) -> bytes:
+    """Decodes gzip `data` up to its first corrupt byte (the whole chunk fails in one call)."""
+    decoded = []
+    for step in (512, 1):
+        for start in range(0, len(data), step):
+            piece = data[start:start + step]
+            attempt = decompressor.copy()
+            try:
+                decoded.append(attempt.decompress(piece))
+            except zlib.error:
+                data = data[start:]
+                break
+            decompressor = attempt
+            if decompressor.eof:
+                return b"".join(decoded)
+        else:
+            break
+    return b"".join(decoded)
+
+
+def _salvage_zstd(path, skip: int, read_size: int = 512):
+    """
+    Re-decodes a zstd file whose tail is corrupt in small reads, across frames, and yields what
+    decodes before the error, after the first `skip` bytes (already yielded by the caller).
+    Only the block the corruption is in is lost.
+    """
+    with open(path, "rb") as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        try:
+            while True:
+                piece = reader.read(read_size)
+                if not piece:
+                    return
+                if skip >= len(piece):
+                    skip -= len(piece)
+                    continue
+                yield piece[skip:]
+                skip = 0
+        except zstandard.ZstdError:
+            return
+
+
+def _iter_decoded_chunks(path, suffix: str, status: dict = None, chunk_size: int = 64 * 1024):
+    """
+    Yields the decompressed bytes of an NDJSON file in chunks, across concatenated gzip
+    members / zstd frames. Decoding stops quietly at a truncated or corrupt tail, after
+    yielding everything before it; `status["clean"]` then tells whether the file ended cleanly.
+    """
+    if status is None:
+        status = {}
+    status["clean"] = True
+    if suffix == ".ndjson.zst" and zstandard is None:
+        raise RuntimeError(f"Reading {path} requires the 'zstandard' package.")
+
+    with open(path, "rb") as f:
+        if suffix not in (".ndjson.gz", ".ndjson.zst"):
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+        decompressor = _new_decompressor(suffix)
+        in_member = False
+        decoded_bytes = 0
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                status["clean"] = not in_member
+                return
+            while data:
+                in_member = True
+                checkpoint = decompressor.copy() if hasattr(decompressor, "copy") else None
+                try:
+                    chunk = decompressor.decompress(data)
+                except (zlib.error, *_ZSTD_ERRORS):
+                    status["clean"] = False
+                    if checkpoint is not None:
+                        yield _salvage(checkpoint, data)
+                    else:
+                        yield from _salvage_zstd(path, decoded_bytes)
+                    return
+                if chunk:
+                    decoded_bytes += len(chunk)
+                    yield chunk
+                if not decompressor.eof:
+                    break
+                # Member / frame finished; the rest of `data` starts the next one
+                data = decompressor.unused_data
+                decompressor = _new_decompressor(suffix)
+                in_member = False
+
+
+def iter_json_array(f, chunk_size: int = 64 * 1024):
+    """
+    Incrementally decodes a top-level JSON array from text stream `f`, yielding one element
+    at a time. Only the current chunk and the element being decoded are held in memory,
+    so a multi-GB legacy .json dump is read with constant memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    def _fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+        return not eof
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n":
+            pos += 1
+        if pos >= len(buf):
+            if not _fill():
+                if started:
+                    raise json.JSONDecodeError("Unterminated JSON array", buf, pos)
+                return
+            continue
+
+        if not started:
+            if buf[pos] != "[":
+                raise json.JSONDecodeError("Expected a JSON array", buf, pos)
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+        if buf[pos] == ",":
+            pos += 1
+            continue
+
+        try:
+            element, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # Element continues in the next chunk
+            if not _fill():
+                raise
+            continue
+        after = end
+        while after < len(buf) and buf[after] in " \t\r\n":
+            after += 1
+        if after >= len(buf) or buf[after] not in ",]":
+            # A number at the chunk boundary may still be cut short ("12" of "123", "7" of "7.25")
+            if not eof and _fill():
+                continue
+            if after < len(buf):
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, after)
+        yield element
+        pos = end
+
+
+def iter_raw_messages(path, suffix: str = None):
+    """
+    Yields the messages stored in a raw file, whatever its layout:
+    a legacy JSON array (.json) or NDJSON, plain or gzip/zstd compressed.
+    Files are read incrementally, one message at a time.
+    A truncated last line or compressed stream (e.g. from a killed scraper) is skipped.
+    `suffix` overrides the layout detected from the file name.
+    """
+    suffix = suffix or raw_file_suffix(path)
+    if suffix == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            yield from iter_json_array(f)
+        return
+
+    pending = b""
+    for chunk in _iter_decoded_chunks(path, suffix):
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json_loads(line)
+    if pending.strip():
+        try:
+            yield json_loads(pending)
+        except json.JSONDecodeError:  # orjson's error subclasses it too
+            # Half-written final line; everything before it is intact
+            return
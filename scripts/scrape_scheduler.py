@@ -0,0 +1,145 @@
+# scripts/scrape_scheduler.py
+
+import asyncio
+import itertools
+import time
+from loguru import logger
+from telethon.errors import FloodError
+
+
+def throttle_delay(exc: Exception):
+    """
+    Returns how many seconds Telegram asked us to wait if `exc` is a rate-limit error
+    (FloodWaitError and the other 420 FLOOD errors), otherwise None.
+    Matching on the class name as well keeps fake clients in local tests simple.
+    """
+    if isinstance(exc, FloodError) or "FloodWait" in type(exc).__name__:
+        return float(getattr(exc, "seconds", 0) or 0)
+    return None
+
+
+class TokenBucket:
+    """
+    Token bucket shared by everything that talks to one Telegram session.
+
+    The refill rate adapts AIMD-style: every throttle halves it and pauses the bucket
+    for the wait Telegram requested, every successful channel nudges it back up
+    towards `max_rate`. That keeps us close to the largest rate Telegram tolerates.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, max_rate: float = None, min_rate: float = 0.05,
+                 increase: float = 0.1, clock=time.monotonic):
+        self.rate = rate
+        self.max_rate = max_rate or rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.capacity = capacity or max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """Waits until `tokens` are available (and any flood wait has expired), then takes them."""
+        async with self._lock:
+            while True:
+                now = self._clock()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def on_throttled(self, wait_seconds: float):
+        """Pauses the bucket for `wait_seconds` and halves the refill rate."""
+        now = self._clock()
+        self._blocked_until = max(self._blocked_until, now + wait_seconds)
+        self._tokens = 0.0
+        self._updated = now
+        self.rate = max(self.min_rate, self.rate / 2)
+        logger.warning(f"Throttled by Telegram: pausing {wait_seconds:.0f}s, rate now {self.rate:.2f} req/s")
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+class ChannelScheduler:
+    """
+    Runs `scrape_fn(name, url, rate_limiter=bucket)` for every channel with bounded concurrency.
+
+    Channels are ordered by `priority(name)` (higher first, e.g. messages/hour from the
+    cursor store). A channel that hits FloodWait is not lost: the bucket is paused and
+    the channel is requeued behind the wait, up to `max_attempts` times, with exponential
+    backoff when Telegram does not say how long to wait. Any other error fails the channel.
+
+    `scrape_fn` is injected so the scheduler can be driven by a fake Telethon client.
+    """
+
+    def __init__(self, scrape_fn, bucket: TokenBucket, max_concurrency: int = 1, max_attempts: int = 5,
+                 priority=None, base_backoff: float = 5.0):
+        self.scrape_fn = scrape_fn
+        self.bucket = bucket
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.priority = priority or (lambda name: 0.0)
+        self.base_backoff = base_backoff
+        self._sequence = itertools.count()
+
+    async def run(self, channels: dict) -> dict:
+        """
+        Scrapes all `channels` ({name: url}) and returns {name: (message_count, seconds)}.
+        Channels that fail permanently report a count of None.
+        """
+        queue = asyncio.PriorityQueue()
+        results = {}
+        for name, url in channels.items():
+            # (not_before, -priority, seq) -> fresh, fast-changing channels first
+            queue.put_nowait((0.0, -self.priority(name), next(self._sequence), name, url, 1))
+
+        async def _worker():
+            while True:
+                not_before, neg_priority, _, name, url, attempt = await queue.get()
+                try:
+                    delay = not_before - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    started = time.perf_counter()
+                    try:
+                        count = await self.scrape_fn(name, url, rate_limiter=self.bucket)
+                    except Exception as e:
+                        wait = throttle_delay(e)
+                        if wait is None:
+                            logger.error(f"Failed to scrape {name}: {e}")
+                            results[name] = (None, time.perf_counter() - started)
+                            continue
+                        wait = wait or self.base_backoff * 2 ** (attempt - 1)
+                        self.bucket.on_throttled(wait)
+                        if attempt >= self.max_attempts:
+                            logger.error(f"Giving up on {name} after {attempt} throttled attempts")
+                            results[name] = (None, time.perf_counter() - started)
+                            continue
+                        logger.info(f"Requeueing {name} in {wait:.0f}s (attempt {attempt + 1}/{self.max_attempts})")
+                        queue.put_nowait((time.monotonic() + wait, neg_priority, next(self._sequence),
+                                          name, url, attempt + 1))
+                        continue
+                    self.bucket.on_success()
+                    results[name] = (count, time.perf_counter() - started)
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(_worker()) for _ in range(self.max_concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return results
@@ -0,0 +1,100 @@
+# scripts/scrape_state.py
+
+import os
+import json
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Local state shared between scraper runs
+STATE_DIR = Path(os.getenv("SCRAPER_STATE_DIR", "data/state"))
+CURSOR_FILE = STATE_DIR / "scrape_cursors.json"
+MEDIA_INDEX_FILE = STATE_DIR / "media_index.json"
+
+
+def _atomic_write_json(path: Path, payload):
+    """Writes `payload` to `path` through a temp file + rename so a crash never leaves half a file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class CursorStore:
+    """
+    Per-channel high-water marks persisted in a JSON file keyed by channel name.
+    Each entry records the last Telegram message id that was successfully written,
+    so later runs only need to fetch messages newer than it (`min_id`).
+    """
+
+    def __init__(self, path: Path = CURSOR_FILE):
+        self.path = Path(path)
+        self._cursors = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._cursors = json.load(f)
+
+    def get(self, channel_name: str):
+        """Returns the last message id seen for `channel_name`, or None on the first run."""
+        entry = self._cursors.get(channel_name)
+        return entry["last_message_id"] if entry else None
+
+    def change_rate(self, channel_name: str) -> float:
+        """
+        New messages per hour observed between the last two successful scrapes.
+        Channels never measured sort first (infinite rate) so they get their first pass early.
+        """
+        entry = self._cursors.get(channel_name) or {}
+        return entry.get("messages_per_hour", float("inf"))
+
+    def update(self, channel_name: str, last_message_id: int, message_count: int = 0):
+        """Advances the cursor (never moves it backwards) and saves the state file."""
+        entry = self._cursors.get(channel_name, {})
+        previous = entry.get("last_message_id")
+        if previous is not None and last_message_id <= previous:
+            return
+        now = datetime.now(timezone.utc)
+        if entry.get("updated_at"):
+            hours = (now - datetime.fromisoformat(entry["updated_at"])).total_seconds() / 3600
+            entry["messages_per_hour"] = message_count / max(hours, 1 / 60)
+        entry.update({
+            "last_message_id": last_message_id,
+            "last_message_count": message_count,
+            "updated_at": now.isoformat(),
+        })
+        self._cursors[channel_name] = entry
+        self.save()
+
+    def save(self):
+        _atomic_write_json(self.path, self._cursors)
+
+
+class MediaIndex:
+    """
+    Remembers which Telegram photos (by photo id) have already been downloaded and where,
+    so reposts of the same photo are not fetched again.
+    """
+
+    def __init__(self, path: Path = MEDIA_INDEX_FILE):
+        self.path = Path(path)
+        self._paths = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._paths = json.load(f)
+
+    def get(self, photo_id: int):
+        """Returns the local path of an already downloaded photo if the file is still there."""
+        path = self._paths.get(str(photo_id))
+        return path if path and os.path.exists(path) else None
+
+    def add(self, photo_id: int, path):
+        self._paths[str(photo_id)] = str(path)
+
+    def save(self):
+        _atomic_write_json(self.path, self._paths)
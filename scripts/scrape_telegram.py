@@ -3,18 +3,47 @@
 import os
 import json
 import asyncio
+import time
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 from telethon.sync import TelegramClient
 from telethon.tl.types import MessageMediaPhoto
 from loguru import logger
+from scrape_state import CursorStore, MediaIndex
+from raw_io import COMPRESSION_SUFFIXES, NdjsonMessageWriter
+from scrape_scheduler import ChannelScheduler, TokenBucket, throttle_delay
 
 load_dotenv()
 
 API_ID = os.getenv("API_ID")
 API_HASH = os.getenv("API_HASH")
 
+# Number of channels scraped at once over a single shared session (1 = sequential)
+SCRAPER_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", "1"))
+
+# Explicit backfill ranges, e.g. "CheMeds=1000-5000,tenamereja=0-800" (ids are exclusive bounds)
+SCRAPER_BACKFILL = os.getenv("SCRAPER_BACKFILL", "")
+
+# Photo downloads run in a worker pool fed by a bounded queue
+MEDIA_DOWNLOAD_WORKERS = int(os.getenv("MEDIA_DOWNLOAD_WORKERS", "4"))
+MEDIA_QUEUE_SIZE = int(os.getenv("MEDIA_QUEUE_SIZE", "32"))
+
+# Raw message file layout: "json" (one array per file) or "ndjson" (one message per line)
+SCRAPER_OUTPUT_FORMAT = os.getenv("SCRAPER_OUTPUT_FORMAT", "json")
+# Compression for ndjson output: "none", "gzip" or "zstd"
+SCRAPER_OUTPUT_COMPRESSION = os.getenv("SCRAPER_OUTPUT_COMPRESSION", "none")
+
+# Request budget for the shared session (requests/sec); adapts between these bounds on FloodWait
+SCRAPER_RATE = float(os.getenv("SCRAPER_RATE", "2"))
+SCRAPER_MAX_RATE = float(os.getenv("SCRAPER_MAX_RATE", "5"))
+# How many times a throttled channel is requeued before it is given up for the run
+SCRAPER_MAX_ATTEMPTS = int(os.getenv("SCRAPER_MAX_ATTEMPTS", "5"))
+
+# Hand downloaded photos straight to the detection worker's queue (scripts/detection_worker.py)
+DETECTION_QUEUE_ENABLED = os.getenv("DETECTION_QUEUE_ENABLED", "0") == "1"
+DETECTION_QUEUE_FLUSH_SIZE = int(os.getenv("DETECTION_QUEUE_FLUSH_SIZE", "50"))
+
 
 # Root output paths
 RAW_MESSAGES_DIR = Path("data/raw/telegram_messages")
@@ -30,7 +59,140 @@ CHANNELS = {
 }
 
 
-async def scrape_channel(channel_name: str, channel_url: str, limit=200):
+def parse_backfill_ranges(spec: str) -> dict:
+    """Parses "channel=min_id-max_id,..." into {channel: (min_id, max_id)}."""
+    ranges = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, bounds = item.partition("=")
+        low, _, high = bounds.partition("-")
+        ranges[name.strip()] = (int(low or 0), int(high or 0))
+    return ranges
+
+
+def _expected_photo_size(photo):
+    """Byte size of the largest variant of a photo (the one download_media fetches), if known."""
+    sizes = []
+    for size in getattr(photo, "sizes", None) or []:
+        if getattr(size, "size", None):
+            sizes.append(size.size)
+        elif getattr(size, "sizes", None):  # PhotoSizeProgressive
+            sizes.append(max(size.sizes))
+    return max(sizes) if sizes else None
+
+
+def _written_through(fetched_ids, written_ids, ascending=True):
+    """
+    Highest message id the cursor can move to after a partial run. Fetched oldest first,
+    that is the end of the longest fully written prefix (photo records are written out of
+    order by the download workers); fetched newest first (the initial window), the newest
+    written id, as nothing older than the window is fetched again anyway.
+    """
+    if not ascending:
+        return max(written_ids, default=None)
+    written_id = None
+    for message_id in fetched_ids:
+        if message_id not in written_ids:
+            break
+        written_id = message_id
+    return written_id
+
+
+async def _download_media(client, msg, media_path, rate_limiter=None, max_attempts=3):
+    """Downloads one photo, waiting on `rate_limiter` and retrying when Telegram throttles us."""
+    for attempt in range(1, max_attempts + 1):
+        if rate_limiter is not None:
+            await rate_limiter.acquire()
+        try:
+            return await client.download_media(msg, file=media_path)
+        except Exception as e:
+            wait = throttle_delay(e)
+            if wait is None or rate_limiter is None or attempt == max_attempts:
+                raise
+            rate_limiter.on_throttled(wait or 2 ** attempt)
+
+
+async def _media_worker(client, queue: asyncio.Queue, media_index: MediaIndex, emit, rate_limiter=None,
+                        on_media_ready=None):
+    """
+    Consumes (message, target path, record) items, downloads photos that are not on disk
+    yet and then hands the finished record to `emit`. The `on_media_ready(path)` coroutine
+    is awaited for every photo downloaded here (not for photos known from earlier runs);
+    if it fails, the record still points at the downloaded file.
+    A worker cancelled mid-download emits nothing, as the file may be incomplete.
+    """
+    while True:
+        msg, media_path, data = await queue.get()
+        downloaded = False
+        try:
+            photo = msg.photo
+            known_path = media_index.get(photo.id) if photo else None
+            expected_size = _expected_photo_size(photo)
+
+            if known_path:
+                data["file"] = known_path
+            elif media_path.exists() and expected_size and media_path.stat().st_size == expected_size:
+                if photo:
+                    media_index.add(photo.id, media_path)
+            else:
+                await _download_media(client, msg, media_path, rate_limiter)
+                downloaded = True
+                if photo:
+                    media_index.add(photo.id, media_path)
+        except asyncio.CancelledError:
+            queue.task_done()
+            raise
+        except Exception as e:
+            logger.warning(f"Failed to download media for message {msg.id}: {e}")
+            data["file"] = None
+
+        try:
+            if downloaded and on_media_ready is not None:
+                try:
+                    await on_media_ready(data["file"])
+                except Exception as e:
+                    logger.warning(f"Media hook failed for {data['file']}: {e}")
+        finally:
+            emit(data)
+            queue.task_done()
+
+
+async def scrape_channel(channel_name: str, channel_url: str, limit=200, client=None,
+                         cursor_store: CursorStore = None, backfill=None, media_index: MediaIndex = None,
+                         rate_limiter: TokenBucket = None, on_media_ready=None):
+    """
+    Scrapes one channel and returns the number of messages written.
+    Pass an already connected `client` to reuse a shared session; otherwise a
+    dedicated session is opened for this channel only.
+
+    With a `cursor_store`, only messages newer than the channel's high-water mark
+    are fetched (the `limit` window is used only on the very first run) and the
+    mark is advanced once the file is written. `backfill=(min_id, max_id)` fetches
+    an explicit, exclusive id range instead and leaves the cursor untouched.
+
+    Photos are handed to MEDIA_DOWNLOAD_WORKERS download workers through a bounded
+    queue, so message iteration only blocks when the queue is full. Photos already
+    on disk with the expected size, or already fetched under the same Telegram
+    photo id (`media_index`), are not downloaded again.
+
+    With SCRAPER_OUTPUT_FORMAT=ndjson, messages are streamed to disk one per line
+    (optionally gzip/zstd compressed) instead of being collected in memory, and synced
+    periodically so even a killed run leaves a usable file. Incremental runs fetch
+    oldest first, so a failed run still advances the cursor to the last message up to
+    which everything was written, and the next run resumes from there.
+
+    A `rate_limiter` token is taken for every history page (100 messages) and every
+    photo download. FloodWait errors from iteration propagate to the caller.
+
+    The `on_media_ready(path)` coroutine is awaited for each newly downloaded photo,
+    e.g. to queue it for object detection.
+    """
+    if client is None:
+        async with TelegramClient('scraping_session', API_ID, API_HASH) as own_client:
+            return await scrape_channel(channel_name, channel_url, limit=limit, client=own_client,
+                                        cursor_store=cursor_store, backfill=backfill,
+                                        media_index=media_index, rate_limiter=rate_limiter,
+                                        on_media_ready=on_media_ready)
+
     logger.info(f"Scraping channel: {channel_name}")
     today = datetime.now().strftime("%Y-%m-%d")
 
@@ -42,13 +204,56 @@ async def scrape_channel(channel_name: str, channel_url: str, limit=200):
     media_output_dir = RAW_MEDIA_DIR / today / channel_name
     media_output_dir.mkdir(parents=True, exist_ok=True)
 
-    # File for messages
-    msg_file_path = msg_output_dir / f"{channel_name}.json"
+    last_seen_id = cursor_store.get(channel_name) if cursor_store else None
+    if backfill:
+        min_id, max_id = backfill
+        iter_kwargs = {"limit": None, "min_id": min_id, "max_id": max_id}
+        logger.info(f"{channel_name}: backfilling ids {min_id} < id < {max_id or 'latest'}")
+    elif last_seen_id is not None:
+        # Oldest first, so what has been written is always a contiguous run above the cursor
+        iter_kwargs = {"limit": None, "min_id": last_seen_id, "reverse": True}
+        logger.info(f"{channel_name}: fetching messages newer than id {last_seen_id}")
+    else:
+        iter_kwargs = {"limit": limit}
+
+    owns_media_index = media_index is None
+    if owns_media_index:
+        media_index = MediaIndex()
+
+    # File for messages: streamed NDJSON, or the legacy JSON array written at the end
+    messages = []
+    writer = None
+    if SCRAPER_OUTPUT_FORMAT == "ndjson":
+        msg_file_path = msg_output_dir / f"{channel_name}{COMPRESSION_SUFFIXES[SCRAPER_OUTPUT_COMPRESSION]}"
+        writer = NdjsonMessageWriter(msg_file_path, SCRAPER_OUTPUT_COMPRESSION)
+        write = writer.write
+    else:
+        msg_file_path = msg_output_dir / f"{channel_name}.json"
+        write = messages.append
 
-    async with TelegramClient('scraping_session', API_ID, API_HASH) as client:
-        messages = []
+    fetched_ids = []
+    written_ids = set()
 
-        async for msg in client.iter_messages(channel_url, limit=limit):
+    def emit(data):
+        write(data)
+        written_ids.add(data["id"])
+
+    new_count = 0
+    newest_id = None
+    failed = False
+    media_queue = asyncio.Queue(maxsize=MEDIA_QUEUE_SIZE)
+    workers = [
+        asyncio.create_task(_media_worker(client, media_queue, media_index, emit, rate_limiter, on_media_ready))
+        for _ in range(MEDIA_DOWNLOAD_WORKERS)
+    ]
+
+    try:
+        if rate_limiter is not None:
+            await rate_limiter.acquire()
+        async for msg in client.iter_messages(channel_url, **iter_kwargs):
+            if rate_limiter is not None and new_count and new_count % 100 == 0:
+                # iter_messages fetches history in pages of 100
+                await rate_limiter.acquire()
             data = {
                 "id": msg.id,
                 "date": msg.date.isoformat() if msg.date else None,
@@ -58,27 +263,179 @@ async def scrape_channel(channel_name: str, channel_url: str, limit=200):
                 "media_type": type(msg.media).__name__ if msg.media else None,
                 "file": None,
             }
+            new_count += 1
+            newest_id = msg.id if newest_id is None else max(newest_id, msg.id)
+            fetched_ids.append(msg.id)
 
             if isinstance(msg.media, MessageMediaPhoto):
+                # The worker emits the record once the download has settled
                 media_path = media_output_dir / f"{channel_name}_{msg.id}.jpg"
-                await client.download_media(msg, file=media_path)
                 data["file"] = str(media_path)
+                await media_queue.put((msg, media_path, data))
+            else:
+                emit(data)
+
+        # Wait for the pending downloads to emit their records
+        await media_queue.join()
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if owns_media_index:
+            media_index.save()
+        if writer is not None:
+            writer.close()
+            if failed and cursor_store is not None and not backfill:
+                # What was written is on disk; don't fetch it again next run
+                written_id = _written_through(fetched_ids, written_ids, ascending=last_seen_id is not None)
+                if written_id is not None:
+                    cursor_store.update(channel_name, written_id, len(written_ids))
+                    logger.warning(f"{channel_name}: run failed; cursor advanced to message {written_id}")
 
-            messages.append(data)
+    if writer is None:
+        if msg_file_path.exists():
+            # An earlier run today already wrote this file; keep its messages alongside the new ones
+            with open(msg_file_path, "r", encoding="utf-8") as f:
+                fetched_ids = {m["id"] for m in messages}
+                messages.extend(m for m in json.load(f) if m["id"] not in fetched_ids)
 
         with open(msg_file_path, "w", encoding="utf-8") as f:
             json.dump(messages, f, ensure_ascii=False, indent=2)
 
-    logger.success(f"{channel_name}: {len(messages)} messages scraped.")
+    if cursor_store is not None and not backfill and newest_id is not None:
+        cursor_store.update(channel_name, newest_id, new_count)
+
+    logger.success(f"{channel_name}: {new_count} messages scraped.")
+    return new_count
+
+
+class DetectionEnqueuer:
+    """
+    Buffers downloaded photo paths and pushes them to raw.detection_queue in batches of
+    DETECTION_QUEUE_FLUSH_SIZE, so the detection worker picks them up while we keep scraping.
+    Database calls run in a thread to keep the event loop free.
+    """
+
+    def __init__(self):
+        # Imported here so the scraper does not need psycopg2 unless the queue is enabled
+        from detection_queue import connect_db, create_detection_queue_table, enqueue_images
+        self._enqueue_images = enqueue_images
+        self.conn = connect_db()
+        create_detection_queue_table(self.conn)
+        # The detector runs from the project root and keys images by paths relative to it
+        self.project_root = Path(__file__).resolve().parent.parent
+        self._pending = []
+        self._lock = asyncio.Lock()
+        self.queued = 0
+
+    def add(self, path):
+        self._pending.append(os.path.relpath(Path(path).resolve(), self.project_root))
+
+    async def maybe_flush(self):
+        if len(self._pending) >= DETECTION_QUEUE_FLUSH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            paths, self._pending = self._pending, []
+            if not paths:
+                return
+            try:
+                self.queued += await asyncio.to_thread(self._enqueue_images, self.conn, paths)
+            except Exception as e:
+                # Not fatal: the detector's own discovery still finds these images later
+                logger.warning(f"Failed to queue {len(paths)} images for detection: {e}")
 
+    async def close(self):
+        await self.flush()
+        self.conn.close()
+        logger.info(f"Queued {self.queued} new images for detection.")
 
-async def run_scraper():
-    for name, url in CHANNELS.items():
+
+def _media_ready_hook(enqueuer: DetectionEnqueuer):
+    """Adapts the enqueuer to scrape_channel's `on_media_ready` callback."""
+    if enqueuer is None:
+        return None
+
+    async def _on_media_ready(path):
+        enqueuer.add(path)
+        await enqueuer.maybe_flush()
+    return _on_media_ready
+
+
+async def scrape_channels(client, channels: dict, bucket: TokenBucket, cursor_store: CursorStore,
+                          media_index: MediaIndex, max_concurrency: int = 1, backfill_ranges: dict = None,
+                          enqueuer: DetectionEnqueuer = None, max_attempts: int = SCRAPER_MAX_ATTEMPTS):
+    """
+    Scrapes `channels` ({name: url}) over the connected `client` through a ChannelScheduler
+    and returns its {name: (message_count, seconds)} results.
+
+    Requests share the adaptive token `bucket`, channels that change fastest go first, and
+    channels hit by FloodWait are requeued instead of being lost for the day. At most
+    `max_concurrency` channels are in flight at the same time (1 = one after the other).
+    """
+    backfill_ranges = backfill_ranges or {}
+
+    async def _scrape(name, url, rate_limiter):
         try:
-            await scrape_channel(name, url)
-        except Exception as e:
-            logger.error(f"Failed to scrape {name}: {e}")
+            return await scrape_channel(name, url, client=client, cursor_store=cursor_store,
+                                        backfill=backfill_ranges.get(name), media_index=media_index,
+                                        rate_limiter=rate_limiter, on_media_ready=_media_ready_hook(enqueuer))
+        finally:
+            media_index.save()
+            if enqueuer is not None:
+                await enqueuer.flush()
+
+    scheduler = ChannelScheduler(
+        _scrape,
+        bucket,
+        max_concurrency=max_concurrency,
+        max_attempts=max_attempts,
+        priority=cursor_store.change_rate,
+    )
+    return await scheduler.run(channels)
+
+
+async def run_scraper(max_concurrency: int = None):
+    """
+    Connects once and scrapes all CHANNELS over the shared session, at most
+    `max_concurrency` (default SCRAPER_CONCURRENCY) at a time; see scrape_channels.
+    Logs messages/sec per channel and for the whole run so the limit can be tuned.
+    """
+    max_concurrency = max_concurrency or SCRAPER_CONCURRENCY
+    cursor_store = CursorStore()
+    media_index = MediaIndex()
+    backfill_ranges = parse_backfill_ranges(SCRAPER_BACKFILL)
+    enqueuer = DetectionEnqueuer() if DETECTION_QUEUE_ENABLED else None
+
+    logger.info(f"Scraping {len(CHANNELS)} channels with concurrency {max_concurrency}")
+    run_started = time.perf_counter()
+    # flood_sleep_threshold=0 hands every FloodWait to the scheduler instead of sleeping inside Telethon
+    async with TelegramClient('scraping_session', API_ID, API_HASH, flood_sleep_threshold=0) as client:
+        try:
+            results = await scrape_channels(client, CHANNELS, TokenBucket(SCRAPER_RATE, max_rate=SCRAPER_MAX_RATE),
+                                            cursor_store, media_index, max_concurrency=max_concurrency,
+                                            backfill_ranges=backfill_ranges, enqueuer=enqueuer)
+        finally:
+            if enqueuer is not None:
+                await enqueuer.close()
+    run_elapsed = time.perf_counter() - run_started
+
+    for name, (count, elapsed) in results.items():
+        if count is not None:
+            logger.info(f"{name}: {count} messages in {elapsed:.1f}s ({count / max(elapsed, 1e-6):.1f} msg/s)")
+    total = sum(count for count, _ in results.values() if count)
+    failed = [name for name, (count, _) in results.items() if count is None]
+    logger.success(
+        f"Scraped {total} messages from {len(CHANNELS) - len(failed)} channels in {run_elapsed:.1f}s "
+        f"({total / max(run_elapsed, 1e-6):.1f} msg/s)"
+    )
+    if failed:
+        logger.error(f"Channels not scraped this run: {', '.join(failed)}")
 
 
 if __name__ == "__main__":
-    asyncio.run(run_scraper())
\ No newline at end of file
+    asyncio.run(run_scraper())
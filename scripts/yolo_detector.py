@@ -1,16 +1,23 @@
 # src/yolo_detector.py
 
 import os
+import sys
 import json
 import psycopg2
-from psycopg2 import sql
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 from datetime import datetime
 import glob
+import time
+import hashlib
+from collections import deque
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
 from ultralytics import YOLO
 import logging
-import cv2  # For dummy image creation
-import numpy as np  # For dummy image creation
+import cv2  # Image decoding and letterboxing
+import numpy as np
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -32,6 +39,57 @@ RAW_IMAGES_PATH = "scripts/data/raw/telegram_media"  # Corrected based on your i
 YOLO_OUTPUT_PATH = "scripts/data/processed/yolo_detections"
 os.makedirs(YOLO_OUTPUT_PATH, exist_ok=True)
 
+# Batched inference settings
+DETECTOR_BATCH_SIZE = int(os.getenv("DETECTOR_BATCH_SIZE", "8"))
+DETECTOR_DECODE_WORKERS = int(os.getenv("DETECTOR_DECODE_WORKERS", "4"))
+DETECTOR_IMGSZ = int(os.getenv("DETECTOR_IMGSZ", "640"))
+
+# Sharded detection: N worker processes, each with its own model and a capped intra-op thread count
+DETECTOR_SHARDS = int(os.getenv("DETECTOR_SHARDS", "1"))
+DETECTOR_SHARD_THREADS = int(os.getenv("DETECTOR_SHARD_THREADS",
+                                       str(max(1, (os.cpu_count() or 1) // max(DETECTOR_SHARDS, 1)))))
+
+# "incremental" scans only media date partitions from the watermark on; "full" rescans the whole tree
+DETECTOR_DISCOVERY = os.getenv("DETECTOR_DISCOVERY", "incremental")
+WATERMARK_NAME = "yolo_media_partitions"
+# Runs an image may fail before it is given up on, so it no longer holds the watermark back
+DETECTOR_MAX_ATTEMPTS = int(os.getenv("DETECTOR_MAX_ATTEMPTS", "3"))
+
+# Detection cache: reuse stored detections for byte-identical (and optionally near-duplicate) images
+DETECTOR_CACHE = os.getenv("DETECTOR_CACHE", "1") == "1"
+DETECTOR_PHASH = os.getenv("DETECTOR_PHASH", "0") == "1"
+# Max Hamming distance between 64-bit perceptual hashes; at most 3 so the 4-band index lookup is exact
+DETECTOR_PHASH_MAX_DISTANCE = min(int(os.getenv("DETECTOR_PHASH_MAX_DISTANCE", "3")), 3)
+
+# Inference backend: "torch" runs the PyTorch weights, "onnx" and "openvino" run a model exported from them
+DETECTOR_WEIGHTS = os.getenv("DETECTOR_WEIGHTS", "yolov8n.pt")
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "torch")
+# int8 quantization of the exported model (dynamic quantization for ONNX, NNCF calibration for OpenVINO)
+DETECTOR_INT8 = os.getenv("DETECTOR_INT8", "0") == "1"
+# Calibration dataset for OpenVINO int8 export
+DETECTOR_INT8_DATA = os.getenv("DETECTOR_INT8_DATA", "coco8.yaml")
+DETECTOR_BACKENDS = ("torch", "onnx", "openvino")
+
+
+def model_artifact_path(backend=DETECTOR_BACKEND, int8=DETECTOR_INT8, weights=DETECTOR_WEIGHTS):
+    """
+    Returns where the model for `backend` lives: the weights themselves for torch, otherwise
+    the file/directory the export step writes next to them (e.g. yolov8n_int8_openvino_model).
+    """
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unsupported detector backend '{backend}'. Use one of {list(DETECTOR_BACKENDS)}.")
+    if backend == "torch":
+        return weights
+    stem = os.path.splitext(weights)[0]
+    suffix = "_int8" if int8 else ""
+    if backend == "onnx":
+        return f"{stem}{suffix}.onnx"
+    return f"{stem}{suffix}_openvino_model"
+
+
+# Identifies the model in the detection cache, so results from different backends are never mixed
+DETECTOR_MODEL_NAME = os.path.basename(model_artifact_path())
+
 
 def connect_db():
     """Establishes a connection to the PostgreSQL database."""
@@ -84,142 +142,886 @@ def create_yolo_raw_table(conn):
         cur.close()
 
 
-def get_processed_images(conn):
-    """Retrieves a set of image paths that have already been processed."""
+def create_processed_images_table(conn):
+    """
+    Creates raw.processed_images, the index of images the detector has already handled
+    (keyed by path, with the content hash, size and mtime of the file that was processed), and
+    raw.detector_watermarks, which remembers the newest date partition fully processed.
+    Images that failed are kept there too, with `failed` set and their attempt count.
+    On first creation the index is seeded from the paths already in raw.image_detections.
+    """
     cur = conn.cursor()
-    processed_images = set()
     try:
-        cur.execute("SELECT DISTINCT image_path FROM raw.image_detections;")
-        for row in cur.fetchall():
-            processed_images.add(row[0])
-        logging.info(f"Found {len(processed_images)} images already processed in raw.image_detections.")
+        cur.execute("CREATE SCHEMA IF NOT EXISTS raw;")
+        cur.execute("SELECT to_regclass('raw.processed_images') IS NULL;")
+        first_creation = cur.fetchone()[0]
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw.processed_images (
+                image_path VARCHAR(512) PRIMARY KEY,
+                content_hash CHAR(64),
+                detection_count INTEGER NOT NULL DEFAULT 0,
+                processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("""
+            ALTER TABLE raw.processed_images
+                ADD COLUMN IF NOT EXISTS failed BOOLEAN NOT NULL DEFAULT FALSE,
+                ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS last_error TEXT,
+                ADD COLUMN IF NOT EXISTS file_size BIGINT,
+                ADD COLUMN IF NOT EXISTS file_mtime_ns BIGINT;
+        """)
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_processed_images_content_hash ON raw.processed_images (content_hash);")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw.detector_watermarks (
+                name VARCHAR(64) PRIMARY KEY,
+                partition_date DATE NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        if first_creation:
+            cur.execute("""
+                INSERT INTO raw.processed_images (image_path, detection_count)
+                SELECT image_path, COUNT(*) FILTER (WHERE detected_class <> 'NO_DETECTIONS')
+                FROM raw.image_detections
+                GROUP BY image_path
+                ON CONFLICT (image_path) DO NOTHING;
+            """)
+            logging.info(f"Seeded raw.processed_images with {cur.rowcount} previously processed images.")
+        conn.commit()
     except psycopg2.Error as e:
-        logging.error(f"Error retrieving processed images: {e}")
+        logging.error(f"Error creating raw.processed_images table: {e}")
+        conn.rollback()
+        raise
     finally:
         cur.close()
-    return processed_images
 
 
-def detect_objects_and_load(conn):
+def get_watermark(conn, name=WATERMARK_NAME):
+    """Returns the newest media date partition known to be fully processed, or None."""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT partition_date FROM raw.detector_watermarks WHERE name = %s;", (name,))
+        row = cur.fetchone()
+        return row[0] if row else None
+    finally:
+        cur.close()
+
+
+def set_watermark(conn, partition_date, name=WATERMARK_NAME):
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO raw.detector_watermarks (name, partition_date) VALUES (%s, %s)
+            ON CONFLICT (name) DO UPDATE
+            SET partition_date = EXCLUDED.partition_date, updated_at = CURRENT_TIMESTAMP;
+        """, (name, partition_date))
+        conn.commit()
+        logging.info(f"Detector watermark set to partition {partition_date}.")
+    except psycopg2.Error as e:
+        logging.error(f"Error updating detector watermark: {e}")
+        conn.rollback()
+    finally:
+        cur.close()
+
+
+def partition_date(image_path):
+    """Date of the media partition an image lives in (RAW_IMAGES_PATH/<YYYY-MM-DD>/...), or None."""
+    first_component = os.path.relpath(image_path, RAW_IMAGES_PATH).split(os.sep)[0]
+    try:
+        return datetime.strptime(first_component, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def discover_candidate_images(watermark=None):
     """
-    Scans for new images, runs YOLO detection, and loads results to PostgreSQL.
+    Lists image files to consider. In incremental mode only date partitions on or after the
+    watermark are globbed (the watermark day itself is rescanned, since it may still be
+    receiving images); with no watermark, or in full mode, the whole tree is scanned.
     """
+    image_extensions = ('*.jpg', '*.jpeg', '*.png')
+    if DETECTOR_DISCOVERY == "incremental" and watermark is not None and os.path.isdir(RAW_IMAGES_PATH):
+        roots = []
+        for entry in sorted(os.listdir(RAW_IMAGES_PATH)):
+            try:
+                entry_date = datetime.strptime(entry, "%Y-%m-%d").date()
+            except ValueError:
+                continue
+            if entry_date >= watermark:
+                roots.append(os.path.join(RAW_IMAGES_PATH, entry))
+        logging.info(f"Incremental discovery: scanning {len(roots)} partitions from {watermark} onwards.")
+    else:
+        roots = [RAW_IMAGES_PATH]
+
+    candidates = []
+    for root in roots:
+        for ext in image_extensions:
+            candidates.extend(glob.glob(os.path.join(root, '**', ext), recursive=True))
+    logging.info(f"Found {len(candidates)} candidate image files matching extensions {image_extensions}.")
+    return candidates
+
+
+def file_stat(image_path):
+    """(size, mtime in ns) of an image file, as recorded in raw.processed_images; None if it is gone."""
     try:
-        model = YOLO("yolov8n.pt")  # Load a pre-trained YOLOv8n model
-        logging.info("YOLOv8 model loaded.")
-    except Exception as e:
-        logging.error(f"Failed to load YOLO model: {e}")
-        logging.error("Ensure you have an internet connection for initial model download (yolov8n.pt).")
-        return
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
 
-    processed_images = get_processed_images(conn)
 
-    logging.info(f"Current working directory: {os.getcwd()}")  # NEW: Log CWD
-    logging.info(
-        f"Absolute path being searched: {os.path.abspath(RAW_IMAGES_PATH)}")  # NEW: Log absolute path being searched
-    # Revert to os.path.join, as this is correct for local Windows environment
-    image_extensions = ('*.jpg', '*.jpeg', '*.png')
-    all_image_files = []
+def filter_unprocessed(conn, image_paths):
+    """
+    Returns the paths still to process: those not in raw.processed_images, failed ones with
+    retries left, and files replaced since they were processed (their size or mtime no longer
+    matches the recorded one). Looked up by primary key for just these paths.
+    Rows recorded without a size (seeded from raw.image_detections) are taken as current.
+    """
+    if not image_paths:
+        return []
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT image_path, file_size, file_mtime_ns FROM raw.processed_images
+            WHERE image_path = ANY(%s) AND (NOT failed OR attempts >= %s);
+        """, (list(image_paths), DETECTOR_MAX_ATTEMPTS))
+        processed = {path for path, size, mtime_ns in cur.fetchall()
+                     if size is None or file_stat(path) in (None, (size, mtime_ns))}
+    finally:
+        cur.close()
+    return [path for path in image_paths if path not in processed]
 
-    for ext in image_extensions:
-        all_image_files.extend(glob.glob(os.path.join(RAW_IMAGES_PATH, '**', ext), recursive=True))
 
-    logging.info(f"Found {len(all_image_files)} total image files matching extensions {image_extensions}.")
+def create_detection_cache_table(conn):
+    """
+    Creates raw.detection_cache: the detections a model produced for an image, keyed by the
+    SHA-256 of the image bytes. The 64-bit perceptual hash is also split into four 16-bit
+    bands, each indexed, so near-duplicates within Hamming distance 3 can be found by index
+    (two hashes that close must agree exactly on at least one band).
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS raw;")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS raw.detection_cache (
+                content_hash CHAR(64) NOT NULL,
+                model_name VARCHAR(255) NOT NULL,
+                perceptual_hash BIGINT,
+                phash_band0 INTEGER,
+                phash_band1 INTEGER,
+                phash_band2 INTEGER,
+                phash_band3 INTEGER,
+                image_width INTEGER NOT NULL,
+                image_height INTEGER NOT NULL,
+                detections JSONB NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (content_hash, model_name)
+            );
+        """)
+        for band in range(4):
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_detection_cache_phash_band{band} "
+                        f"ON raw.detection_cache (phash_band{band});")
+        conn.commit()
+    except psycopg2.Error as e:
+        logging.error(f"Error creating raw.detection_cache table: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
 
-    new_image_files = [f for f in all_image_files if f not in processed_images]
 
-    if not new_image_files:
-        logging.info("No new images found for object detection based on previous processing records.")
-        return
+def perceptual_hash(image):
+    """64-bit difference hash (dHash) of a BGR image, as a signed integer that fits a BIGINT."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
 
-    logging.info(f"Processing {len(new_image_files)} new images.")
+def _phash_bands(phash):
+    unsigned = phash & 0xFFFFFFFFFFFFFFFF
+    return [(unsigned >> (16 * band)) & 0xFFFF for band in range(4)]
 
+
+def lookup_cached_detections(conn, batch):
+    """
+    Looks up cached detections for a batch of decoded images: first by exact content hash
+    (one query for the batch), then, if DETECTOR_PHASH is on, by perceptual hash for the rest.
+    Returns {image_path: (cache_entry, 'exact' | 'perceptual')}.
+    """
+    hits = {}
+    if not DETECTOR_CACHE or not batch:
+        return hits
     cur = conn.cursor()
-    insert_query = sql.SQL("""
+    try:
+        by_hash = {}
+        for item in batch:
+            by_hash.setdefault(item["content_hash"], []).append(item["image_path"])
+        cur.execute("""
+            SELECT content_hash, image_width, image_height, detections
+            FROM raw.detection_cache
+            WHERE model_name = %s AND content_hash = ANY(%s);
+        """, (DETECTOR_MODEL_NAME, list(by_hash)))
+        for content_hash, width, height, detections in cur.fetchall():
+            for image_path in by_hash[content_hash]:
+                hits[image_path] = ({"image_width": width, "image_height": height, "detections": detections}, "exact")
+
+        if DETECTOR_PHASH:
+            for item in batch:
+                if item["image_path"] in hits or item.get("perceptual_hash") is None:
+                    continue
+                bands = _phash_bands(item["perceptual_hash"])
+                cur.execute("""
+                    SELECT image_width, image_height, detections
+                    FROM raw.detection_cache
+                    WHERE model_name = %s
+                      AND (phash_band0 = %s OR phash_band1 = %s OR phash_band2 = %s OR phash_band3 = %s)
+                      AND bit_count((perceptual_hash # %s)::bit(64)) <= %s
+                    ORDER BY bit_count((perceptual_hash # %s)::bit(64))
+                    LIMIT 1;
+                """, (DETECTOR_MODEL_NAME, *bands, item["perceptual_hash"], DETECTOR_PHASH_MAX_DISTANCE,
+                      item["perceptual_hash"]))
+                row = cur.fetchone()
+                if row:
+                    hits[item["image_path"]] = (
+                        {"image_width": row[0], "image_height": row[1], "detections": row[2]}, "perceptual")
+    except psycopg2.Error as e:
+        logging.error(f"Error reading detection cache: {e}")
+        conn.rollback()
+    finally:
+        cur.close()
+    return hits
+
+
+def detections_from_cache(cache_entry, item, channel_name, message_id):
+    """Copies cached detections onto a new image, rescaling boxes if its resolution differs."""
+    height, width = item["original_shape"]
+    scale_x = width / cache_entry["image_width"]
+    scale_y = height / cache_entry["image_height"]
+    return [
+        {
+            "image_path": item["image_path"],
+            "message_id": message_id,
+            "channel_name": channel_name,
+            "detected_class": det["detected_class"],
+            "confidence_score": det["confidence_score"],
+            "detection_bbox": [det["detection_bbox"][0] * scale_x, det["detection_bbox"][1] * scale_y,
+                               det["detection_bbox"][2] * scale_x, det["detection_bbox"][3] * scale_y],
+        }
+        for det in cache_entry["detections"]
+    ]
+
+
+def cache_entry_row(item, detections):
+    """Builds a raw.detection_cache row for a freshly inferred image."""
+    height, width = item["original_shape"]
+    phash = item.get("perceptual_hash")
+    bands = _phash_bands(phash) if phash is not None else [None] * 4
+    cached = [{"detected_class": det["detected_class"], "confidence_score": det["confidence_score"],
+               "detection_bbox": det["detection_bbox"]} for det in detections]
+    return (item["content_hash"], DETECTOR_MODEL_NAME, phash, *bands, width, height, json.dumps(cached))
+
+
+def infer_image_source(image_path):
+    """
+    Infers (channel_name, message_id) from an image path laid out as .../<channel>/<message_id>.jpg
+    or, as the scraper writes them, .../<channel>/<channel>_<message_id>.jpg.
+    """
+    relative_path = os.path.relpath(image_path, RAW_IMAGES_PATH)
+    path_components = relative_path.split(os.sep)
+
+    inferred_channel_name = None
+    inferred_message_id = None
+
+    if len(path_components) >= 2:
+        inferred_channel_name = path_components[-2]
+        filename = path_components[-1]
+        inferred_message_id_str = os.path.splitext(filename)[0]
+        inferred_message_id_str = inferred_message_id_str.removeprefix(f"{inferred_channel_name}_")
+        if inferred_message_id_str.isdigit():
+            inferred_message_id = int(inferred_message_id_str)
+        else:
+            logging.warning(f"Could not infer numeric message_id from filename '{filename}'.")
+    else:
+        logging.warning(
+            f"Image path '{image_path}' does not fit expected structure to infer channel/message ID.")
+
+    logging.debug(
+        f"Inferred channel_name: {inferred_channel_name}, message_id: {inferred_message_id} for {image_path}")
+    return inferred_channel_name, inferred_message_id
+
+
+def letterbox(image, size=DETECTOR_IMGSZ, color=(114, 114, 114)):
+    """
+    Resizes `image` to fit a size x size square, keeping its aspect ratio, and pads the rest
+    (the same preprocessing YOLO applies internally). Returns (padded, ratio, (pad_w, pad_h))
+    so boxes can be mapped back to the original image.
+    """
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    pad_w, pad_h = (size - new_width) / 2, (size - new_height) / 2
+    top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+    left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return padded, ratio, (left, top)
+
+
+def load_and_letterbox(image_path, size=DETECTOR_IMGSZ):
+    """
+    Reads, hashes, decodes and letterboxes one image (the file is read once for both).
+    Returns a dict, with 'error' set if it could not be read.
+    """
+    try:
+        with open(image_path, "rb") as f:
+            data = f.read()
+            stat = os.fstat(f.fileno())
+    except OSError as e:
+        return {"image_path": image_path, "error": str(e)}
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return {"image_path": image_path, "error": "could not decode image"}
+    padded, ratio, pad = letterbox(image, size)
+    return {"image_path": image_path, "image": padded, "ratio": ratio, "pad": pad,
+            "original_shape": image.shape[:2], "content_hash": hashlib.sha256(data).hexdigest(),
+            "file_stat": (stat.st_size, stat.st_mtime_ns),
+            "perceptual_hash": perceptual_hash(image) if DETECTOR_PHASH else None}
+
+
+def iter_prefetched_batches(image_paths, batch_size=DETECTOR_BATCH_SIZE, workers=DETECTOR_DECODE_WORKERS,
+                            size=DETECTOR_IMGSZ):
+    """
+    Yields lists of decoded, letterboxed images of up to `batch_size`, in input order.
+    A thread pool decodes the next batches while the caller runs inference on the current one;
+    at most two batches are decoded ahead so memory stays bounded.
+    """
+    image_paths = iter(image_paths)
+    window = batch_size * 3
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(load_and_letterbox, path, size) for path in islice(image_paths, window))
+        while pending:
+            batch = []
+            while pending and len(batch) < batch_size:
+                batch.append(pending.popleft().result())
+                next_path = next(image_paths, None)
+                if next_path is not None:
+                    pending.append(executor.submit(load_and_letterbox, next_path, size))
+            yield batch
+
+
+def detections_from_result(result, model, item, channel_name, message_id):
+    """Converts one YOLO result into detection rows, mapping boxes back to original image coordinates."""
+    ratio = item["ratio"]
+    pad_w, pad_h = item["pad"]
+    height, width = item["original_shape"]
+    detections = []
+    logging.debug(f"YOLO results for {item['image_path']}: {result.boxes.data.tolist()}")
+    for box in result.boxes:
+        class_id = int(box.cls[0])
+        x1, y1, x2, y2 = box.xyxy[0].tolist()
+        bbox = [
+            min(max((x1 - pad_w) / ratio, 0.0), width),
+            min(max((y1 - pad_h) / ratio, 0.0), height),
+            min(max((x2 - pad_w) / ratio, 0.0), width),
+            min(max((y2 - pad_h) / ratio, 0.0), height),
+        ]
+        detections.append({
+            "image_path": item["image_path"],
+            "message_id": message_id,
+            "channel_name": channel_name,
+            "detected_class": model.names[class_id],
+            "confidence_score": float(box.conf[0]),
+            "detection_bbox": bbox
+        })
+    return detections
+
+
+def run_batch_inference(model, batch):
+    """
+    Runs YOLO on a list of decoded images at once. If the batch fails as a whole, images are
+    retried one by one so a single bad input does not sink its neighbours.
+    Returns one result (or None on failure) per item.
+    """
+    try:
+        return list(model([item["image"] for item in batch], imgsz=DETECTOR_IMGSZ, verbose=False))
+    except Exception as e:
+        logging.warning(f"Batch inference failed ({e}); retrying {len(batch)} images individually.")
+    results = []
+    for item in batch:
+        try:
+            results.append(model(item["image"], imgsz=DETECTOR_IMGSZ, verbose=False)[0])
+        except Exception as e:
+            logging.error(f"Inference failed for {item['image_path']}: {e}", exc_info=True)
+            results.append(None)
+    return results
+
+
+def detection_rows(image_path, channel_name, message_id, detections):
+    """
+    Turns detections for one image into raw.image_detections rows. An image without
+    detections gets a single NO_DETECTIONS row so it is recorded as processed.
+    """
+    if not detections:
+        return [(image_path, message_id, channel_name, 'NO_DETECTIONS', 0.0, None)]
+    return [
+        (det["image_path"], det["message_id"], det["channel_name"], det["detected_class"],
+         det["confidence_score"], json.dumps(det["detection_bbox"]))
+        for det in detections
+    ]
+
+
+def _merge_detection_rows(cur, rows, processed, cache_rows=()):
+    """
+    Bulk-inserts rows into a session staging table and merges them into raw.image_detections
+    in one statement. When a class is detected several times in the same image, the most
+    confident box wins (the unique key is (image_path, detected_class)).
+    The images are recorded in raw.processed_images, and fresh inference results in
+    raw.detection_cache, in the same transaction.
+    """
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS stage_image_detections (
+            image_path VARCHAR(512),
+            message_id BIGINT,
+            channel_name VARCHAR(255),
+            detected_class VARCHAR(255),
+            confidence_score REAL,
+            detection_bbox JSONB
+        );
+    """)
+    cur.execute("TRUNCATE stage_image_detections;")
+    execute_values(cur, """
+        INSERT INTO stage_image_detections
+            (image_path, message_id, channel_name, detected_class, confidence_score, detection_bbox)
+        VALUES %s
+    """, rows, page_size=1000)
+    cur.execute("""
         INSERT INTO raw.image_detections (image_path, message_id, channel_name, detected_class, confidence_score, detection_bbox)
-        VALUES (%s, %s, %s, %s, %s, %s)
+        SELECT DISTINCT ON (image_path, detected_class)
+            image_path, message_id, channel_name, detected_class, confidence_score, detection_bbox
+        FROM stage_image_detections
+        ORDER BY image_path, detected_class, confidence_score DESC
         ON CONFLICT (image_path, detected_class) DO UPDATE
         SET confidence_score = EXCLUDED.confidence_score,
             detection_bbox = EXCLUDED.detection_bbox,
             processed_at = EXCLUDED.processed_at;
     """)
+    # A replaced file is processed again; drop the classes only its previous version had
+    cur.execute("""
+        DELETE FROM raw.image_detections AS d
+        USING (SELECT DISTINCT image_path FROM stage_image_detections) AS staged
+        WHERE d.image_path = staged.image_path
+          AND NOT EXISTS (
+              SELECT 1 FROM stage_image_detections AS s
+              WHERE s.image_path = d.image_path AND s.detected_class = d.detected_class
+          );
+    """)
+    execute_values(cur, """
+        INSERT INTO raw.processed_images (image_path, content_hash, file_size, file_mtime_ns, detection_count)
+        VALUES %s
+        ON CONFLICT (image_path) DO UPDATE
+        SET content_hash = EXCLUDED.content_hash,
+            file_size = EXCLUDED.file_size,
+            file_mtime_ns = EXCLUDED.file_mtime_ns,
+            detection_count = EXCLUDED.detection_count,
+            failed = FALSE,
+            last_error = NULL,
+            processed_at = CURRENT_TIMESTAMP
+    """, processed, page_size=1000)
+    if cache_rows:
+        execute_values(cur, """
+            INSERT INTO raw.detection_cache (content_hash, model_name, perceptual_hash, phash_band0, phash_band1,
+                                             phash_band2, phash_band3, image_width, image_height, detections)
+            VALUES %s
+            ON CONFLICT (content_hash, model_name) DO NOTHING
+        """, cache_rows, page_size=1000)
+
+
+def _processed_entry(image_path, rows, content_hashes, file_stats):
+    # Counted after the merge, which keeps one row per detected class
+    detection_count = len({row[3] for row in rows if row[3] != 'NO_DETECTIONS'})
+    size, mtime_ns = file_stats.get(image_path) or (None, None)
+    return image_path, content_hashes.get(image_path), size, mtime_ns, detection_count
+
 
-    for image_path in new_image_files:
-        logging.info(f"Attempting to process image: {image_path}")
+def write_detection_batch(conn, rows_by_image, content_hashes=None, cache_rows_by_image=None, file_stats=None):
+    """
+    Writes the detections of a whole batch of images in one transaction, and records the
+    images (with the content hash, size and mtime of the file read) in raw.processed_images.
+    If the batch fails, it is rolled back and retried image by image, so only the
+    offending image is lost. Returns the list of image paths written.
+    """
+    if not rows_by_image:
+        return []
+    content_hashes = content_hashes or {}
+    file_stats = file_stats or {}
+    cache_rows_by_image = cache_rows_by_image or {}
+    cur = conn.cursor()
+    try:
         try:
-            # Extract message_id and channel_name from the file path
-            relative_path = os.path.relpath(image_path, RAW_IMAGES_PATH)
-            path_components = relative_path.split(os.sep)
-
-            inferred_channel_name = None
-            inferred_message_id = None
-
-            if len(path_components) >= 2:
-                inferred_channel_name = path_components[-2]
-                filename = path_components[-1]
-                inferred_message_id_str = os.path.splitext(filename)[0]
-                if inferred_message_id_str.isdigit():
-                    inferred_message_id = int(inferred_message_id_str)
-                else:
-                    logging.warning(f"Could not infer numeric message_id from filename '{filename}'.")
-            else:
-                logging.warning(
-                    f"Image path '{image_path}' does not fit expected structure to infer channel/message ID.")
-
-            logging.debug(
-                f"Inferred channel_name: {inferred_channel_name}, message_id: {inferred_message_id} for {image_path}")
-
-            results = model(image_path, verbose=False)
-
-            detections_for_image = []
-            for r in results:
-                logging.debug(f"YOLO results for {image_path}: {r.boxes.data.tolist()}")
-                for box in r.boxes:
-                    class_id = int(box.cls[0])
-                    confidence = float(box.conf[0])
-                    detected_class_name = model.names[class_id]
-                    bbox = box.xyxy[0].tolist()
-
-                    detections_for_image.append({
-                        "image_path": image_path,
-                        "message_id": inferred_message_id,
-                        "channel_name": inferred_channel_name,
-                        "detected_class": detected_class_name,
-                        "confidence_score": confidence,
-                        "detection_bbox": bbox
-                    })
-
-            if detections_for_image:
-                for det in detections_for_image:
-                    cur.execute(insert_query, (
-                        det["image_path"],
-                        det["message_id"],
-                        det["channel_name"],
-                        det["detected_class"],
-                        det["confidence_score"],
-                        json.dumps(det["detection_bbox"])
-                    ))
-                conn.commit()
-                logging.info(f"Loaded {len(detections_for_image)} detections for {image_path}")
-            else:
-                logging.info(f"No objects detected in {image_path}. Marking as processed.")
-                cur.execute(insert_query,
-                            (image_path, inferred_message_id, inferred_channel_name, 'NO_DETECTIONS', 0.0, None))
+            _merge_detection_rows(
+                cur,
+                [row for rows in rows_by_image.values() for row in rows],
+                [_processed_entry(path, rows, content_hashes, file_stats) for path, rows in rows_by_image.items()],
+                # Two copies of one new image in a batch share a content hash; cache it once
+                list({row[0]: row for row in cache_rows_by_image.values()}.values())
+            )
+            conn.commit()
+            logging.info(f"Loaded detections for {len(rows_by_image)} images in one transaction.")
+            return list(rows_by_image)
+        except Exception as e:
+            conn.rollback()
+            logging.warning(f"Batch write failed ({e}); retrying {len(rows_by_image)} images individually.")
+
+        written = []
+        for image_path, rows in rows_by_image.items():
+            try:
+                _merge_detection_rows(cur, rows, [_processed_entry(image_path, rows, content_hashes, file_stats)],
+                                      [cache_rows_by_image[image_path]] if image_path in cache_rows_by_image else [])
                 conn.commit()
-                logging.info(f"Marked {image_path} as processed (no detections).")
+                written.append(image_path)
+            except Exception as e:
+                logging.error(f"Error writing detections for image {image_path}: {e}", exc_info=True)
+                conn.rollback()
+        return written
+    finally:
+        cur.close()
+
+
+def export_model(backend=DETECTOR_BACKEND, int8=DETECTOR_INT8, weights=DETECTOR_WEIGHTS, force=False):
+    """
+    Exports the PyTorch weights for `backend` (a one-time step; an existing export is reused
+    unless `force`). Returns the path of the exported model.
+    """
+    target = model_artifact_path(backend, int8, weights)
+    if backend == "torch" or (os.path.exists(target) and not force):
+        return target
+
+    started = time.perf_counter()
+    if backend == "onnx":
+        # Dynamic batch axis so batched inference works; NMS stays in Python as for torch
+        exported = YOLO(weights).export(format="onnx", imgsz=DETECTOR_IMGSZ, dynamic=True)
+        if int8:
+            # Ultralytics has no int8 ONNX export; quantize the weights with onnxruntime instead
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(exported, target, weight_type=QuantType.QUInt8)
+            exported = target
+    else:
+        exported = YOLO(weights).export(format="openvino", imgsz=DETECTOR_IMGSZ, dynamic=True,
+                                        int8=int8, data=DETECTOR_INT8_DATA if int8 else None)
+    if os.path.normpath(exported) != os.path.normpath(target):
+        os.replace(exported, target)
+    logging.info(f"Exported {weights} to {target} in {time.perf_counter() - started:.1f}s.")
+    return target
+
+
+def load_model(backend=DETECTOR_BACKEND, int8=DETECTOR_INT8):
+    """
+    Loads the YOLO model once for `backend`, exporting it first if needed; returns None
+    (after logging why) if it cannot be loaded.
+    """
+    try:
+        model_path = export_model(backend, int8)
+        model = YOLO(model_path, task="detect")
+        logging.info(f"YOLOv8 model loaded from {model_path} ({backend} backend{', int8' if int8 else ''}).")
+        return model
+    except Exception as e:
+        logging.error(f"Failed to load YOLO model: {e}")
+        logging.error(f"Ensure you have an internet connection for initial model download ({DETECTOR_WEIGHTS}).")
+        return None
+
+
+def create_detector_tables(conn):
+    """Ensures every table the detector writes to exists."""
+    create_yolo_raw_table(conn)
+    create_processed_images_table(conn)
+    create_detection_cache_table(conn)
+
+
+def detect_batch(conn, model, batch):
+    """
+    Runs detection for one decoded batch: cached images copy their stored detections, the
+    rest go through the model. Returns a dict with the rows to write per image, the cache
+    rows, the content hashes and file stats, and the inference time and cache hits for the batch.
+    Only reads from the database, so it can run in a shard process.
+    """
+    for item in batch:
+        if "error" in item:
+            logging.error(f"Error processing image {item['image_path']}: {item['error']}")
+    batch = [item for item in batch if "error" not in item]
+    result_set = {"rows_by_image": {}, "cache_rows_by_image": {},
+                  "content_hashes": {item["image_path"]: item["content_hash"] for item in batch},
+                  "file_stats": {item["image_path"]: item["file_stat"] for item in batch},
+                  "inference_seconds": 0.0, "cache_hits": {"exact": 0, "perceptual": 0}}
+    if not batch:
+        return result_set
+    rows_by_image = result_set["rows_by_image"]
+
+    # Reposted images: copy the cached detections instead of running the model again
+    cached = lookup_cached_detections(conn, batch)
+    for item in batch:
+        if item["image_path"] not in cached:
+            continue
+        cache_entry, kind = cached[item["image_path"]]
+        result_set["cache_hits"][kind] += 1
+        inferred_channel_name, inferred_message_id = infer_image_source(item["image_path"])
+        rows_by_image[item["image_path"]] = detection_rows(
+            item["image_path"], inferred_channel_name, inferred_message_id,
+            detections_from_cache(cache_entry, item, inferred_channel_name, inferred_message_id))
+    batch = [item for item in batch if item["image_path"] not in cached]
 
+    results = []
+    if batch:
+        inference_started = time.perf_counter()
+        results = run_batch_inference(model, batch)
+        result_set["inference_seconds"] = time.perf_counter() - inference_started
+
+    for item, result in zip(batch, results):
+        if result is None:
+            continue
+        image_path = item["image_path"]
+        try:
+            inferred_channel_name, inferred_message_id = infer_image_source(image_path)
+            detections_for_image = detections_from_result(result, model, item,
+                                                          inferred_channel_name, inferred_message_id)
+            if not detections_for_image:
+                logging.info(f"No objects detected in {image_path}. Marking as processed.")
+            rows_by_image[image_path] = detection_rows(image_path, inferred_channel_name, inferred_message_id,
+                                                       detections_for_image)
+            if DETECTOR_CACHE:
+                result_set["cache_rows_by_image"][image_path] = cache_entry_row(item, detections_for_image)
         except Exception as e:
             logging.error(f"Error processing image {image_path}: {e}", exc_info=True)
-            conn.rollback()
-    cur.close()
+    return result_set
+
+
+# Per-process state of a detection shard, set up once by _init_shard
+_shard_model = None
+_shard_conn = None
+
+
+def _init_shard(threads):
+    """Shard process initializer: caps intra-op threads, then loads this shard's own model."""
+    global _shard_model, _shard_conn
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    cv2.setNumThreads(1)
+    import torch
+    torch.set_num_threads(threads)
+    _shard_model = load_model()
+    if _shard_model is None:
+        raise RuntimeError("Shard could not load the YOLO model.")
+    # Read-only connection for detection cache lookups; all writes go through the parent
+    _shard_conn = connect_db() if DETECTOR_CACHE else None
+
+
+def _detect_shard_chunk(image_paths):
+    """Runs in a shard process: decodes and detects a chunk of images, returning one result per batch."""
+    decode_workers = max(1, DETECTOR_DECODE_WORKERS // max(DETECTOR_SHARDS, 1))
+    return [detect_batch(_shard_conn, _shard_model, batch)
+            for batch in iter_prefetched_batches(image_paths, workers=decode_workers)]
+
+
+def iter_sharded_batches(image_paths, shards):
+    """
+    Splits `image_paths` into chunks of a few batches and detects them in `shards` worker
+    processes, each with its own model and at most DETECTOR_SHARD_THREADS intra-op threads.
+    Yields detect_batch results as chunks complete; at most 2 * shards chunks are in flight.
+    """
+    image_paths = iter(image_paths)
+    chunk_size = DETECTOR_BATCH_SIZE * 4
+    # spawn, not fork: forking a process that has already started torch/OpenMP threads can deadlock
+    with ProcessPoolExecutor(max_workers=shards, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_shard, initargs=(DETECTOR_SHARD_THREADS,)) as executor:
+        pending = set()
+        while True:
+            for chunk in iter(lambda: list(islice(image_paths, chunk_size)), []):
+                pending.add(executor.submit(_detect_shard_chunk, chunk))
+                if len(pending) >= 2 * shards:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def process_images(conn, model, image_paths, shards=1):
+    """
+    Runs detection on `image_paths` and loads the results to PostgreSQL.
+    Images are decoded and letterboxed by a prefetching thread pool and sent through
+    the model DETECTOR_BATCH_SIZE at a time; images already in the detection cache skip
+    inference. With `shards` > 1, detection runs in that many worker processes (`model`
+    is not used) and this process only writes their results. Throughput and cache hit
+    rate are logged. Returns the set of image paths whose detections were committed.
+    """
+    started = time.perf_counter()
+    inference_seconds = 0.0
+    db_seconds = 0.0
+    written_paths = set()
+    cache_hits = {"exact": 0, "perceptual": 0}
+
+    if shards > 1:
+        logging.info(f"Detecting in {shards} shard processes with {DETECTOR_SHARD_THREADS} threads each.")
+        batch_results = iter_sharded_batches(image_paths, shards)
+    else:
+        batch_results = (detect_batch(conn, model, batch) for batch in iter_prefetched_batches(image_paths))
+
+    for batch_result in batch_results:
+        # Summed across shards, so with shards > 1 this is CPU time rather than wall time
+        inference_seconds += batch_result["inference_seconds"]
+        for kind, hits in batch_result["cache_hits"].items():
+            cache_hits[kind] += hits
+        if not batch_result["content_hashes"]:
+            continue
+
+        db_started = time.perf_counter()
+        written_paths.update(write_detection_batch(conn, batch_result["rows_by_image"],
+                                                   batch_result["content_hashes"],
+                                                   batch_result["cache_rows_by_image"],
+                                                   batch_result["file_stats"]))
+        db_seconds += time.perf_counter() - db_started
+
+    images_done = len(written_paths)
+    elapsed = time.perf_counter() - started
+    logging.info(
+        f"Processed {images_done} images in {elapsed:.1f}s: {images_done / max(elapsed, 1e-6):.2f} images/sec overall, "
+        f"{images_done / max(inference_seconds, 1e-6):.2f} images/sec in inference, "
+        f"{1000 * db_seconds / max(images_done, 1):.1f} ms/image in the database.")
+    if DETECTOR_CACHE:
+        total_hits = cache_hits["exact"] + cache_hits["perceptual"]
+        logging.info(
+            f"Detection cache: {total_hits}/{len(image_paths)} hits "
+            f"({100 * total_hits / max(len(image_paths), 1):.1f}%; {cache_hits['exact']} exact, "
+            f"{cache_hits['perceptual']} perceptual), inference skipped for those images.")
+    return written_paths
+
+
+def find_new_images(conn):
+    """
+    Discovers images not yet in raw.processed_images.
+    Returns (new image paths, watermark read, watermark to store if all of them succeed).
+    """
+    logging.info(f"Current working directory: {os.getcwd()}")  # NEW: Log CWD
+    logging.info(
+        f"Absolute path being searched: {os.path.abspath(RAW_IMAGES_PATH)}")  # NEW: Log absolute path being searched
+
+    watermark = get_watermark(conn)
+    candidate_files = discover_candidate_images(watermark)
+    new_image_files = filter_unprocessed(conn, candidate_files)
+
+    # The watermark can move up to the newest scanned partition, unless an image fails below it
+    scanned_dates = [d for d in map(partition_date, candidate_files) if d is not None]
+    next_watermark = max(scanned_dates) if scanned_dates else watermark
+    return new_image_files, watermark, next_watermark
+
+
+def record_failed_images(conn, image_paths, error="detection failed"):
+    """
+    Records a failed attempt for each image in raw.processed_images (images already processed
+    successfully are left alone, unless the file has been replaced since; a replaced file
+    starts counting its attempts again). Returns the paths that have now used up
+    DETECTOR_MAX_ATTEMPTS.
+    """
+    if not image_paths:
+        return set()
+    cur = conn.cursor()
+    try:
+        exhausted = execute_values(cur, """
+            INSERT INTO raw.processed_images (image_path, failed, attempts, last_error, file_size, file_mtime_ns)
+            VALUES %s
+            ON CONFLICT (image_path) DO UPDATE
+            SET attempts = CASE
+                    WHEN raw.processed_images.failed
+                         AND (raw.processed_images.file_size, raw.processed_images.file_mtime_ns)
+                             IS NOT DISTINCT FROM (EXCLUDED.file_size, EXCLUDED.file_mtime_ns)
+                    THEN raw.processed_images.attempts + 1
+                    ELSE 1
+                END,
+                failed = TRUE,
+                file_size = EXCLUDED.file_size,
+                file_mtime_ns = EXCLUDED.file_mtime_ns,
+                last_error = EXCLUDED.last_error,
+                processed_at = CURRENT_TIMESTAMP
+            WHERE raw.processed_images.failed
+               OR (raw.processed_images.file_size, raw.processed_images.file_mtime_ns)
+                  IS DISTINCT FROM (EXCLUDED.file_size, EXCLUDED.file_mtime_ns)
+            RETURNING image_path, attempts;
+        """, [(path, True, 1, error, *(file_stat(path) or (None, None))) for path in image_paths],
+            page_size=1000, fetch=True)
+        conn.commit()
+    except psycopg2.Error as e:
+        logging.error(f"Error recording failed images: {e}")
+        conn.rollback()
+        return set()
+    finally:
+        cur.close()
+    exhausted = {path for path, attempts in exhausted if attempts >= DETECTOR_MAX_ATTEMPTS}
+    for path in sorted(exhausted):
+        logging.warning(f"Giving up on {path} after {DETECTOR_MAX_ATTEMPTS} failed attempts.")
+    return exhausted
+
+
+def advance_watermark(conn, watermark, next_watermark, failed_paths=()):
+    """
+    Records the failed images and stores the new watermark, held back to the oldest partition
+    that still has images with retries left. Images that used up their attempts no longer
+    hold it back, so one corrupt file cannot pin discovery to its partition forever.
+    """
+    exhausted = record_failed_images(conn, failed_paths)
+    failed_dates = [d for d in map(partition_date, set(failed_paths) - exhausted) if d is not None]
+    if failed_dates and next_watermark:
+        # Keep failed partitions in the scan window so their images are retried next run
+        next_watermark = min(next_watermark, min(failed_dates))
+    if next_watermark and next_watermark != watermark:
+        set_watermark(conn, next_watermark)
+
+
+def detect_objects_and_load(conn):
+    """
+    Scans for new images, runs YOLO detection, and loads results to PostgreSQL.
+    """
+    if DETECTOR_SHARDS > 1:
+        # Each shard loads its own model; export once here so shards do not race to do it
+        model = None
+        try:
+            export_model()
+        except Exception as e:
+            logging.error(f"Failed to export YOLO model: {e}")
+            return
+    else:
+        model = load_model()
+        if model is None:
+            return
+
+    new_image_files, watermark, next_watermark = find_new_images(conn)
+
+    if not new_image_files:
+        logging.info("No new images found for object detection based on previous processing records.")
+        advance_watermark(conn, watermark, next_watermark)
+        return
+
+    logging.info(f"Processing {len(new_image_files)} new images in batches of {DETECTOR_BATCH_SIZE}.")
+    written_paths = process_images(conn, model, new_image_files, shards=DETECTOR_SHARDS)
+    advance_watermark(conn, watermark, next_watermark, set(new_image_files) - written_paths)
 
 
 if __name__ == "__main__":
+    if "--export" in sys.argv[1:]:
+        # One-time export of the configured backend, e.g. at image build time
+        export_model(force="--force" in sys.argv[1:])
+        sys.exit(0)
+
     # --- Run the detection process ---
     conn_yolo = None
     try:
         conn_yolo = connect_db()
-        create_yolo_raw_table(conn_yolo)
+        create_detector_tables(conn_yolo)
         detect_objects_and_load(conn_yolo)
     except Exception as e:
         logging.critical(f"YOLO processing failed: {e}", exc_info=True)
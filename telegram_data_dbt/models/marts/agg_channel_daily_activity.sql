@@ -0,0 +1,93 @@
+-- models/marts/agg_channel_daily_activity.sql
+-- Daily posting activity per channel, used by the channel activity endpoints.
+-- Incremental runs only recompute the (channel, day) partitions with new messages or detections:
+-- the changed pairs are collected from the new rows (loaded_at / processed_at indexes), then each
+-- day is re-read through a range on the (channel_id, message_timestamp) indexes.
+{{ config(
+    materialized='incremental',
+    unique_key=['channel_id', 'date_day'],
+    incremental_strategy='delete+insert',
+    post_hook=[
+        "CREATE UNIQUE INDEX IF NOT EXISTS agg_channel_daily_activity_key_idx ON {{ this }} (channel_id, date_day)"
+    ]
+) }}
+
+{% if is_incremental() %}
+WITH changed_days AS (
+    SELECT channel_id, CAST(message_timestamp AS DATE) AS date_day
+    FROM {{ ref('fct_messages') }}
+    WHERE loaded_at > (SELECT COALESCE(MAX(max_loaded_at), '-infinity') FROM {{ this }})
+      AND channel_id IS NOT NULL AND message_timestamp IS NOT NULL
+    UNION
+    SELECT channel_id, CAST(message_timestamp AS DATE) AS date_day
+    FROM {{ ref('fct_image_detections') }}
+    WHERE processed_at > (SELECT COALESCE(MAX(max_processed_at), '-infinity') FROM {{ this }})
+      AND channel_id IS NOT NULL AND message_timestamp IS NOT NULL
+),
+{% else %}
+WITH
+{% endif %}
+messages AS (
+    -- A message scraped on several days appears once per raw file in blob mode; count it once.
+    -- Messages without a timestamp have no posting day to count them under.
+    SELECT DISTINCT ON (fm.channel_id, fm.message_id)
+        fm.channel_id,
+        fm.message_id,
+        CAST(fm.message_timestamp AS DATE) AS date_day,
+        fm.views_count,
+        fm.has_media,
+        fm.loaded_at
+    FROM {{ ref('fct_messages') }} AS fm
+    {% if is_incremental() %}
+    JOIN changed_days AS changed
+        ON fm.channel_id = changed.channel_id
+        AND fm.message_timestamp >= changed.date_day
+        AND fm.message_timestamp < changed.date_day + 1
+    {% endif %}
+    WHERE fm.channel_id IS NOT NULL AND fm.message_timestamp IS NOT NULL
+    ORDER BY fm.channel_id, fm.message_id, fm.loaded_at DESC
+),
+message_stats AS (
+    SELECT
+        channel_id,
+        date_day,
+        COUNT(*) AS message_count,
+        COALESCE(SUM(views_count), 0) AS views_sum,
+        COUNT(*) FILTER (WHERE has_media) AS media_count,
+        MAX(loaded_at) AS max_loaded_at
+    FROM messages
+    GROUP BY 1, 2
+),
+detection_stats AS (
+    SELECT
+        d.channel_id,
+        CAST(d.message_timestamp AS DATE) AS date_day,
+        COUNT(*) FILTER (WHERE d.detected_class <> 'NO_DETECTIONS') AS detection_count,
+        MAX(d.processed_at) AS max_processed_at
+    FROM {{ ref('fct_image_detections') }} AS d
+    {% if is_incremental() %}
+    JOIN changed_days AS changed
+        ON d.channel_id = changed.channel_id
+        AND d.message_timestamp >= changed.date_day
+        AND d.message_timestamp < changed.date_day + 1
+    {% endif %}
+    WHERE d.channel_id IS NOT NULL AND d.message_timestamp IS NOT NULL
+    GROUP BY 1, 2
+),
+final AS (
+    SELECT
+        COALESCE(m.channel_id, d.channel_id) AS channel_id,
+        COALESCE(m.date_day, d.date_day) AS date_day,
+        COALESCE(m.message_count, 0) AS message_count,
+        COALESCE(m.views_sum, 0) AS views_sum,
+        COALESCE(m.media_count, 0) AS media_count,
+        COALESCE(d.detection_count, 0) AS detection_count,
+        m.max_loaded_at,
+        d.max_processed_at
+    FROM message_stats m
+    FULL OUTER JOIN detection_stats d
+        ON m.channel_id = d.channel_id
+        AND m.date_day = d.date_day
+)
+
+SELECT * FROM final
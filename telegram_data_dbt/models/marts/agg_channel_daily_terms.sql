@@ -0,0 +1,71 @@
+-- models/marts/agg_channel_daily_terms.sql
+-- Term counts per channel and posting day, used by /api/reports/top-products.
+-- Incremental runs recount only the (channel, day) partitions that received new messages, and
+-- delete+insert on (channel_id, message_date) replaces each of those partitions as a whole.
+{{ config(
+    materialized='incremental',
+    unique_key=['channel_id', 'message_date'],
+    incremental_strategy='delete+insert',
+    post_hook=[
+        "CREATE UNIQUE INDEX IF NOT EXISTS agg_channel_daily_terms_key_idx ON {{ this }} (channel_id, message_date, term)",
+        "CREATE INDEX IF NOT EXISTS agg_channel_daily_terms_date_idx ON {{ this }} (message_date)"
+    ]
+) }}
+
+{% if is_incremental() %}
+WITH changed_partitions AS (
+    SELECT DISTINCT
+        channel_id,
+        CAST(message_timestamp AS DATE) AS message_date
+    FROM {{ ref('fct_messages') }}
+    WHERE loaded_at > (SELECT MAX(max_loaded_at) FROM {{ this }})
+      AND message_timestamp IS NOT NULL
+),
+{% else %}
+WITH
+{% endif %}
+messages AS (
+    -- A message scraped on several days appears once per raw file; count the latest copy once
+    SELECT DISTINCT ON (fm.channel_id, fm.message_id)
+        fm.channel_id,
+        CAST(fm.message_timestamp AS DATE) AS message_date,
+        fm.message_text,
+        fm.loaded_at
+    FROM {{ ref('fct_messages') }} AS fm
+    {% if is_incremental() %}
+    -- Recount whole partitions (range on the channel/timestamp index) so their counts stay complete
+    JOIN changed_partitions AS changed
+        ON fm.channel_id = changed.channel_id
+        AND fm.message_timestamp >= changed.message_date
+        AND fm.message_timestamp < changed.message_date + 1
+    {% endif %}
+    -- Messages without a timestamp have no posting day to count them under
+    WHERE fm.message_timestamp IS NOT NULL
+    ORDER BY fm.channel_id, fm.message_id, fm.loaded_at DESC
+),
+terms AS (
+    SELECT
+        channel_id,
+        message_date,
+        BTRIM(word, '.,:;!?()[]{}"''') AS term,
+        loaded_at
+    FROM messages,
+        LATERAL REGEXP_SPLIT_TO_TABLE(LOWER(message_text), '\s+') AS word
+    WHERE message_text IS NOT NULL AND message_text != ''
+),
+final AS (
+    SELECT
+        terms.channel_id,
+        terms.message_date,
+        terms.term,
+        COUNT(*) AS mention_count,
+        MAX(terms.loaded_at) AS max_loaded_at
+    FROM terms
+    LEFT JOIN {{ ref('stop_words') }} AS stop_words
+        ON terms.term = stop_words.word
+    WHERE stop_words.word IS NULL
+      AND LENGTH(terms.term) > 2
+    GROUP BY 1, 2, 3
+)
+
+SELECT * FROM final
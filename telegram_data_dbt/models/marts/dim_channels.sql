@@ -1,6 +1,10 @@
+-- Exact channel-name lookups from the API resolve to a channel_id through the channel_name index
 {{ config(  
     materialized='table', 
-    unique_key='channel_id'
+    unique_key='channel_id',
+    post_hook=[
+        "CREATE UNIQUE INDEX IF NOT EXISTS dim_channels_channel_name_idx ON {{ this }} (channel_name)"
+    ]
 ) }}
 
 WITH stg_channels AS (
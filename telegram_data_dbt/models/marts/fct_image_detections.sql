@@ -1,7 +1,17 @@
+-- Indexes serve the filters of the /api/detections endpoints; pages run newest first on raw_detection_id.
+-- The processed_at index finds the detections new since the last run for agg_channel_daily_activity.
 {{ config(
     materialized='incremental',
-    unique_key=['image_path', 'detected_class', 'message_id'],
-    on_schema_change='append_new_columns'
+    unique_key='raw_detection_id',
+    on_schema_change='append_new_columns',
+    post_hook=[
+        "CREATE UNIQUE INDEX IF NOT EXISTS fct_image_detections_id_idx ON {{ this }} (raw_detection_id)",
+        "CREATE INDEX IF NOT EXISTS fct_image_detections_class_id_idx ON {{ this }} (detected_class, raw_detection_id)",
+        "CREATE INDEX IF NOT EXISTS fct_image_detections_class_confidence_idx ON {{ this }} (detected_class, confidence_score)",
+        "CREATE INDEX IF NOT EXISTS fct_image_detections_channel_timestamp_idx ON {{ this }} (channel_id, message_timestamp)",
+        "CREATE INDEX IF NOT EXISTS fct_image_detections_timestamp_idx ON {{ this }} (message_timestamp)",
+        "CREATE INDEX IF NOT EXISTS fct_image_detections_processed_at_idx ON {{ this }} (processed_at)"
+    ]
 ) }}
 
 WITH raw_detections AS (
@@ -10,6 +20,8 @@ WITH raw_detections AS (
         image_path,
         message_id,
         channel_name,
+        -- Same key as dim_channels, so detections keep their channel even without a matching message
+        {{ dbt_utils.generate_surrogate_key(['channel_name']) }} AS channel_id,
         detected_class,
         confidence_score,
         detection_bbox,
@@ -20,9 +32,11 @@ WITH raw_detections AS (
       WHERE processed_at > (SELECT MAX(processed_at) FROM {{ this }})
     {% endif %}
 ),
--- Optional: Join with fct_messages to pull in more context or validate linkage
+-- Join with fct_messages to pull in more context or validate linkage
 joined_detections AS (
-    SELECT
+    -- Telegram message ids are only unique within a channel, and a message scraped on several
+    -- days appears once per raw file: keep one (the latest loaded) message per detection
+    SELECT DISTINCT ON (rd.raw_detection_id)
         rd.raw_detection_id,
         rd.image_path,
         rd.detected_class,
@@ -31,16 +45,13 @@ joined_detections AS (
         rd.processed_at,
         fm.message_surrogate_key, -- Link to the fact_messages table
         fm.message_id AS telegram_message_id, -- Original telegram message ID
-        fm.channel_id,            -- Link to dim_channels
+        rd.channel_id,            -- Link to dim_channels
         fm.message_timestamp,
         fm.message_text
     FROM raw_detections rd
     LEFT JOIN {{ ref('fct_messages') }} fm
         ON rd.message_id = fm.message_id
-        -- AND rd.channel_name = fm.channel_name -- Add this if channel_name is reliable in both to prevent false joins
-        -- NOTE: The linkage on message_id might be tricky if message_id isn't globally unique.
-        -- If telegram's message_id is only unique within a channel, you'll need (message_id, channel_id) for the join.
-        -- For now, relying on message_id from the image path for simplicity.
-        -- Better: Store telegram's photo_file_id with the image path to join directly to fct_messages
+        AND rd.channel_id = fm.channel_id
+    ORDER BY rd.raw_detection_id, fm.loaded_at DESC NULLS LAST
 )
-SELECT * FROM joined_detections
\ No newline at end of file
+SELECT * FROM joined_detections
@@ -1,7 +1,23 @@
+-- Search indexes for /api/search/messages. message_tsv is a generated column, so Postgres keeps it
+-- in sync on every incremental insert; 'simple' (no stemming) suits Amharic and mixed-script text.
+-- The trigram index serves substring (ILIKE '%term%') matches that word-level search misses.
+-- The (channel_id, message_timestamp) index serves the channel/date filters of /api/export/messages.
+-- The (channel_id, message_id) index serves the per-message lookups of fct_product_mentions.
+-- The loaded_at index finds the rows new since the last run for the incremental marts built on this one.
 {{ config(
     materialized='incremental',
     unique_key='message_surrogate_key',
-    on_schema_change='append_new_columns'
+    on_schema_change='append_new_columns',
+    post_hook=[
+        "ALTER TABLE {{ this }} ADD COLUMN IF NOT EXISTS message_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', COALESCE(message_text, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS fct_messages_message_tsv_idx ON {{ this }} USING GIN (message_tsv)",
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS fct_messages_message_text_trgm_idx ON {{ this }} USING GIN (message_text gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS fct_messages_channel_timestamp_idx ON {{ this }} (channel_id, message_timestamp)",
+        "CREATE INDEX IF NOT EXISTS fct_messages_channel_message_idx ON {{ this }} (channel_id, message_id)",
+        "CREATE INDEX IF NOT EXISTS fct_messages_loaded_at_idx ON {{ this }} (loaded_at)"
+    ]
 ) }}
 
 WITH stg_messages AS (
@@ -30,7 +46,13 @@ final AS (
         stg_messages.has_media,
         stg_messages.photo_file_id,
         LENGTH(stg_messages.message_text) AS message_length,
-        CASE WHEN stg_messages.message_text ILIKE '%product%' OR stg_messages.message_text ILIKE '%drug%' THEN TRUE ELSE FALSE END AS mentions_product_or_drug,
+        -- Dictionary matches are extracted once at load time (raw.product_mentions), so this is a key lookup
+        EXISTS (
+            SELECT 1
+            FROM {{ source('raw', 'product_mentions') }} AS pm
+            WHERE pm.channel_name = stg_messages.channel_name
+              AND pm.message_id = stg_messages.message_id
+        ) AS mentions_product_or_drug,
         stg_messages.loaded_at -- Timestamp when this raw message was loaded into the raw layer
     FROM stg_messages
     LEFT JOIN dim_channels AS channels
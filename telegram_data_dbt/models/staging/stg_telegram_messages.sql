@@ -5,6 +5,16 @@
 ) }}
 
 WITH raw_messages_extracted AS (
+{% if var('raw_message_layout', 'rows') == 'rows' %}
+    -- One row per message already (scripts/load_json.py with LOAD_MODE=rows)
+    SELECT
+        id AS raw_message_id,
+        channel_name,
+        message_date,
+        message_json AS message_data,
+        loaded_at
+    FROM {{ source('raw', 'telegram_message_rows') }}
+{% else %}
     SELECT
         id AS raw_message_id,
         channel_name,
@@ -16,6 +26,7 @@ WITH raw_messages_extracted AS (
         jsonb_array_elements(message_json) AS message_data,
         loaded_at
     FROM {{ source('raw', 'telegram_messages') }}
+{% endif %}
 ),
 final AS (
     SELECT
@@ -23,7 +34,8 @@ final AS (
         channel_name,
         message_date,
         (message_data ->> 'id')::BIGINT AS message_id,          -- Unique ID of the message within the channel
-        (message_data ->> 'text')::TEXT AS message_text,       -- The message content
+        -- The message content; the scraper writes it under "message", older dumps under "text"
+        COALESCE(message_data ->> 'message', message_data ->> 'text')::TEXT AS message_text,
         (message_data ->> 'date')::TIMESTAMP AS message_timestamp, -- The actual timestamp of the message
         (message_data ->> 'views')::BIGINT AS views_count,       -- Number of views
         (message_data ->> 'has_media')::BOOLEAN AS has_media,   -- Does the message contain media?
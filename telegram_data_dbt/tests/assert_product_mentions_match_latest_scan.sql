@@ -0,0 +1,15 @@
+-- tests/assert_product_mentions_match_latest_scan.sql
+-- Every mention in fct_product_mentions must still be in raw.product_mentions, the result of the
+-- message's latest scan. Returns the stale rows, e.g. of a message rescanned to zero mentions.
+SELECT
+    fpm.channel_id,
+    fpm.message_id,
+    fpm.product_id
+FROM {{ ref('fct_product_mentions') }} AS fpm
+JOIN {{ ref('dim_channels') }} AS channels
+    ON fpm.channel_id = channels.channel_id
+LEFT JOIN {{ source('raw', 'product_mentions') }} AS pm
+    ON pm.channel_name = channels.channel_name
+    AND pm.message_id = fpm.message_id
+    AND pm.product_id = fpm.product_id
+WHERE pm.product_id IS NULL
@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# The pipeline scripts import each other as top-level modules (they run from scripts/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
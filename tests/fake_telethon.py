@@ -0,0 +1,61 @@
+# tests/fake_telethon.py
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from telethon.tl.types import MessageMediaPhoto
+
+PHOTO_BYTES = b"\xff\xd8\xff\xe0 fake jpeg \xff\xd9"
+
+
+class FakeFloodWaitError(Exception):
+    """Stands in for telethon.errors.FloodWaitError; throttle_delay matches it by class name."""
+
+    def __init__(self, seconds: float = 0):
+        super().__init__(f"A wait of {seconds} seconds is required")
+        self.seconds = seconds
+
+
+def fake_message(message_id: int, text: str = "", photo_id: int = None):
+    """A message with the attributes scrape_channel reads; pass `photo_id` for a photo message."""
+    photo = None
+    if photo_id is not None:
+        photo = SimpleNamespace(id=photo_id, sizes=[SimpleNamespace(size=len(PHOTO_BYTES))])
+    return SimpleNamespace(id=message_id, date=datetime.now(timezone.utc), message=text, sender_id=None,
+                           media=MessageMediaPhoto(photo=photo) if photo else None, photo=photo)
+
+
+class FakeTelegramClient:
+    """
+    Minimal async stand-in for a connected TelegramClient.
+
+    `messages` maps a channel URL to its messages, given as ids (text messages) or
+    fake_message() objects. `failures` maps a URL to a list of exceptions: each
+    iter_messages() call on that URL raises the next one before yielding anything,
+    until the list is used up. Every call is recorded in `calls`, and every photo
+    written by download_media() in `downloads`.
+    """
+
+    def __init__(self, messages: dict = None, failures: dict = None):
+        self.messages = {
+            url: [fake_message(m) if isinstance(m, int) else m for m in msgs]
+            for url, msgs in (messages or {}).items()
+        }
+        self.failures = {url: list(errors) for url, errors in (failures or {}).items()}
+        self.calls = []
+        self.downloads = []
+
+    async def iter_messages(self, url, limit=None, min_id=None, max_id=None, reverse=False):
+        self.calls.append(url)
+        pending = self.failures.get(url)
+        if pending:
+            raise pending.pop(0)
+        msgs = sorted(self.messages.get(url, []), key=lambda m: m.id, reverse=not reverse)
+        msgs = [m for m in msgs if (not min_id or m.id > min_id) and (not max_id or m.id < max_id)]
+        for msg in msgs[:limit]:
+            yield msg
+
+    async def download_media(self, msg, file=None):
+        with open(file, "wb") as f:
+            f.write(PHOTO_BYTES)
+        self.downloads.append(msg.id)
+        return file
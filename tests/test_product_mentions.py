@@ -0,0 +1,43 @@
+# tests/test_product_mentions.py
+
+import load_json
+from load_json import extract_product_mentions, write_product_mentions
+
+
+class RecordingCursor:
+    """Records the statements write_product_mentions sends, with their parameters or rows."""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append((" ".join(query.split()), params))
+
+
+def record_writes(monkeypatch, messages):
+    cur = RecordingCursor()
+    monkeypatch.setattr(load_json, "execute_values",
+                        lambda cur, query, rows, page_size=None: cur.execute(query, list(rows)))
+    write_product_mentions(cur, *extract_product_mentions(messages))
+    return cur.statements
+
+
+def statement(statements, prefix):
+    return [params for query, params in statements if query.startswith(prefix)]
+
+
+def test_scan_replaces_mentions_of_scanned_messages(monkeypatch):
+    statements = record_writes(monkeypatch, [("CheMeds", 1, "Panadol 500mg and panadol syrup")])
+
+    assert statement(statements, "INSERT INTO raw.product_mention_scans") == [[("CheMeds", 1)]]
+    assert statement(statements, "DELETE FROM raw.product_mentions") == [(["CheMeds"], [1])]
+    assert statement(statements, "INSERT INTO raw.product_mentions") == [[("CheMeds", 1, 1, 2)]]
+
+
+def test_message_rescanned_to_zero_mentions_is_still_recorded(monkeypatch):
+    # Edited to drop the product: its old mentions go, and the scan is recorded so the mart drops them too
+    statements = record_writes(monkeypatch, [("CheMeds", 1, "Out of stock, sorry")])
+
+    assert statement(statements, "INSERT INTO raw.product_mention_scans") == [[("CheMeds", 1)]]
+    assert statement(statements, "DELETE FROM raw.product_mentions") == [(["CheMeds"], [1])]
+    assert statement(statements, "INSERT INTO raw.product_mentions") == []
@@ -0,0 +1,69 @@
+# tests/test_raw_io.py
+
+import pytest
+from raw_io import NdjsonMessageWriter, iter_raw_messages
+
+MESSAGES = [{"id": i, "message": f"ፓራሲታሞል 500mg, message {i}"} for i in range(10)]
+
+
+def write_interrupted(path, compression):
+    """Writes MESSAGES the way a scraper killed before close() leaves them: synced, stream unfinished."""
+    writer = NdjsonMessageWriter(path, compression=compression, sync_every=1)
+    for message in MESSAGES:
+        writer.write(message)
+    writer._raw.close()
+
+
+def zero_tail(path, length=16):
+    data = path.read_bytes()
+    path.write_bytes(data[:-length] + b"\0" * length)
+
+
+def truncate_tail(path, length=16):
+    path.write_bytes(path.read_bytes()[:-length])
+
+
+def assert_prefix_survives(path, compression):
+    survivors = list(iter_raw_messages(path))
+    assert len(survivors) >= len(MESSAGES) - 2
+    assert survivors == MESSAGES[:len(survivors)]
+
+    # Reopening repairs the file from those messages and appends after them
+    with NdjsonMessageWriter(path, compression=compression) as writer:
+        writer.write({"id": 99})
+    assert list(iter_raw_messages(path)) == survivors + [{"id": 99}]
+
+
+@pytest.mark.parametrize("damage", [zero_tail, truncate_tail])
+def test_gzip_damaged_tail_keeps_earlier_messages(tmp_path, damage):
+    path = tmp_path / "channel.ndjson.gz"
+    write_interrupted(path, "gzip")
+    damage(path)
+    assert_prefix_survives(path, "gzip")
+
+
+@pytest.mark.parametrize("damage", [zero_tail, truncate_tail])
+def test_zstd_damaged_tail_keeps_earlier_messages(tmp_path, damage):
+    pytest.importorskip("zstandard")
+    path = tmp_path / "channel.ndjson.zst"
+    write_interrupted(path, "zstd")
+    damage(path)
+    assert_prefix_survives(path, "zstd")
+
+
+def test_zstd_corrupt_frame_after_clean_run(tmp_path):
+    pytest.importorskip("zstandard")
+    path = tmp_path / "channel.ndjson.zst"
+    with NdjsonMessageWriter(path, compression="zstd", sync_every=1) as writer:
+        for message in MESSAGES[:5]:
+            writer.write(message)
+    interrupted = NdjsonMessageWriter(path, compression="zstd", sync_every=1)
+    for message in MESSAGES[5:]:
+        interrupted.write(message)
+    interrupted._raw.close()
+    zero_tail(path, 8)
+
+    # The first run's frame is intact, and the second frame keeps every block before the damage
+    survivors = list(iter_raw_messages(path))
+    assert len(survivors) >= len(MESSAGES) - 1
+    assert survivors == MESSAGES[:len(survivors)]
@@ -0,0 +1,154 @@
+# tests/test_scrape_scheduler.py
+
+import asyncio
+import json
+from datetime import datetime
+import pytest
+import scrape_scheduler
+import scrape_telegram
+from scrape_scheduler import TokenBucket, throttle_delay
+from scrape_state import CursorStore, MediaIndex
+from fake_telethon import PHOTO_BYTES, FakeFloodWaitError, FakeTelegramClient, fake_message
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def raw_dirs(tmp_path, monkeypatch):
+    """Points the scraper's output folders at tmp_path."""
+    monkeypatch.setattr(scrape_telegram, "RAW_MESSAGES_DIR", tmp_path / "telegram_messages")
+    monkeypatch.setattr(scrape_telegram, "RAW_MEDIA_DIR", tmp_path / "telegram_media")
+    return tmp_path
+
+
+def run_scraper(client, channels, state_dir, **kwargs):
+    """Runs the real scrape_channel for every channel through the scraper's ChannelScheduler."""
+    bucket = kwargs.pop("bucket", None) or TokenBucket(1000.0, max_rate=1000.0)
+    cursor_store = CursorStore(state_dir / "scrape_cursors.json")
+    media_index = MediaIndex(state_dir / "media_index.json")
+    results = asyncio.run(
+        scrape_telegram.scrape_channels(client, channels, bucket, cursor_store, media_index, **kwargs)
+    )
+    return results, bucket
+
+
+def written_ids(raw_dir, channel_name):
+    today = datetime.now().strftime("%Y-%m-%d")
+    with open(raw_dir / "telegram_messages" / today / f"{channel_name}.json", encoding="utf-8") as f:
+        return sorted(m["id"] for m in json.load(f))
+
+
+def test_throttle_delay_recognises_flood_waits_only():
+    assert throttle_delay(FakeFloodWaitError(7)) == 7.0
+    assert throttle_delay(FakeFloodWaitError()) == 0.0
+    assert throttle_delay(ValueError("boom")) is None
+
+
+def test_token_bucket_waits_for_tokens(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scrape_scheduler.asyncio, "sleep", clock.sleep)
+    bucket = TokenBucket(2.0, capacity=2.0, clock=clock)
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    asyncio.run(take(3))
+    # Two tokens were in the bucket; the third needs half a second of refill at 2/s
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_token_bucket_pauses_and_backs_off_on_throttle(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scrape_scheduler.asyncio, "sleep", clock.sleep)
+    bucket = TokenBucket(4.0, max_rate=4.0, increase=1.0, clock=clock)
+
+    bucket.on_throttled(10)
+    assert bucket.rate == 2.0
+    asyncio.run(bucket.acquire())
+    assert clock.now >= 10
+
+    bucket.on_success()
+    bucket.on_success()
+    bucket.on_success()
+    assert bucket.rate == 4.0  # additive increase, capped at max_rate
+
+
+def test_throttled_channel_is_requeued_until_it_succeeds(raw_dirs):
+    client = FakeTelegramClient(
+        messages={"url_a": [1, 2, 3], "url_b": [10]},
+        failures={"url_a": [FakeFloodWaitError(0.01), FakeFloodWaitError(0.01)]},
+    )
+    results, bucket = run_scraper(client, {"a": "url_a", "b": "url_b"}, raw_dirs, max_attempts=5)
+
+    assert results["a"][0] == 3
+    assert results["b"][0] == 1
+    assert client.calls.count("url_a") == 3
+    assert written_ids(raw_dirs, "a") == [1, 2, 3]
+    assert CursorStore(raw_dirs / "scrape_cursors.json").get("a") == 3
+    assert bucket.rate < 1000.0  # halved twice, only partly recovered by the successes
+
+
+def test_channel_is_given_up_after_max_attempts(raw_dirs):
+    client = FakeTelegramClient(
+        messages={"url_a": [1], "url_b": [2]},
+        failures={"url_a": [FakeFloodWaitError(0.01)] * 10},
+    )
+    results, _ = run_scraper(client, {"a": "url_a", "b": "url_b"}, raw_dirs, max_attempts=3)
+
+    assert results["a"][0] is None
+    assert client.calls.count("url_a") == 3
+    assert results["b"][0] == 1
+
+
+def test_other_errors_fail_the_channel_without_retry(raw_dirs):
+    client = FakeTelegramClient(messages={"url_b": [2]}, failures={"url_a": [ValueError("channel is private")]})
+    results, _ = run_scraper(client, {"a": "url_a", "b": "url_b"}, raw_dirs)
+
+    assert results["a"][0] is None
+    assert client.calls.count("url_a") == 1
+    assert results["b"][0] == 1
+
+
+def test_fastest_changing_channels_go_first(raw_dirs):
+    rates = {"a": 1.0, "b": 50.0, "c": 5.0}
+    cursors = {name: {"last_message_id": 0, "messages_per_hour": rate} for name, rate in rates.items()}
+    (raw_dirs / "scrape_cursors.json").write_text(json.dumps(cursors), encoding="utf-8")
+    client = FakeTelegramClient(messages={"url_a": [1], "url_b": [2], "url_c": [3]})
+    # One worker scrapes the channels one after the other, in change-rate order
+    run_scraper(client, {"a": "url_a", "b": "url_b", "c": "url_c"}, raw_dirs, max_concurrency=1)
+
+    assert client.calls == ["url_b", "url_c", "url_a"]
+
+
+def test_photos_are_downloaded_and_recorded(raw_dirs):
+    client = FakeTelegramClient(messages={"url_a": [1, fake_message(2, photo_id=20), fake_message(3, photo_id=30)]})
+    results, _ = run_scraper(client, {"a": "url_a"}, raw_dirs)
+
+    assert results["a"][0] == 3
+    assert sorted(client.downloads) == [2, 3]
+    today = datetime.now().strftime("%Y-%m-%d")
+    with open(raw_dirs / "telegram_messages" / today / "a.json", encoding="utf-8") as f:
+        records = {m["id"]: m for m in json.load(f)}
+    assert records[1]["file"] is None
+    for message_id in (2, 3):
+        photo_path = raw_dirs / "telegram_media" / today / "a" / f"a_{message_id}.jpg"
+        assert records[message_id]["media_type"] == "MessageMediaPhoto"
+        assert records[message_id]["file"] == str(photo_path)
+        assert photo_path.read_bytes() == PHOTO_BYTES
+
+    # Known photos are not fetched again, even when a later message reposts one
+    client.messages["url_a"].append(fake_message(4, photo_id=20))
+    run_scraper(client, {"a": "url_a"}, raw_dirs)
+    assert sorted(client.downloads) == [2, 3]